@@ -0,0 +1,360 @@
+"""
+JSON API used by the lazily-loaded shop grid.
+
+GET /api/products
+    sort      id | price | discount | name   (default: id, i.e. catalog order)
+    order     asc | desc                     (default: asc)
+    limit     page size, capped at API_MAX_PAGE_SIZE
+    cursor    opaque token from the previous page's next_cursor
+    q         case-insensitive substring match on the product name
+    min_price, max_price, min_discount
+    price, discount, category   facet filters, as on /shop (see facets.py)
+
+GET /api/facets
+    price, discount, category   the current filters
+    Returns how many products match them, and for every facet value how
+    many would match with it chosen.
+
+GET /api/search
+    q         words to match in product names and descriptions; the last
+              word also matches as a prefix (type-ahead)
+    limit     number of results, capped at SEARCH_MAX_RESULTS
+    Returns the best-ranked products plus completions for the last word.
+
+POST /api/cart/lines
+    {"lines": [{"id": 3, "quantity": 2}, ...]} with an optional
+    Idempotency-Key header (or "idempotency_key" field). Adds every line in
+    one request; a retry with the same key replays the first response
+    instead of adding the items again. Stock is reserved for every line
+    first; if any product is short, nothing is added (400).
+
+Product responses are streamed item by item, so even a large page is never built
+up in memory as one JSON document.
+"""
+import base64
+import json
+import math
+
+from flask import Blueprint, Response, current_app, g, jsonify, request, stream_with_context, url_for
+
+import cart_store
+import facets
+import inventory
+import search
+from cart_store import CLAIMED, IN_PROGRESS, get_cart, premade_line_key, save_cart
+from catalog import SORT_KEYS, Catalog
+from images import srcset
+
+api_bp = Blueprint('api', __name__, url_prefix='/api')
+
+
+# --- Cursor encoding ---
+def encode_cursor(sort, descending, product):
+    payload = [sort, int(descending), Catalog.sort_value(product, sort), product.id]
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, sort, descending):
+    """Returns the (sort value, id) to resume after. Raises ValueError if the token is bad."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        cursor_sort, cursor_desc, value, product_id = json.loads(raw)
+    except Exception:
+        raise ValueError('Malformed cursor')
+    if cursor_sort != sort or bool(cursor_desc) != descending:
+        raise ValueError('Cursor does not match the requested sort order')
+    # Checked here, not when the resumed page compares them: by then its 200 is already streaming.
+    value_types = str if sort == 'name' else int if sort == 'id' else (int, float)
+    if isinstance(value, bool) or not isinstance(value, value_types):
+        raise ValueError('Malformed cursor')
+    if isinstance(product_id, bool) or not isinstance(product_id, int):
+        raise ValueError('Malformed cursor')
+    return (value, product_id)
+
+
+# --- Serialization ---
+def image_url(product):
+    """Absolute or static URL for the product image, or None for the placeholder."""
+    if product.image == 'default.jpg':
+        return None
+    if product.image.startswith('http'):
+        return product.image
+    return url_for('static', filename='img/' + product.image)
+
+
+def media_to_json(media):
+    """srcset strings and dimensions for a resized image, or None."""
+    if media is None:
+        return None
+    return {
+        'width': media.width,
+        'height': media.height,
+        'src': url_for('static', filename=media.jpeg[-1][1]),
+        'srcset': srcset(media.jpeg),
+        'webp_srcset': srcset(media.webp),
+    }
+
+
+def product_to_json(product):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'price': product.price,
+        'original_price': product.original_price,
+        'discount_percent': product.discount_percent,
+        'description': product.description,
+        'image': image_url(product),
+        'media': media_to_json(product.media),
+    }
+
+
+# --- Filtering ---
+def _float_arg(args, name):
+    value = args.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a number") from None
+    if not math.isfinite(number):
+        raise ValueError(f"{name} must be a finite number")
+    return number
+
+
+def build_filter(args, members=None):
+    """
+    Returns a predicate for the query-string filters, or None when there
+    are none. `members`: ids the facet filters allow (None: all).
+    """
+    query = ' '.join(args.get('q', '').lower().split())
+    min_price = _float_arg(args, 'min_price')
+    max_price = _float_arg(args, 'max_price')
+    min_discount = _float_arg(args, 'min_discount')
+
+    if not query and min_price is None and max_price is None and min_discount is None and members is None:
+        return None
+
+    def matches(product):
+        if members is not None and product.id not in members:
+            return False
+        if min_price is not None and product.price < min_price:
+            return False
+        if max_price is not None and product.price > max_price:
+            return False
+        if min_discount is not None and product.discount_percent < min_discount:
+            return False
+        if query and query not in product.name.lower():
+            return False
+        return True
+
+    return matches
+
+
+def error_response(message, status=400):
+    return Response(json.dumps({'success': False, 'message': message}), status=status,
+                    mimetype='application/json')
+
+
+# --- Routes ---
+@api_bp.route('/products')
+def list_products():
+    sort = request.args.get('sort', 'id')
+    if sort not in SORT_KEYS:
+        return error_response(f"Unknown sort key {sort!r}")
+    descending = request.args.get('order', 'asc') == 'desc'
+
+    try:
+        limit = int(request.args.get('limit', current_app.config['API_PAGE_SIZE']))
+    except ValueError:
+        return error_response('limit must be an integer')
+    try:
+        after = decode_cursor(request.args['cursor'], sort, descending) if request.args.get('cursor') else None
+        members = facets.members(g.catalog, facets.parse_selection(request.args))
+        matches = build_filter(request.args, members)
+    except ValueError as e:
+        return error_response(str(e))
+    limit = max(1, min(limit, current_app.config['API_MAX_PAGE_SIZE']))
+
+    catalog = g.catalog
+    if members is not None and sort == 'id' and not descending:
+        # Catalog order is id order: walk the facet bitset from the cursor instead of every product.
+        products = facets.iter_members(catalog, members, after[1] if after is not None else 0)
+    else:
+        products = catalog.iter_sorted(sort, descending, after)
+
+    def generate():
+        yield '{"success":true,"version":%s,"items":[' % json.dumps(catalog.version)
+        emitted = 0
+        last = None
+        has_more = False
+        for product in products:
+            if matches is not None and not matches(product):
+                continue
+            if emitted == limit:
+                has_more = True
+                break
+            yield (',' if emitted else '') + json.dumps(product_to_json(product), ensure_ascii=False)
+            emitted += 1
+            last = product
+
+        next_cursor = encode_cursor(sort, descending, last) if has_more else None
+        yield '],"next_cursor":%s}' % json.dumps(next_cursor)
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
+@api_bp.route('/search')
+def search_products():
+    query = request.args.get('q', '').strip()
+    try:
+        limit = int(request.args.get('limit', current_app.config['API_PAGE_SIZE']))
+    except ValueError:
+        return error_response('limit must be an integer')
+    limit = max(1, min(limit, current_app.config['SEARCH_MAX_RESULTS']))
+
+    index = search.get_index()
+    catalog = g.catalog
+    items = []
+    for product_id, _ in index.search(query, limit):
+        # The index may be one snapshot ahead of this request's catalog; skip ids it lacks.
+        product = catalog.get(product_id)
+        if product is not None:
+            items.append(product_to_json(product))
+
+    return jsonify({
+        'success': True,
+        'query': query,
+        'version': catalog.version,
+        'items': items,
+        'suggestions': index.suggest(query),
+    })
+
+
+@api_bp.route('/facets')
+def facet_counts():
+    try:
+        selection = facets.parse_selection(request.args)
+    except ValueError as e:
+        return error_response(str(e))
+    result = facets.select(g.catalog, selection)
+    return jsonify({
+        'success': True,
+        'version': g.catalog.version,
+        'selection': selection,
+        'total': result.total,
+        'counts': result.counts,
+    })
+
+
+def _strict_int(value):
+    """`value` as an int if it is one (3, 3.0 or "3"); raises ValueError for true, 1.9 and the like."""
+    if isinstance(value, bool):
+        raise ValueError('not an integer')
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError('not an integer')
+        return int(value)
+    if isinstance(value, (int, str)):
+        return int(value)
+    raise ValueError('not an integer')
+
+
+def _parse_cart_lines(payload):
+    """Validates batch lines against the catalog. Returns [(product, quantity)] or raises ValueError."""
+    lines = payload.get('lines') if isinstance(payload, dict) else None
+    if not isinstance(lines, list) or not lines:
+        raise ValueError('Expected a non-empty "lines" list')
+    if len(lines) > current_app.config['CART_MAX_BATCH_LINES']:
+        raise ValueError('Too many lines in one request')
+
+    max_quantity = current_app.config['CART_MAX_LINE_QUANTITY']
+    parsed = []
+    for line in lines:
+        try:
+            product_id = _strict_int(line['id'])
+            quantity = _strict_int(line.get('quantity', 1))
+        except (TypeError, KeyError, ValueError, AttributeError):
+            raise ValueError('Each line needs an integer "id" and "quantity"')
+        if not 1 <= quantity <= max_quantity:
+            raise ValueError(f"Quantity for product {product_id} must be between 1 and {max_quantity}")
+        product = g.catalog.get(product_id)
+        if product is None:
+            raise ValueError(f"Unknown product {product_id}")
+        parsed.append((product, quantity))
+    return parsed
+
+
+@api_bp.route('/cart/lines', methods=['POST'])
+def add_cart_lines():
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return error_response('Expected a JSON object')
+    idempotency_key = request.headers.get('Idempotency-Key') or payload.get('idempotency_key')
+    if idempotency_key is not None and not isinstance(idempotency_key, str):
+        return error_response('"idempotency_key" must be a string')
+
+    # Validate everything first: a rejected batch adds nothing and claims no key.
+    try:
+        lines = _parse_cart_lines(payload)
+    except ValueError as e:
+        return error_response(str(e))
+
+    cart = get_cart(create=True)
+    store = cart_store.get_store()
+
+    if idempotency_key:
+        claim = store.claim_idempotency_key(cart.id, idempotency_key)
+        if claim == IN_PROGRESS:
+            return error_response('A request with this Idempotency-Key is still in progress', status=409)
+        if claim != CLAIMED:
+            response = jsonify(claim)
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+
+    # Reserve stock for every line before adding any: all or nothing.
+    ledger = inventory.get_ledger()
+    reserved = []
+
+    def undo():
+        for product, quantity in reserved:
+            ledger.release(product.id, cart.id, quantity)
+        if idempotency_key:
+            store.release_idempotency_key(cart.id, idempotency_key)
+
+    try:
+        for product, quantity in lines:
+            ledger.reserve(product.id, cart.id, quantity)
+            reserved.append((product, quantity))
+        for product, quantity in lines:
+            cart.add(premade_line_key(product.id), 'premade', product.name, product.price,
+                     quantity=quantity, item_id=product.id)
+        save_cart(cart)
+    except inventory.OutOfStock as e:
+        undo()
+        product = g.catalog.get(e.product_id)
+        # Negative when stock was cut below what carts already hold
+        if e.available <= 0:
+            return error_response(f"{product.name} is sold out")
+        return error_response(f"Only {e.available} left of {product.name}")
+    except Exception:
+        undo()
+        raise
+
+    body = {
+        'success': True,
+        'cart_count': cart.count,
+        'added': sum(quantity for _, quantity in lines),
+    }
+    if idempotency_key:
+        store.complete_idempotency_key(cart.id, idempotency_key, body)
+    return jsonify(body)
+
+
+def init_app(app):
+    app.config.setdefault('API_PAGE_SIZE', 24)
+    app.config.setdefault('API_MAX_PAGE_SIZE', 500)
+    app.config.setdefault('CART_MAX_BATCH_LINES', 100)
+    app.config.setdefault('CART_MAX_LINE_QUANTITY', 99)
+    app.register_blueprint(api_bp)
@@ -1,46 +1,168 @@
-from flask import Flask, render_template , request , session, redirect, url_for, jsonify
-from data import PREMADE_TERRARIUMS, VESSELS, PLANTS, SUBSTRATES 
+from flask import Flask, render_template , request , session, redirect, url_for, jsonify, g, current_app, abort
+from data import COMPONENTS, load_catalog_source
+import images
+import assets
+import cart_store
+import orders
+import inventory
+import page_cache
+import api
+import health
+import search
+import facets
+import similar
+import metrics
+import profiling
+import compression
+import rate_limit
+from api import encode_cursor
+from page_cache import render_cached_page
+from cart_store import get_cart, save_cart, cart_summary, premade_line_key, custom_line_key
 from datetime import datetime 
+import gc
+import os
+import weakref
+from itertools import islice
 
-app = Flask(__name__)
-# --- CRITICAL CONFIGURATION ---
-app.secret_key = 'a_very_secret_and_unique_key_for_terranova_2025' 
-# ------------------------------
+# Routes are collected here and registered on each app by create_app()
+_ROUTES = []
 
-# --- CORE LOGIC: Helper function to add premade item to session ---
-def _add_premade_item_to_cart_logic(item_id):
-    """Handles product lookup and adds the item to the cart session."""
-    if 'cart' not in session:
-        session['cart'] = []
+# restart_after_fork methods of every live app's catalog source and order log, held
+# weakly so apps that were dropped (tests, benchmarks) aren't kept alive by the hook.
+_AFTER_FORK = []
 
-    # Safe lookup based on index (item_id - 1)
-    product_index = item_id - 1
-    
-    if 0 <= product_index < len(PREMADE_TERRARIUMS):
-        product = PREMADE_TERRARIUMS[product_index]
-    else:
-        # Fallback lookup for unexpected IDs
-        product = next((p for p in PREMADE_TERRARIUMS if int(p.get('id', 0)) == item_id), None)
+def _restart_after_fork():
+    for ref in _AFTER_FORK:
+        restart = ref()
+        if restart is not None:
+            restart()
+
+# Registered once per process: os.register_at_fork hooks can't be removed, so one per app would pile up.
+os.register_at_fork(after_in_child=_restart_after_fork)
+
+def route(rule, **options):
+    def decorator(view):
+        _ROUTES.append((rule, view, options))
+        return view
+    return decorator
+
+# --- Application factory ---
+def create_app(config=None):
+    """
+    Builds the app and does all the expensive work up front: parses the
+    catalog, compiles every template and warms the page cache with real
+    requests, then freezes the GC so it never touches that state again.
+
+    Under a pre-fork server (gunicorn --preload) this runs once in the
+    master, so workers share the loaded pages copy-on-write and their first
+    request is as fast as their thousandth.
+    """
+    app = Flask(__name__)
+    # --- CRITICAL CONFIGURATION ---
+    app.secret_key = 'a_very_secret_and_unique_key_for_terranova_2025' 
+    # Seconds between checks of terra.csv for changes (hot reload)
+    app.config.setdefault('CATALOG_RELOAD_INTERVAL', 2.0)
+    # Cart lines live server-side; the cookie only holds a cart id ('memory' or 'sqlite')
+    app.config.setdefault('CART_BACKEND', 'memory')
+    # Opt-in request profiling (signed X-Profile-Token header or PROFILE_SAMPLE_RATES); see profiling.py
+    app.config.setdefault('PROFILE_ENABLED', os.environ.get('TN_PROFILE') == '1')
+    # Requested once at startup so caches are filled before the first real visitor
+    app.config.setdefault('WARMUP_PATHS', ['/', '/shop', '/customize', '/cart', '/api/products?limit=1'])
+    # Move everything loaded at startup out of the GC's reach (keeps forked pages shared)
+    app.config.setdefault('GC_FREEZE', True)
+    app.config.update(config or {})
+    # ------------------------------
+
+    manifest = images.load_manifest()
+    catalog_source = load_catalog_source(manifest)
+    catalog_source.interval = app.config['CATALOG_RELOAD_INTERVAL']
+    app.extensions['catalog_source'] = catalog_source
+
+    # First: its timer has to wrap every other hook
+    metrics.init_app(app)
+    metrics.register_catalog_source(catalog_source)
+    profiling.init_app(app)
+    # after_request hooks run last-registered first: registered early, it compresses the finished body
+    compression.init_app(app)
+    # WSGI middleware: throttled requests are answered before Flask opens the session
+    rate_limit.init_app(app)
+    health.init_app(app)
+    cart_store.init_app(app)
+    inventory.init_app(app)
+    order_log = orders.init_app(app)
+    images.init_app(app, manifest)
+    assets.init_app(app)
+    # After assets: fingerprinted URLs are part of every cached page
+    page_cache.init_app(app)
+    api.init_app(app)
+    # Builds the index now and again for every reloaded snapshot
+    search.init_app(app, catalog_source)
+    facets.init_app(app, catalog_source)
+    # Maps (or on small catalogs builds) the neighbour index for each snapshot
+    similar.init_app(app, catalog_source)
+
+    app.before_request(pin_catalog_snapshot)
+    app.context_processor(inject_global_vars)
+    for rule, view, options in _ROUTES:
+        app.add_url_rule(rule, view_func=view, **options)
+
+    _preload(app)
+    # The watcher thread doesn't survive a fork; each worker starts its own.
+    catalog_source.start()
+    _AFTER_FORK[:] = [ref for ref in _AFTER_FORK if ref() is not None]
+    _AFTER_FORK.extend(weakref.WeakMethod(restart)
+                       for restart in (catalog_source.restart_after_fork, order_log.restart_after_fork))
+    health.mark_ready(app)
+    return app
+
+def _preload(app):
+    # Compile every template into the environment's cache.
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
+    # Real requests fill the page cache and exercise the lazy paths (URL map, catalog orderings).
+    client = app.test_client()
+    for path in app.config['WARMUP_PATHS']:
+        response = client.get(path)
+        response.get_data()
+        if response.status_code >= 500:
+            print(f"Warning: Warm-up request {path} failed with {response.status_code}")
+
+    if app.config['GC_FREEZE']:
+        gc.collect()
+        gc.freeze()
+
+# --- Catalog snapshot: pinned once per request ---
+def pin_catalog_snapshot():
+    # A reload mid-request must not change what this request sees.
+    g.catalog = current_app.extensions['catalog_source'].current
+
+# --- CORE LOGIC: Helper function to add premade item to the cart ---
+def _add_premade_item_to_cart_logic(item_id):
+    """Handles product lookup and adds the item to the server-side cart."""
+    # O(1) lookup through the catalog's id index
+    with metrics.CATALOG_LOOKUP_SECONDS.time('get'):
+        product = g.catalog.get(item_id)
 
     if product:
-        cart_item = {
-            'id': product['id'],
-            'type': 'premade',
-            'name': product['name'],
-            'price': product['price'],
-            'quantity': 1
-        }
-        session['cart'].append(cart_item)
-        session.modified = True 
-        return len(session['cart'])
+        cart = get_cart(create=True)
+        # Hold a unit for this cart first: a sold-out product is not added
+        try:
+            inventory.get_ledger().reserve(product.id, cart.id, 1)
+        except inventory.OutOfStock:
+            return cart.count
+        # Repeated adds merge into the existing line's quantity
+        cart.add(premade_line_key(product.id), 'premade', product.name, product.price, item_id=product.id)
+        save_cart(cart)
+        return cart.count
     
-    return len(session.get('cart', [])) # Return current count if product not found
+    return cart_summary()[0] # Return current count if product not found
 
 # --- Context Processor ---
-@app.context_processor
+@metrics.timed(metrics.CONTEXT_PROCESSOR_SECONDS, 'inject_global_vars')
 def inject_global_vars():
     show_intro = (request.endpoint == 'home' and request.method == 'GET')
-    cart_count = len(session.get('cart', []))
+    cart_count, _ = cart_summary()
     
     return {
         'now': datetime.now(), 
@@ -50,151 +172,202 @@ def inject_global_vars():
 
 # --- PRIMARY ROUTES ---
 
-@app.route('/')
+@route('/')
 def home():
     return render_template('index.html')
 
-@app.route('/shop')
+@route('/shop')
 def shop():
-    return render_template('shop.html', products=PREMADE_TERRARIUMS)
+    # ?price=&discount=&category= narrow the grid; see facets.py
+    try:
+        selection = facets.parse_selection(request.args)
+    except ValueError as e:
+        abort(400, description=str(e))
+    facet_result = facets.select(g.catalog, selection)
+
+    # Only the first page is rendered; the rest streams in from /api/products,
+    # so the HTML stays the same size however large the catalog gets.
+    page_size = current_app.config['API_PAGE_SIZE']
+    with metrics.CATALOG_LOOKUP_SECONDS.time('first_page'):
+        if facet_result.members is None:
+            products = g.catalog.iter_sorted('id')
+        else:
+            products = facets.iter_members(g.catalog, facet_result.members)
+        first_page = list(islice(products, page_size + 1))
+    next_cursor = None
+    if len(first_page) > page_size:
+        first_page = first_page[:page_size]
+        next_cursor = encode_cursor('id', False, first_page[-1])
 
-@app.route('/customize')
+    # Cached per catalog version and filter set; only the cart badge is filled in per request
+    filter_query = facets.query_string(selection)
+    return render_cached_page('shop.html', cache_variant=filter_query, products=first_page,
+                              next_cursor=next_cursor, facet_groups=facets.get_facets(),
+                              facet_result=facet_result, selection=selection, filter_query=filter_query)
+
+@route('/customize')
 def customize():
-    return render_template(
-        'customize.html',
-        vessels=VESSELS,
-        plants=PLANTS,
-        substrates=SUBSTRATES
-    )
+    return render_cached_page('customize.html', component_groups=COMPONENTS.groups)
 
-@app.route('/cart')
+@route('/cart')
 def view_cart():
-    cart_items = session.get('cart', [])
-    total = sum(item.get('price', 0) * item.get('quantity', 0) for item in cart_items)
-    return render_template('cart.html', cart=cart_items, total=total)
+    cart = get_cart()
+    if cart is None:
+        return render_template('cart.html', cart=[], total=0.0)
+    return render_template('cart.html', cart=cart.items(), total=cart.total)
 
 # --- PREMADE ITEM MANAGEMENT ---
 
 # 1. AJAX Endpoint (Used by "Add to Cart" button - No Refresh)
-@app.route('/add-premade-to-cart-ajax/<int:item_id>', methods=['POST'])
+@route('/add-premade-to-cart-ajax/<int:item_id>', methods=['POST'])
 def add_premade_to_cart_ajax(item_id):
-    current_count = len(session.get('cart', []))
+    current_count, _ = cart_summary()
     new_count = _add_premade_item_to_cart_logic(item_id)
     
     if new_count > current_count:
         return jsonify({'success': True, 'cart_count': new_count}), 200
     
-    return jsonify({'success': False, 'message': 'Product not added'}), 400
+    available = inventory.get_ledger().available(item_id)
+    # Negative when stock was cut below what carts already hold; None: not stock-tracked
+    message = 'Sold out' if available is not None and available <= 0 else 'Product not added'
+    return jsonify({'success': False, 'message': message}), 400
 
 # 2. Buy Now Endpoint (Used by "Buy Now" button - Redirects to cart)
-@app.route('/buy-now/<int:item_id>')
+@route('/buy-now/<int:item_id>')
 def buy_now(item_id):
     _add_premade_item_to_cart_logic(item_id) 
     return redirect(url_for('view_cart'))
 
 # 3. Non-AJAX Fallback (Used only for redirecting with anchor if AJAX fails)
-@app.route('/add-premade-to-cart/<int:item_id>')
+@route('/add-premade-to-cart/<int:item_id>')
 def add_premade_to_cart(item_id):
     _add_premade_item_to_cart_logic(item_id) 
     return redirect(url_for('shop', _fragment=f'product-{item_id}')) 
 
 # --- CART MANAGEMENT ---
 
-@app.route('/remove-from-cart/<int:index>')
+@route('/remove-from-cart/<int:index>')
 def remove_from_cart(index):
-    if 'cart' in session:
-        cart = session['cart']
-        if 0 <= index < len(cart):
-            cart.pop(index)
-            session.modified = True
-            
+    cart = get_cart()
+    if cart is not None:
+        lines = cart.items()
+        if cart.remove_line(index):
+            # Its units go back on sale right away
+            if lines[index]['type'] == 'premade':
+                inventory.get_ledger().release(lines[index]['id'], cart.id)
+            save_cart(cart)
+
     return redirect(url_for('view_cart'))
 
-@app.route('/clear-cart')
+@route('/clear-cart')
 def clear_cart():
-    if 'cart' in session:
-        session['cart'] = []
-        session.modified = True 
+    cart = get_cart()
+    if cart is not None:
+        ledger = inventory.get_ledger()
+        for product_id, _ in inventory.premade_lines(cart):
+            ledger.release(product_id, cart.id)
+        cart.clear()
+        save_cart(cart)
     return redirect(url_for('view_cart'))
 
+def _checkout_pending(cart):
+    return render_template('cart.html', cart=cart.items(), total=cart.total,
+                           checkout_error="We're still confirming your order. Please try again in a moment; "
+                                          "you won't be charged twice."), 202
+
 # Route for the final checkout process
-@app.route('/checkout-complete')
+@route('/checkout-complete')
 def checkout_complete():
-    # 1. Clear the cart session to simulate order placement
-    if 'cart' in session:
-        # We don't use cart.clear() because session['cart'] might not exist
-        session['cart'] = []
-        session.modified = True 
-        
-    # 2. Render the Thank You page
-    return render_template('thank_you.html')
+    # 1. Durably record the order (waits for its group commit, see orders.py)
+    cart = get_cart()
+    order = None
+    if cart is not None and cart.lines:
+        # A retry of this same cart (e.g. after a timed-out confirmation) must not order or sell it twice
+        token = orders.checkout_token(cart)
+        try:
+            order = orders.find_order(token)
+        except orders.OrderTimeout:
+            return _checkout_pending(cart)
+
+        if order is None:
+            # All premade lines are taken from stock together, or none are
+            ledger = inventory.get_ledger()
+            stock_lines = inventory.premade_lines(cart)
+            try:
+                ledger.commit(cart.id, stock_lines)
+            except inventory.OutOfStock as e:
+                product = g.catalog.get(e.product_id)
+                name = product.name if product else f"product {e.product_id}"
+                return render_template('cart.html', cart=cart.items(), total=cart.total,
+                                       checkout_error=f"Sorry, only {max(e.available, 0)} of {name} left. "
+                                                      "Please update your cart."), 409
+
+            try:
+                # The units go back only if the write definitely failed, even after we stop waiting
+                order, created = orders.place_order(cart, token, on_failure=lambda: ledger.restock(stock_lines))
+            except orders.OrderTimeout as e:
+                # Unknown outcome: the order may still land, so its units stay sold and the cart stays put.
+                print(f"Warning: Checkout unconfirmed for cart {cart.id}: {e}")
+                return _checkout_pending(cart)
+            except orders.OrderLogError as e:
+                print(f"Warning: Checkout failed for cart {cart.id}: {e}")
+                # Keep the cart so the shopper can simply try again
+                return render_template('cart.html', cart=cart.items(), total=cart.total,
+                                       checkout_error="We couldn't place your order. Please try again."), 503
+            if not created:
+                # A concurrent attempt recorded this cart first and already took its units.
+                ledger.restock(stock_lines)
+
+        # 2. Only a recorded order empties the cart
+        cart.clear()
+        save_cart(cart)
+
+    # 3. Render the Thank You page
+    return render_template('thank_you.html', order=order)
 
 
 # --- CUSTOM ITEM MANAGEMENT ---
 
-@app.route('/build-summary', methods=['POST'])
-def build_summary():
-    single_fields = ['growing_medium', 'drainage_layer', 'hardscape_stones']
-    multi_fields = ['plants[]', 'care[]', 'accessories[]']
-    
-    all_components = []
-    total_price_inr = 0.0
-    vessel_name = "Custom Build"
-    
-    for field in single_fields:
-        item_data_str = request.form.get(field) 
-        if not item_data_str:
-            return redirect(url_for('customize')) 
-        try:
-            name, price_str = item_data_str.split('|')
-            price_inr = float(price_str)
-            all_components.append({'name': name, 'price_inr': price_inr}) 
-            total_price_inr += price_inr
-            if field == single_fields[0]:
-                vessel_name = name
-        except (ValueError, IndexError):
-            return redirect(url_for('customize')) 
-    
-    for field in multi_fields:
-        for item_data_str in request.form.getlist(field):
-            try:
-                name, price_str = item_data_str.split('|')
-                price_inr = float(price_str)
-                all_components.append({'name': name, 'price_inr': price_inr})
-                total_price_inr += price_inr
-            except (ValueError, IndexError):
-                continue 
-
-    custom_item = {
+def _describe_custom_build(components):
+    """Summary/cart view of a custom build; totals are summed in integer paise."""
+    total_paise = sum(component.price_paise for component in components)
+    # The first step (growing medium) names the build, as before
+    return {
         'type': 'custom',
-        'components': all_components, 
-        'total_price_inr': total_price_inr,
-        'name': f"Custom Terrarium: {vessel_name}..."
+        'components': [{'name': c.name, 'price_inr': c.price_inr} for c in components],
+        'total_price_inr': total_paise / 100,
+        'name': f"Custom Terrarium: {components[0].name}...",
     }
-    
-    session['last_custom_build'] = custom_item
-    return render_template('summary.html', item=custom_item)
+
+@route('/build-summary', methods=['POST'])
+def build_summary():
+    # The form posts component ids; names and prices come from the server-side table
+    components = COMPONENTS.select(request.form)
+    if not components:
+        return redirect(url_for('customize'))
+
+    # Only the ids go into the session; the summary is re-priced when added to the cart
+    session['last_custom_build'] = [component.id for component in components]
+    return render_template('summary.html', item=_describe_custom_build(components))
 
 
-@app.route('/add-custom-to-cart', methods=['GET'])
+@route('/add-custom-to-cart', methods=['GET'])
 def add_custom_to_cart():
-    custom_item = session.pop('last_custom_build', None) 
-    
-    if not custom_item:
-        return redirect(url_for('customize')) 
+    component_ids = session.pop('last_custom_build', None)
+    components = COMPONENTS.lookup_all(component_ids) if isinstance(component_ids, list) else None
 
-    cart_item = {
-        'type': custom_item['type'],
-        'name': custom_item['name'],
-        'price': custom_item['total_price_inr'], 
-        'quantity': 1
-    }
+    if not components:
+        return redirect(url_for('customize')) 
 
-    if 'cart' not in session:
-        session['cart'] = []
-    
-    session['cart'].append(cart_item)
-    session.modified = True
+    custom_item = _describe_custom_build(components)
+    cart = get_cart(create=True)
+    cart.add(
+        custom_line_key(component.id for component in components),
+        custom_item['type'],
+        custom_item['name'],
+        custom_item['total_price_inr'],
+    )
+    save_cart(cart)
     
     return redirect(url_for('view_cart'))
 
@@ -202,4 +375,5 @@ def add_custom_to_cart():
 # Note: Add this function below your existing cart routes (e.g., after clear_cart)
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0')
\ No newline at end of file
+    # Development server only; serve production with `gunicorn -c gunicorn.conf.py wsgi:app`
+    create_app().run(debug=True, host='0.0.0.0')
\ No newline at end of file
@@ -0,0 +1,173 @@
+"""
+Fingerprinted static assets.
+
+Build step (run at deploy time):
+
+    python assets.py build
+
+copies static/css, static/js and static/video into static/dist/ under
+content-hashed names (css/style.3f2a1b9c0d.css), writes gzip and, when the
+`brotli` package is installed, brotli siblings for text assets, and records
+the mapping in static/dist/manifest.json.
+
+At runtime `asset_url('css/style.css')` resolves through the manifest to
+/assets/<hashed name>, which is served with `Cache-Control: immutable`, a
+precompressed body picked from Accept-Encoding, and byte-range support so
+the intro video can seek and resume. Without a manifest it falls back to
+the plain /static URL.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+
+from flask import Blueprint, abort, current_app, request, send_file, url_for
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_NAME = 'manifest.json'
+
+# Directories under static/ that are fingerprinted (images go through images.py).
+ASSET_DIRS = ('css', 'js', 'video')
+# Worth precompressing; media formats are already compressed.
+TEXT_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.txt', '.html')
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+try:
+    import brotli
+except ImportError:  # Optional: gzip alone is still a big win.
+    brotli = None
+
+assets_bp = Blueprint('assets', __name__)
+
+
+# --- Build ---
+def _fingerprint(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:10]
+
+
+def _precompress(path):
+    with open(path, 'rb') as file:
+        data = file.read()
+    with open(path + '.gz', 'wb') as file:
+        # mtime=0 keeps the output byte-identical across builds.
+        file.write(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(path + '.br', 'wb') as file:
+            file.write(brotli.compress(data, quality=11))
+
+
+def build(static_dir=STATIC_DIR, dist_dir=DIST_DIR):
+    """Fingerprints every asset, precompresses text files and writes the manifest."""
+    manifest = {}
+    for asset_dir in ASSET_DIRS:
+        source_root = os.path.join(static_dir, asset_dir)
+        for root, _, files in os.walk(source_root):
+            for name in sorted(files):
+                source = os.path.join(root, name)
+                logical = os.path.relpath(source, static_dir).replace(os.sep, '/')
+                stem, extension = os.path.splitext(logical)
+                hashed = f"{stem}.{_fingerprint(source)}{extension}"
+
+                target = os.path.join(dist_dir, hashed)
+                if not os.path.exists(target):
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    shutil.copyfile(source, target)
+                    if extension.lower() in TEXT_EXTENSIONS:
+                        _precompress(target)
+                manifest[logical] = hashed
+                print(f"  > {logical} -> {hashed}")
+
+    os.makedirs(dist_dir, exist_ok=True)
+    with open(os.path.join(dist_dir, MANIFEST_NAME), 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    return manifest
+
+
+# --- Runtime ---
+def load_manifest(dist_dir=DIST_DIR):
+    try:
+        with open(os.path.join(dist_dir, MANIFEST_NAME), encoding='utf-8') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not read asset manifest: {e}")
+        return {}
+
+
+def asset_url(path):
+    """URL for a static asset: fingerprinted when built, plain /static otherwise."""
+    hashed = current_app.extensions['asset_manifest'].get(path)
+    if hashed is None:
+        return url_for('static', filename=path)
+    return url_for('assets.serve_asset', filename=hashed)
+
+
+def _pick_encoding(path):
+    """Best precompressed sibling the client accepts, as (path, encoding)."""
+    # Ranges refer to one representation; keep them on the identity bytes.
+    if request.range is not None:
+        return path, None
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[encoding] and os.path.exists(path + suffix):
+            return path + suffix, encoding
+    return path, None
+
+
+@assets_bp.route('/assets/<path:filename>')
+def serve_asset(filename):
+    dist_dir = current_app.config['ASSET_DIST_DIR']
+    path = os.path.realpath(os.path.join(dist_dir, filename))
+    if not path.startswith(os.path.realpath(dist_dir) + os.sep) or not os.path.isfile(path):
+        abort(404)
+
+    is_text = os.path.splitext(path)[1].lower() in TEXT_EXTENSIONS
+    body_path, encoding = _pick_encoding(path) if is_text else (path, None)
+
+    # conditional=True gives ETag/If-None-Match plus Range/If-Range -> 206 handling.
+    response = send_file(
+        body_path,
+        mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream',
+        conditional=True,
+        max_age=IMMUTABLE_MAX_AGE,
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    response.headers['Accept-Ranges'] = 'bytes'
+    if is_text:
+        response.vary.add('Accept-Encoding')
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_app(app):
+    app.config.setdefault('ASSET_DIST_DIR', DIST_DIR)
+    app.extensions['asset_manifest'] = load_manifest(app.config['ASSET_DIST_DIR'])
+    app.jinja_env.globals['asset_url'] = asset_url
+    app.register_blueprint(assets_bp)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fingerprint and precompress static assets.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    build_cmd = sub.add_parser('build')
+    build_cmd.add_argument('--static-dir', default=STATIC_DIR)
+    build_cmd.add_argument('--dist-dir', default=DIST_DIR)
+    args = parser.parse_args(argv)
+
+    manifest = build(args.static_dir, args.dist_dir)
+    print(f"Asset manifest written ({len(manifest)} files)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+"""Benchmarks and load tests. Run modules with `python -m benchmarks.<name>` from the repo root."""
@@ -0,0 +1,138 @@
+"""
+Bytes saved versus CPU spent by response compression, per route.
+
+    python -m benchmarks.bench_compression
+    python -m benchmarks.bench_compression --products 1000 --requests 300 --gzip-levels 1 6 9
+
+Every route is requested through the Flask test client, once without
+Accept-Encoding (identity: the baseline) and once per encoding and level:
+gzip at each --gzip-levels and, when the `brotli` package is installed,
+brotli at each --brotli-qualities. Reported per scenario:
+
+    response_bytes      body size on the wire
+    saved_bytes/pct     versus the identity body
+    cpu_ms              process CPU time per request (all of it, not just
+                        the compressor)
+    extra_cpu_ms        cpu_ms minus the identity run's
+    saved_kb_per_cpu_ms saved kilobytes per extra CPU millisecond: the
+                        exchange rate when picking a level
+
+plus the usual throughput and latency percentiles. --save / --compare
+work as in bench_routes.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.common import compare, install_catalog, load_results, report, save_results, summarize, synthetic_catalog
+
+import compression
+
+ROUTES = (
+    ('home', '/'),
+    ('shop', '/shop'),
+    ('shop_filtered', '/shop?price=500-999&category=moss,succulent'),
+    ('customize', '/customize'),
+    ('cart', '/cart'),
+    ('api_products_page', '/api/products?sort=price&limit=100'),
+    ('api_search', '/api/search?q=moss'),
+)
+
+
+def _variants(gzip_levels, brotli_qualities):
+    """(label, Accept-Encoding, config overrides)"""
+    variants = [('identity', None, {})]
+    variants += [(f"gzip-{level}", 'gzip', {'COMPRESS_GZIP_LEVEL': level}) for level in gzip_levels]
+    if compression.brotli is not None:
+        variants += [(f"br-{quality}", 'br', {'COMPRESS_BROTLI_QUALITY': quality}) for quality in brotli_qualities]
+    else:
+        print("brotli not installed: measuring gzip only (pip install brotli).")
+    return variants
+
+
+def run_route(app, path, accept_encoding, requests):
+    client = app.test_client()
+    client.post('/api/cart/lines', json={'lines': [{'id': product_id, 'quantity': 1} for product_id in range(1, 6)]})
+    headers = {'Accept-Encoding': accept_encoding} if accept_encoding else {}
+    response = client.get(path, headers=headers)
+    response.get_data()  # warm-up: page cache fill
+
+    latencies = []
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    for _ in range(requests):
+        request_started = time.perf_counter()
+        response = client.get(path, headers=headers)
+        body = response.get_data()
+        latencies.append(time.perf_counter() - request_started)
+    elapsed = time.perf_counter() - started
+    cpu_ms = (time.process_time() - cpu_started) * 1000 / requests
+    return latencies, elapsed, cpu_ms, len(body), response.headers.get('Content-Encoding'), response.status_code
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure compression savings and CPU cost per route.')
+    parser.add_argument('--products', type=int, default=1000, help='Synthetic catalog size')
+    parser.add_argument('--requests', type=int, default=300, help='Requests per route and variant')
+    parser.add_argument('--gzip-levels', type=int, nargs='+', default=[1, 6, 9])
+    parser.add_argument('--brotli-qualities', type=int, nargs='+', default=[4, 5, 11])
+    parser.add_argument('--save', metavar='PATH', help='Write results as a JSON baseline')
+    parser.add_argument('--compare', metavar='PATH', help='Fail if results regress against this baseline')
+    parser.add_argument('--tolerance', type=float, default=1.0, help='Scale all regression thresholds')
+    args = parser.parse_args(argv)
+
+    from app import create_app
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='tn-compress-') as directory:
+        app = create_app({
+            'ORDER_DB_PATH': os.path.join(directory, 'orders.sqlite3'),
+            'SIMILAR_INDEX_PATH': os.path.join(directory, 'terra.similar'),
+            'WARMUP_PATHS': [],
+            'GC_FREEZE': False,
+            # No stock file: synthetic products are untracked and never sell out
+            'INVENTORY_STOCK_PATH': os.devnull,
+        })
+        install_catalog(app, synthetic_catalog(args.products))
+        variants = _variants(args.gzip_levels, args.brotli_qualities)
+        for name, path in ROUTES:
+            identity_bytes = identity_cpu_ms = None
+            for label, accept_encoding, overrides in variants:
+                app.config.update(overrides)
+                latencies, elapsed, cpu_ms, size, encoding, status = run_route(
+                    app, path, accept_encoding, args.requests)
+                if identity_bytes is None:
+                    identity_bytes, identity_cpu_ms = size, cpu_ms
+                saved = identity_bytes - size
+                extra_cpu_ms = cpu_ms - identity_cpu_ms
+                results[f"compression:{name}:{label}"] = summarize(
+                    latencies, elapsed,
+                    status=status,
+                    encoding=encoding or 'identity',
+                    response_bytes=size,
+                    saved_bytes=saved,
+                    saved_pct=round(100.0 * saved / identity_bytes, 1) if identity_bytes else 0.0,
+                    cpu_ms=round(cpu_ms, 3),
+                    extra_cpu_ms=round(extra_cpu_ms, 3),
+                    saved_kb_per_cpu_ms=round(saved / 1024 / extra_cpu_ms, 1) if extra_cpu_ms > 0 else None,
+                )
+        app.extensions['order_log'].close()
+
+    report(results)
+    if args.save:
+        save_results(args.save, results)
+        print(f"Saved results to {args.save}")
+    if args.compare:
+        regressions = compare(load_results(args.compare), results, tolerance=args.tolerance)
+        if regressions:
+            print("\nREGRESSIONS:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nNo regressions against baseline.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+Concurrent-checkout benchmark for the order log.
+
+    python -m benchmarks.bench_orders
+    python -m benchmarks.bench_orders --threads 1 8 32 --orders 2000 --lines 3
+
+Each scenario starts T threads that place orders as fast as they can
+against a fresh database, once with group commit (ORDER_MAX_BATCH) and
+once committing every order on its own (max batch 1), so the gain is
+visible side by side. The checkout_route scenarios go through the real
+/checkout-complete route (cart fill + checkout per order).
+
+Reported per scenario: orders/s (throughput_rps), p50/p95/p99 latency of
+place() (queue -> durable commit), commits and mean orders per commit.
+--save / --compare work as in bench_routes.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.common import compare, load_results, report, save_results, summarize
+
+from orders import OrderLog
+
+DEFAULT_THREADS = (1, 8, 32)
+
+
+def _lines(count):
+    return [{'key': f"premade:{index}", 'id': index, 'type': 'premade', 'name': f"Terrarium #{index}",
+             'price': 499.0, 'quantity': 1} for index in range(1, count + 1)]
+
+
+def _run_threads(threads, per_thread, one_order):
+    """Runs one_order() per_thread times on each of `threads` threads; returns (latencies, elapsed)."""
+    latencies = [[] for _ in range(threads)]
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(samples):
+        barrier.wait()
+        for _ in range(per_thread):
+            started = time.perf_counter()
+            one_order()
+            samples.append(time.perf_counter() - started)
+
+    workers = [threading.Thread(target=worker, args=(samples,)) for samples in latencies]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return [latency for samples in latencies for latency in samples], elapsed
+
+
+def run_order_log(directory, threads, orders, line_count, max_batch):
+    order_log = OrderLog(os.path.join(directory, f"orders-t{threads}-b{max_batch}.sqlite3"), max_batch=max_batch)
+    lines = _lines(line_count)
+    total = sum(line['price'] for line in lines)
+    try:
+        latencies, elapsed = _run_threads(
+            threads, max(1, orders // threads),
+            lambda: order_log.place('bench-cart', lines, line_count, total, timeout=60.0))
+    finally:
+        order_log.close()
+    return summarize(latencies, elapsed, commits=order_log.commits,
+                     orders_per_commit=round(order_log.committed / max(1, order_log.commits), 2))
+
+
+def run_checkout_route(directory, threads, orders, line_count):
+    from app import create_app
+
+    app = create_app({
+        'ORDER_DB_PATH': os.path.join(directory, f"route-orders-t{threads}.sqlite3"),
+        'WARMUP_PATHS': [],
+        'GC_FREEZE': False,
+        # Every order comes from this one address
+        'RATE_LIMIT_ENABLED': False,
+        # No stock file: every product untracked, so product 1 never sells out mid-run
+        'INVENTORY_STOCK_PATH': os.devnull,
+    })
+    app.extensions['catalog_source'].stop()
+    order_log = app.extensions['order_log']
+    local = threading.local()
+
+    def one_order():
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+        client.post('/api/cart/lines', json={'lines': [{'id': 1, 'quantity': 1}] * line_count})
+        response = client.get('/checkout-complete')
+        response.get_data()
+        if response.status_code != 200:
+            raise RuntimeError(f"checkout failed with {response.status_code}")
+
+    try:
+        latencies, elapsed = _run_threads(threads, max(1, orders // threads), one_order)
+    finally:
+        order_log.close()
+    return summarize(latencies, elapsed, commits=order_log.commits,
+                     orders_per_commit=round(order_log.committed / max(1, order_log.commits), 2))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark order-log throughput and commit latency.')
+    parser.add_argument('--threads', type=int, nargs='+', default=list(DEFAULT_THREADS))
+    parser.add_argument('--orders', type=int, default=2000, help='Orders per scenario (split across threads)')
+    parser.add_argument('--lines', type=int, default=3, help='Lines per order')
+    parser.add_argument('--max-batch', type=int, default=256, help='Group-commit batch limit')
+    parser.add_argument('--route-orders', type=int, default=500,
+                        help='Orders per /checkout-complete scenario (0 to skip)')
+    parser.add_argument('--save', metavar='PATH', help='Write results as a JSON baseline')
+    parser.add_argument('--compare', metavar='PATH', help='Fail if results regress against this baseline')
+    parser.add_argument('--tolerance', type=float, default=1.0, help='Scale all regression thresholds')
+    args = parser.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='tn-orders-') as directory:
+        for threads in args.threads:
+            for mode, max_batch in (('group_commit', args.max_batch), ('commit_per_order', 1)):
+                results[f"order_log:{mode}:threads={threads}"] = run_order_log(
+                    directory, threads, args.orders, args.lines, max_batch)
+            if args.route_orders:
+                results[f"checkout_route:threads={threads}"] = run_checkout_route(
+                    directory, threads, args.route_orders, args.lines)
+
+    report(results)
+    if args.save:
+        save_results(args.save, results)
+        print(f"Saved results to {args.save}")
+    if args.compare:
+        regressions = compare(load_results(args.compare), results, tolerance=args.tolerance)
+        if regressions:
+            print("\nREGRESSIONS:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nNo regressions against baseline.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+What a throttled cart request costs compared to one that goes through.
+
+    python -m benchmarks.bench_rate_limit
+    python -m benchmarks.bench_rate_limit --requests 5000 --keys 1000000
+
+Scenarios:
+
+    limiter:take            TokenBucketLimiter.take over --keys distinct keys
+                            with the default bucket cap, so once the cap is
+                            reached every new key evicts one
+    route:allowed           POST /add-premade-to-cart-ajax/<id> through the
+                            Flask test client with the limiter out of the way
+    route:rejected          the same request from a client whose buckets are
+                            empty: answered 429 by the middleware
+
+Each route run also checks that a fresh client gets exactly its session
+burst through before the first 429, and that the 429 carries Retry-After.
+--save / --compare work as in bench_routes.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.common import compare, load_results, report, save_results, summarize
+
+import rate_limit
+
+
+def run_take(keys, max_buckets):
+    limiter = rate_limit.TokenBucketLimiter(rate=2.0, burst=20, max_buckets=max_buckets)
+    names = [f"10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}" for index in range(keys)]
+    latencies = []
+    started = time.perf_counter()
+    for name in names:
+        before = time.perf_counter()
+        limiter.take(name)
+        latencies.append(time.perf_counter() - before)
+    elapsed = time.perf_counter() - started
+    return summarize(latencies, elapsed, buckets=len(limiter))
+
+
+def _time_requests(client, path, requests):
+    latencies = []
+    statuses = set()
+    started = time.perf_counter()
+    for _ in range(requests):
+        before = time.perf_counter()
+        response = client.post(path)
+        response.get_data()
+        latencies.append(time.perf_counter() - before)
+        statuses.add(response.status_code)
+    return latencies, time.perf_counter() - started, statuses
+
+
+def run_routes(app, requests):
+    limiter = app.extensions['rate_limit']
+    path = '/add-premade-to-cart-ajax/1'
+    results = {}
+
+    limiter.enabled = False
+    client = app.test_client()
+    latencies, elapsed, statuses = _time_requests(client, path, requests)
+    results['route:allowed'] = summarize(latencies, elapsed, statuses=sorted(statuses))
+
+    limiter.enabled = True
+    burst = app.config['RATE_LIMIT_SESSION_BURST']
+    client = app.test_client()
+    # The first add creates the cart, and with it the session cookie the session bucket is keyed on
+    client.post(path)
+    allowed = 0
+    response = None
+    for _ in range(burst + 1):
+        response = client.post(path)
+        if response.status_code == 429:
+            break
+        allowed += 1
+    retry_after = response.headers.get('Retry-After')
+    latencies, elapsed, statuses = _time_requests(client, path, requests)
+    results['route:rejected'] = summarize(latencies, elapsed, statuses=sorted(statuses),
+                                          allowed_before_429=allowed, retry_after=retry_after)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure the cost of rate-limited and allowed cart requests.')
+    parser.add_argument('--requests', type=int, default=2000, help='Requests per route scenario')
+    parser.add_argument('--keys', type=int, default=300000, help='Distinct keys for the limiter scenario')
+    parser.add_argument('--max-buckets', type=int, default=100000, help='Bucket cap for the limiter scenario')
+    parser.add_argument('--save', metavar='PATH', help='Write results as a JSON baseline')
+    parser.add_argument('--compare', metavar='PATH', help='Fail if results regress against this baseline')
+    parser.add_argument('--tolerance', type=float, default=1.0, help='Scale all regression thresholds')
+    args = parser.parse_args(argv)
+
+    from app import create_app
+
+    results = {'limiter:take': run_take(args.keys, args.max_buckets)}
+    with tempfile.TemporaryDirectory(prefix='tn-ratelimit-') as directory:
+        app = create_app({
+            'ORDER_DB_PATH': os.path.join(directory, 'orders.sqlite3'),
+            'SIMILAR_INDEX_PATH': os.path.join(directory, 'terra.similar'),
+            'WARMUP_PATHS': [],
+            'GC_FREEZE': False,
+            # Slow refill, so the rejected run stays rejected
+            'RATE_LIMIT_SESSION_RATE': 0.01,
+            'RATE_LIMIT_IP_BURST': 1000000,
+            # No stock file: every product untracked, so allowed adds never sell out
+            'INVENTORY_STOCK_PATH': os.devnull,
+        })
+        results.update(run_routes(app, args.requests))
+        app.extensions['order_log'].close()
+
+    report(results)
+    if args.save:
+        save_results(args.save, results)
+        print(f"Saved results to {args.save}")
+    rejected = results['route:rejected']
+    if rejected['statuses'] != [429] or rejected['allowed_before_429'] != app.config['RATE_LIMIT_SESSION_BURST'] \
+            or not rejected['retry_after']:
+        print("\nFAILED: throttled client was not limited as configured")
+        sys.exit(1)
+    print("\nThrottled client got its burst, then 429 with Retry-After.")
+    if args.compare:
+        regressions = compare(load_results(args.compare), results, tolerance=args.tolerance)
+        if regressions:
+            print("\nREGRESSIONS:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("No regressions against baseline.")
+
+
+if __name__ == '__main__':
+    main()
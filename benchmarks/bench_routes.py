@@ -0,0 +1,263 @@
+"""
+Route-level benchmarks and load tests.
+
+In-process (Flask test client, no network):
+
+    python -m benchmarks.bench_routes
+    python -m benchmarks.bench_routes --sizes 20 1000 100000 --requests 500
+
+Against a locally started multi-worker server (gunicorn when installed,
+otherwise a threaded werkzeug server):
+
+    python -m benchmarks.bench_routes --server --workers 4 --concurrency 16
+
+Results are printed and can be saved as a JSON baseline, then compared on
+later runs; any metric that regresses past its threshold fails the run:
+
+    python -m benchmarks.bench_routes --save benchmarks/baselines/routes.json
+    python -m benchmarks.bench_routes --compare benchmarks/baselines/routes.json
+
+Reported per scenario: throughput, p50/p95/p99 latency, tracemalloc peak
+bytes per request, and response and session-cookie sizes.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from urllib.parse import urlencode
+
+from benchmarks.common import (
+    ROOT_DIR, compare, install_catalog, load_results, random_build_form, report,
+    save_results, summarize, synthetic_catalog,
+)
+
+DEFAULT_SIZES = (20, 1000, 10000, 100000)
+DEFAULT_CART_LINES = (1, 20, 200)
+ALLOC_SAMPLE_REQUESTS = 20
+
+
+# --- Scenarios ---
+def scenarios(catalog_size, cart_lines):
+    """(name, method, path, body factory, cart lines to prefill) for one catalog size."""
+    rng = random.Random(catalog_size)
+    specs = [
+        ('home', 'GET', '/', None, 0),
+        ('shop', 'GET', '/shop', None, 0),
+        ('api_products_page', 'GET', '/api/products?sort=price&limit=24', None, 0),
+        ('add_premade_to_cart_ajax', 'POST',
+         lambda: f"/add-premade-to-cart-ajax/{rng.randint(1, catalog_size)}", None, 0),
+        ('build_summary', 'POST', '/build-summary', lambda: urlencode(random_build_form(rng)), 0),
+    ]
+    for lines in cart_lines:
+        if lines <= catalog_size:
+            specs.append((f"view_cart:lines={lines}", 'GET', '/cart', None, lines))
+    return specs
+
+
+def _prefill_lines(lines):
+    return [{'id': product_id, 'quantity': 1} for product_id in range(1, lines + 1)]
+
+
+def _cookie_bytes(client):
+    return sum(len(cookie.key) + len(cookie.value) + 1 for cookie in client._cookies.values())
+
+
+# --- In-process runner ---
+def run_in_process(app, sizes, cart_lines, requests_per_scenario):
+    results = {}
+    for size in sizes:
+        install_catalog(app, synthetic_catalog(size))
+        for name, method, path, body_factory, prefill in scenarios(size, cart_lines):
+            client = app.test_client()
+            if prefill:
+                client.post('/api/cart/lines', json={'lines': _prefill_lines(prefill)})
+
+            def one_request():
+                url = path() if callable(path) else path
+                if method == 'GET':
+                    return client.get(url)
+                return client.post(url, data=body_factory() if body_factory else None,
+                                   content_type='application/x-www-form-urlencoded')
+
+            one_request().get_data()  # warm-up: template compile, page cache fill
+            latencies = []
+            started = time.perf_counter()
+            for _ in range(requests_per_scenario):
+                request_started = time.perf_counter()
+                response = one_request()
+                response.get_data()
+                latencies.append(time.perf_counter() - request_started)
+            elapsed = time.perf_counter() - started
+
+            # Separate pass: tracemalloc slows everything down, so it doesn't touch the timings.
+            tracemalloc.start()
+            peaks = []
+            for _ in range(ALLOC_SAMPLE_REQUESTS):
+                tracemalloc.reset_peak()
+                baseline, _ = tracemalloc.get_traced_memory()
+                one_request().get_data()
+                peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+            tracemalloc.stop()
+
+            results[f"in_process:{name}:products={size}"] = summarize(
+                latencies, elapsed,
+                status=response.status_code,
+                alloc_peak_bytes=sorted(peaks)[len(peaks) // 2],
+                response_bytes=len(response.get_data()),
+                cookie_bytes=_cookie_bytes(client),
+            )
+    return results
+
+
+# --- Multi-worker server runner ---
+def start_server(size, port, workers, cart_db):
+    env = dict(os.environ, BENCH_PRODUCTS=str(size), BENCH_PORT=str(port), BENCH_CART_DB=cart_db)
+    try:
+        import gunicorn  # noqa: F401
+        command = [sys.executable, '-m', 'gunicorn', '-w', str(workers), '-b', f"127.0.0.1:{port}",
+                   '--log-level', 'warning', 'benchmarks.serve:application']
+    except ImportError:
+        print("gunicorn not installed: falling back to a single-process threaded werkzeug server.")
+        command = [sys.executable, '-m', 'benchmarks.serve']
+
+    process = subprocess.Popen(command, cwd=ROOT_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/api/products?limit=1')
+            conn.getresponse().read()
+            conn.close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError('Benchmark server did not start within 60s')
+
+
+class _HttpSession:
+    """Keep-alive connection that carries its own cookies, like one browser."""
+
+    def __init__(self, port):
+        self.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        self.cookie = None
+
+    def request(self, method, path, body=None, content_type=None):
+        headers = {}
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        if content_type:
+            headers['Content-Type'] = content_type
+        self.conn.request(method, path, body=body, headers=headers)
+        response = self.conn.getresponse()
+        payload = response.read()
+        set_cookie = response.getheader('Set-Cookie')
+        if set_cookie:
+            self.cookie = set_cookie.split(';', 1)[0]
+        return response.status, payload
+
+
+def run_against_server(sizes, cart_lines, requests_per_scenario, workers, concurrency, port):
+    results = {}
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            process = start_server(size, port, workers, os.path.join(tmp, 'carts.sqlite3'))
+            try:
+                for name, method, path, body_factory, prefill in scenarios(size, cart_lines):
+                    sessions = [_HttpSession(port) for _ in range(concurrency)]
+                    if prefill:
+                        for session in sessions:
+                            session.request('POST', '/api/cart/lines',
+                                            json.dumps({'lines': _prefill_lines(prefill)}), 'application/json')
+
+                    latencies = []
+                    sizes_seen = []
+                    lock = threading.Lock()
+                    per_worker = max(1, requests_per_scenario // concurrency)
+
+                    def worker(session):
+                        local = []
+                        for _ in range(per_worker):
+                            url = path() if callable(path) else path
+                            body = body_factory() if body_factory else None
+                            content_type = 'application/x-www-form-urlencoded' if method == 'POST' else None
+                            started = time.perf_counter()
+                            _, payload = session.request(method, url, body, content_type)
+                            local.append(time.perf_counter() - started)
+                            last_size = len(payload)
+                        with lock:
+                            latencies.extend(local)
+                            sizes_seen.append(last_size)
+
+                    threads = [threading.Thread(target=worker, args=(s,)) for s in sessions]
+                    started = time.perf_counter()
+                    for thread in threads:
+                        thread.start()
+                    for thread in threads:
+                        thread.join()
+                    elapsed = time.perf_counter() - started
+
+                    results[f"server:w={workers}:c={concurrency}:{name}:products={size}"] = summarize(
+                        latencies, elapsed,
+                        response_bytes=max(sizes_seen),
+                        cookie_bytes=len(sessions[0].cookie or ''),
+                    )
+            finally:
+                process.terminate()
+                process.wait(timeout=10)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the shop routes.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help='Synthetic catalog sizes')
+    parser.add_argument('--cart-lines', type=int, nargs='+', default=list(DEFAULT_CART_LINES))
+    parser.add_argument('--requests', type=int, default=200, help='Timed requests per scenario')
+    parser.add_argument('--server', action='store_true', help='Load-test a locally started server instead')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--save', metavar='PATH', help='Write results as a JSON baseline')
+    parser.add_argument('--compare', metavar='PATH', help='Fail if results regress against this baseline')
+    parser.add_argument('--tolerance', type=float, default=1.0, help='Scale all regression thresholds')
+    args = parser.parse_args(argv)
+
+    if args.server:
+        results = run_against_server(args.sizes, args.cart_lines, args.requests,
+                                     args.workers, args.concurrency, args.port)
+    else:
+        from app import create_app
+        with tempfile.TemporaryDirectory(prefix='tn-routes-') as directory:
+            # Synthetic catalogs get their own similarity index, not the one next to terra.csv
+            # Every scenario hits the cart endpoints from one address, far past any rate limit
+            app = create_app({'SIMILAR_INDEX_PATH': os.path.join(directory, 'terra.similar'),
+                              'RATE_LIMIT_ENABLED': False,
+                              # No stock file: the scenarios add the same products thousands of times
+                              'INVENTORY_STOCK_PATH': os.devnull})
+            results = run_in_process(app, args.sizes, args.cart_lines, args.requests)
+
+    report(results)
+    if args.save:
+        save_results(args.save, results)
+        print(f"Saved results to {args.save}")
+    if args.compare:
+        regressions = compare(load_results(args.compare), results, tolerance=args.tolerance)
+        if regressions:
+            print("\nREGRESSIONS:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nNo regressions against baseline.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Build time and lookup latency of the "similar terrariums" index.
+
+    python -m benchmarks.bench_similar
+    python -m benchmarks.bench_similar --sizes 1000 10000 100000 --k 8
+
+For each synthetic catalog size the index is built from scratch
+(vectorize_seconds, neighbours_seconds, index_bytes), then --lookups random
+neighbour lists are read through the memory-mapped index the app serves
+from. throughput_rps and the percentiles are for those lookups.
+
+Every build is also checked against brute force on --check-rows sampled
+products: their full score rows are ranked exactly and must give the same
+neighbours, ties included. A mismatch fails the run.
+--save / --compare work as in bench_routes.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks.common import compare, load_results, report, save_results, summarize, synthetic_catalog
+
+import similar
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+
+
+def exact_neighbours(matrix, rows, k):
+    """Brute-force reference for `similar.nearest` on a few rows."""
+    np = similar.np
+    expected = {}
+    for row in rows:
+        scores = matrix @ matrix[row]
+        scores[row] = -1.0
+        columns = np.arange(len(scores))
+        order = np.lexsort((columns, -scores))
+        expected[row] = [int(column) for column in order[:k] if scores[column] > 0]
+    return expected
+
+
+def check_sample(products, index, k, rows):
+    """Sampled products whose stored neighbours differ from brute force."""
+    ids, documents = similar._documents(products)
+    matrix = similar.vectorize(documents)
+    mismatches = 0
+    for row, expected in exact_neighbours(matrix, rows, k).items():
+        if index.neighbours(ids[row]) != [ids[column] for column in expected]:
+            mismatches += 1
+    return mismatches
+
+
+def run_size(directory, size, k, lookups, check_rows):
+    catalog = synthetic_catalog(size)
+    path = os.path.join(directory, f"similar-{size}.bin")
+    started = time.perf_counter()
+    timings = similar.build(catalog, catalog.version, path, k)
+    build_seconds = time.perf_counter() - started
+    index = similar.open_index(path, catalog.version)
+
+    rng = random.Random(size)
+    product_ids = [product.id for product in catalog]
+    targets = [rng.choice(product_ids) for _ in range(lookups)]
+    latencies = []
+    started = time.perf_counter()
+    for product_id in targets:
+        before = time.perf_counter()
+        index.neighbours(product_id)
+        latencies.append(time.perf_counter() - before)
+    elapsed = time.perf_counter() - started
+
+    rows = rng.sample(range(size), min(size, check_rows))
+    mismatches = check_sample(catalog, index, k, rows)
+    return summarize(latencies, elapsed,
+                     build_seconds=round(build_seconds, 3),
+                     vectorize_seconds=round(timings['vectorize_seconds'], 3),
+                     neighbours_seconds=round(timings['neighbours_seconds'], 3),
+                     index_bytes=timings['index_bytes'],
+                     mismatches=mismatches)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the similar-products index build and lookups.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES))
+    parser.add_argument('--k', type=int, default=similar.DEFAULT_K)
+    parser.add_argument('--lookups', type=int, default=20000, help='Neighbour lookups per size')
+    parser.add_argument('--check-rows', type=int, default=200, help='Products checked against brute force')
+    parser.add_argument('--save', metavar='PATH', help='Write results as a JSON baseline')
+    parser.add_argument('--compare', metavar='PATH', help='Fail if results regress against this baseline')
+    parser.add_argument('--tolerance', type=float, default=1.0, help='Scale all regression thresholds')
+    args = parser.parse_args(argv)
+
+    similar._require_numpy()
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='tn-similar-') as directory:
+        for size in args.sizes:
+            results[f"similar:products={size}"] = run_size(directory, size, args.k, args.lookups, args.check_rows)
+
+    report(results)
+    if args.save:
+        save_results(args.save, results)
+        print(f"Saved results to {args.save}")
+    mismatches = sum(result['mismatches'] for result in results.values())
+    if mismatches:
+        print(f"\nMISMATCHES: {mismatches} sampled products differ from brute force")
+        sys.exit(1)
+    print("\nSampled neighbour lists match brute force.")
+    if args.compare:
+        regressions = compare(load_results(args.compare), results, tolerance=args.tolerance)
+        if regressions:
+            print("\nREGRESSIONS:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("No regressions against baseline.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""
+Stress test for stock reservations: no overselling, and how reservations/s
+scale with threads.
+
+    python -m benchmarks.bench_stock
+    python -m benchmarks.bench_stock --threads 1 4 16 64 --ops 20000 --backend sqlite
+
+Every thread plays shoppers: reserve one unit, then check out (half the
+time), put it back (a quarter) or abandon the cart so the reservation
+lapses after --ttl seconds. Two workloads:
+
+    hot      every thread buys the same product (a flash sale); stock is a
+             fraction of the attempts, so most of them must fail
+    spread   products picked at random from --products
+
+The memory ledger runs sharded (INVENTORY_SHARDS) and with a single lock
+for comparison. throughput_rps is reservation attempts per second. After
+each run the books are checked: units sold never exceed the starting
+stock, and stock on hand = start - sold. Any oversell fails the run.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.common import compare, load_results, report, save_results, summarize
+
+from inventory import MemoryStockLedger, OutOfStock, SqliteStockLedger
+
+DEFAULT_THREADS = (1, 2, 4, 8, 16, 32)
+
+
+def run_scenario(ledger, threads, ops, products, stock):
+    """Returns (latencies, elapsed, granted, sold per product)."""
+    per_thread = max(1, ops // threads)
+    latencies = [[] for _ in range(threads)]
+    granted = [0] * threads
+    sold = [dict() for _ in range(threads)]
+    barrier = threading.Barrier(threads + 1)
+
+    def shopper(index):
+        rng = random.Random(index)
+        samples, my_sold = latencies[index], sold[index]
+        barrier.wait()
+        for op in range(per_thread):
+            product_id = rng.choice(products)
+            cart_id = f"t{index}-{op}"
+            started = time.perf_counter()
+            try:
+                ledger.reserve(product_id, cart_id, 1)
+            except OutOfStock:
+                samples.append(time.perf_counter() - started)
+                continue
+            samples.append(time.perf_counter() - started)
+            granted[index] += 1
+            roll = rng.random()
+            if roll < 0.5:
+                try:
+                    ledger.commit(cart_id, [(product_id, 1)])
+                    my_sold[product_id] = my_sold.get(product_id, 0) + 1
+                except OutOfStock:
+                    pass  # lapsed and resold meanwhile: correct, just unlucky
+            elif roll < 0.75:
+                ledger.release(product_id, cart_id)
+
+    workers = [threading.Thread(target=shopper, args=(index,)) for index in range(threads)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    totals = {}
+    for per_thread_sold in sold:
+        for product_id, units in per_thread_sold.items():
+            totals[product_id] = totals.get(product_id, 0) + units
+    return [latency for samples in latencies for latency in samples], elapsed, sum(granted), totals
+
+
+def check_books(ledger, stock, sold):
+    """Units oversold across all products (0 when the books balance)."""
+    oversold = 0
+    for product_id, start in stock.items():
+        units_sold = sold.get(product_id, 0)
+        oversold += max(0, units_sold - start)
+        # Nothing reserved may outlive the run's TTL, so on hand is what's available.
+        on_hand = ledger.available(product_id)
+        if on_hand != start - units_sold:
+            print(f"  books don't balance for product {product_id}: start {start}, sold {units_sold}, "
+                  f"available {on_hand}")
+            oversold += abs(start - units_sold - on_hand)
+    return oversold
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Stress-test stock reservations.')
+    parser.add_argument('--threads', type=int, nargs='+', default=list(DEFAULT_THREADS))
+    parser.add_argument('--ops', type=int, default=20000, help='Reservation attempts per scenario')
+    parser.add_argument('--products', type=int, default=1000, help='Products in the spread workload')
+    parser.add_argument('--backend', choices=('memory', 'sqlite'), default='memory')
+    parser.add_argument('--shards', type=int, default=64)
+    parser.add_argument('--ttl', type=float, default=0.05, help='Reservation TTL in seconds')
+    parser.add_argument('--save', metavar='PATH', help='Write results as a JSON baseline')
+    parser.add_argument('--compare', metavar='PATH', help='Fail if results regress against this baseline')
+    parser.add_argument('--tolerance', type=float, default=1.0, help='Scale all regression thresholds')
+    args = parser.parse_args(argv)
+
+    results = {}
+    oversold_total = 0
+    with tempfile.TemporaryDirectory(prefix='tn-stock-') as directory:
+        for workload in ('hot', 'spread'):
+            products = [1] if workload == 'hot' else list(range(1, args.products + 1))
+            # The hot product sells out after a tenth of the attempts; spread products never run dry.
+            stock = {product_id: args.ops // 10 if workload == 'hot' else args.ops for product_id in products}
+            if args.backend == 'memory':
+                variants = [(f"shards={args.shards}", args.shards), ('single_lock', 1)]
+            else:
+                variants = [('sqlite', None)]
+            for threads in args.threads:
+                for variant, shards in variants:
+                    if args.backend == 'memory':
+                        ledger = MemoryStockLedger(stock, ttl=args.ttl, shards=shards)
+                    else:
+                        path = os.path.join(directory, f"{workload}-{threads}.sqlite3")
+                        ledger = SqliteStockLedger(path, stock, ttl=args.ttl)
+                    latencies, elapsed, granted, sold = run_scenario(ledger, threads, args.ops, products, stock)
+                    time.sleep(args.ttl)  # let abandoned reservations lapse before the books are checked
+                    oversold = check_books(ledger, stock, sold)
+                    oversold_total += oversold
+                    results[f"stock:{workload}:{variant}:threads={threads}"] = summarize(
+                        latencies, elapsed, granted=granted, sold=sum(sold.values()), oversold=oversold)
+
+    report(results)
+    if args.save:
+        save_results(args.save, results)
+        print(f"Saved results to {args.save}")
+    if oversold_total:
+        print(f"\nOVERSOLD: {oversold_total} units")
+        sys.exit(1)
+    print("\nNo overselling: every product's books balance.")
+    if args.compare:
+        regressions = compare(load_results(args.compare), results, tolerance=args.tolerance)
+        if regressions:
+            print("\nREGRESSIONS:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("No regressions against baseline.")
+
+
+if __name__ == '__main__':
+    main()
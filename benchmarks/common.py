@@ -0,0 +1,160 @@
+"""
+Shared helpers for the benchmark suite: synthetic catalogs, latency
+statistics and JSON baselines with regression checks.
+"""
+import csv
+import hashlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+import data  # noqa: E402  (needs ROOT_DIR on sys.path)
+
+BASELINE_DIR = os.path.join(ROOT_DIR, 'benchmarks', 'baselines')
+
+# --- Synthetic catalogs ---
+_ADJECTIVES = ['Mini', 'Majestic', 'Zen', 'Misty', 'Desert', 'Tropical', 'Hanging', 'Geometric', 'Classic', 'Rustic']
+_PLANTS = ['Jade Plant', 'Succulent', 'Moss', 'Fern', 'Syngonium', 'Money Plant', 'Cactus', 'Bonsai', 'Air Plant', 'Fittonia']
+_VESSELS = ['Glass Vase', 'Mason Jar', 'Bowl', 'Cube', 'Globe', 'Bottle', 'Teardrop', 'Lantern']
+_OCCASIONS = ['a birthday gift', 'your desk', 'a housewarming', 'an anniversary', 'the living room', 'a gift']
+
+
+def synthetic_csv(count, seed=42):
+    """terra.csv-formatted text with `count` plausible products."""
+    rng = random.Random(seed)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['Name', 'Sale Price', 'Original Price (₹)', 'Short Description', 'image_url'])
+    for index in range(count):
+        plant = rng.choice(_PLANTS)
+        vessel = rng.choice(_VESSELS)
+        price = rng.randrange(199, 4999)
+        original = price + rng.choice([0, 0, 100, 300, 500, 1000])
+        writer.writerow([
+            f"{rng.choice(_ADJECTIVES)} {plant} Terrarium In {vessel} #{index + 1}",
+            f"{price:,}",
+            f"{original:,}",
+            f"A {plant} arranged in a {vessel.lower()}, perfect for {rng.choice(_OCCASIONS)}.",
+            'default.jpg',
+        ])
+    return buffer.getvalue()
+
+
+def synthetic_catalog(count, seed=42):
+    """Builds a Catalog snapshot through the same parser the app uses for terra.csv."""
+    raw = synthetic_csv(count, seed).encode('utf-8')
+    return data.build_catalog(raw, version=hashlib.sha1(raw).hexdigest())
+
+
+def install_catalog(app, snapshot):
+    """
+    Makes `snapshot` the catalog every subsequent request to `app` sees,
+    with the indexes derived from it (search, facets, similar) rebuilt.
+    """
+    source = app.extensions['catalog_source']
+    source.stop()
+    source.install(snapshot)
+
+
+def random_build_form(rng):
+    """A realistic /build-summary post: one choice per single step, 0-3 per multi step."""
+    form = []
+    for group in data.COMPONENTS.groups:
+        if group.multiple:
+            picks = rng.sample(group.components, rng.randint(0, min(3, len(group.components))))
+        else:
+            picks = [rng.choice(group.components)]
+        form.extend((group.field, component.id) for component in picks)
+    return form
+
+
+# --- Statistics ---
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(latencies, elapsed, **extra):
+    latencies = sorted(latencies)
+    result = {
+        'requests': len(latencies),
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed > 0 else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+    }
+    result.update(extra)
+    return result
+
+
+# --- Baselines ---
+# metric -> (direction, allowed relative change). 'higher' means bigger is better.
+DEFAULT_THRESHOLDS = {
+    'throughput_rps': ('higher', 0.20),
+    'p50_ms': ('lower', 0.25),
+    'p95_ms': ('lower', 0.25),
+    'p99_ms': ('lower', 0.35),
+    'alloc_peak_bytes': ('lower', 0.15),
+    'response_bytes': ('lower', 0.10),
+    'cookie_bytes': ('lower', 0.10),
+}
+
+
+def run_metadata():
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def save_results(path, results):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump({'meta': run_metadata(), 'results': results}, file, indent=2, sort_keys=True)
+
+
+def load_results(path):
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)['results']
+
+
+def compare(baseline, current, thresholds=DEFAULT_THRESHOLDS, tolerance=1.0):
+    """
+    Returns a list of human-readable regressions of `current` against
+    `baseline`. `tolerance` scales every threshold (e.g. 2.0 on noisy CI).
+    """
+    regressions = []
+    for scenario, base_metrics in sorted(baseline.items()):
+        metrics = current.get(scenario)
+        if metrics is None:
+            continue
+        for metric, (direction, allowed) in thresholds.items():
+            old = base_metrics.get(metric)
+            new = metrics.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = change < -allowed * tolerance if direction == 'higher' else change > allowed * tolerance
+            if worse:
+                regressions.append(f"{scenario}: {metric} {old} -> {new} ({change:+.0%}, allowed {allowed * tolerance:.0%})")
+    return regressions
+
+
+def report(results):
+    for scenario, metrics in sorted(results.items()):
+        details = ' '.join(f"{key}={value}" for key, value in sorted(metrics.items()))
+        print(f"{scenario:<48} {details}")
@@ -0,0 +1,31 @@
+"""
+WSGI entry point for load tests against a real server.
+
+    BENCH_PRODUCTS=10000 gunicorn -w 4 -b 127.0.0.1:8099 benchmarks.serve:application
+
+installs a synthetic catalog of BENCH_PRODUCTS products and switches the
+cart to the SQLite backend (shared by all workers; path from BENCH_CART_DB).
+bench_routes.py starts this automatically with --server.
+"""
+import os
+
+from benchmarks.common import install_catalog, synthetic_catalog
+
+from app import create_app
+
+application = create_app({
+    'CART_BACKEND': 'sqlite',
+    'CART_DB_PATH': os.environ.get('BENCH_CART_DB', 'bench_carts.sqlite3'),
+    # The load generator is a single client hammering the cart endpoints
+    'RATE_LIMIT_ENABLED': False,
+    # No stock file: synthetic products are untracked and never sell out
+    'INVENTORY_STOCK_PATH': os.devnull,
+})
+install_catalog(application, synthetic_catalog(int(os.environ.get('BENCH_PRODUCTS', '1000'))))
+
+
+if __name__ == '__main__':
+    # Fallback when gunicorn isn't installed: one process, many threads.
+    from werkzeug.serving import run_simple
+
+    run_simple('127.0.0.1', int(os.environ.get('BENCH_PORT', '8099')), application, threaded=True)
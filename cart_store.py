@@ -0,0 +1,434 @@
+"""
+Server-side cart storage.
+
+The session cookie only carries a cart id; the lines live in a pluggable
+backend. Adding the same product twice merges into one line with a higher
+quantity, and every Cart keeps a running count and total so the header
+badge and the cart page never re-sum the lines.
+
+Backends:
+    MemoryCartStore  - in-process LRU with TTL eviction (default)
+    SqliteCartStore  - shared across worker processes via a SQLite file
+
+Both backends also keep idempotency records for cart mutations: the first
+request with a given key claims it, and retries get the stored response.
+
+A Cart remembers the changes made to it since it was loaded. The SQLite
+store writes a cart only if nobody saved it in between (a version column),
+and otherwise replays those changes on the newer copy and tries again, so
+two workers adding to one cart at once both land.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from flask import current_app, g, session
+
+
+# --- Cart model ---
+class Cart:
+    """Ordered cart lines keyed by line key, with cached count and total."""
+
+    __slots__ = ('id', 'lines', 'count', 'total', 'updated_at', 'version', 'changes', '_lock')
+
+    def __init__(self, cart_id, lines=None, updated_at=None, version=None):
+        self.id = cart_id
+        self.updated_at = updated_at or time.time()
+        # Stored version this copy was loaded at (None: never saved)
+        self.version = version
+        # (method name, args) applied since it was loaded, for SqliteCartStore to replay
+        self.changes = []
+        self._lock = threading.Lock()
+        self._reset(lines)
+
+    def _reset(self, lines):
+        self.lines = OrderedDict()
+        self.count = 0
+        self.total = 0.0
+        for line in lines or ():
+            self._merge(dict(line), line['quantity'])
+
+    def _merge(self, line, quantity):
+        existing = self.lines.get(line['key'])
+        if existing is None:
+            line['quantity'] = quantity
+            self.lines[line['key']] = line
+        else:
+            existing['quantity'] += quantity
+        self.count += quantity
+        self.total += line['price'] * quantity
+
+    def add(self, key, item_type, name, price, quantity=1, item_id=None):
+        """Adds `quantity` units, merging into an existing line with the same key."""
+        line = {'key': key, 'id': item_id, 'type': item_type, 'name': name, 'price': price}
+        with self._lock:
+            self._merge(line, quantity)
+            self.updated_at = time.time()
+            self.changes.append(('add', (key, item_type, name, price, quantity, item_id)))
+
+    def remove_line(self, index):
+        """Removes the whole line at display position `index`. Returns True if removed."""
+        with self._lock:
+            if not 0 <= index < len(self.lines):
+                return False
+            self._remove_key(list(self.lines)[index])
+            return True
+
+    def remove_key(self, key):
+        """Removes the line with `key`, wherever it is. Returns True if there was one."""
+        with self._lock:
+            return self._remove_key(key)
+
+    def _remove_key(self, key):
+        line = self.lines.pop(key, None)
+        if line is not None:
+            self.count -= line['quantity']
+            self.total -= line['price'] * line['quantity']
+            if not self.lines:
+                # Avoid carrying float residue into an empty cart.
+                self.total = 0.0
+        self.updated_at = time.time()
+        # Replayed by key: on a newer copy the line may sit at another position.
+        self.changes.append(('remove_key', (key,)))
+        return line is not None
+
+    def clear(self):
+        with self._lock:
+            self.lines.clear()
+            self.count = 0
+            self.total = 0.0
+            self.updated_at = time.time()
+            self.changes.append(('clear', ()))
+
+    def rebase(self, newer):
+        """Replaces this copy's contents with `newer` (a fresh load, or None) plus the changes made here."""
+        changes = self.changes
+        with self._lock:
+            self._reset(newer.items() if newer is not None else ())
+            self.version = newer.version if newer is not None else None
+            self.changes = []
+        for method, args in changes:
+            getattr(self, method)(*args)
+
+    def items(self):
+        """Cart lines in insertion order, as dicts the templates can render."""
+        return list(self.lines.values())
+
+    def to_json(self):
+        return json.dumps(list(self.lines.values()))
+
+    @classmethod
+    def from_json(cls, cart_id, payload, updated_at=None, version=None):
+        return cls(cart_id, json.loads(payload), updated_at=updated_at, version=version)
+
+
+def premade_line_key(product_id):
+    return f"premade:{product_id}"
+
+
+def custom_line_key(component_ids):
+    # Only identical builds (the same components, in any order) merge into one line.
+    return "custom:" + ",".join(sorted(str(component_id) for component_id in component_ids))
+
+
+# Idempotency claim states returned by claim_idempotency_key()
+CLAIMED = 'claimed'
+IN_PROGRESS = 'in_progress'
+
+
+# --- Backends ---
+class MemoryCartStore:
+    """In-process LRU cart store. Carts idle for longer than `ttl` seconds are evicted."""
+
+    def __init__(self, max_carts=10000, ttl=7 * 24 * 3600, idempotency_ttl=600, max_idempotency_keys=50000):
+        self.max_carts = max_carts
+        self.ttl = ttl
+        self.idempotency_ttl = idempotency_ttl
+        self.max_idempotency_keys = max_idempotency_keys
+        self._carts = OrderedDict()
+        # (cart id, key) -> (created_at, stored response or None while in progress)
+        self._idempotency = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, cart_id):
+        with self._lock:
+            cart = self._carts.get(cart_id)
+            if cart is None:
+                return None
+            if time.time() - cart.updated_at > self.ttl:
+                del self._carts[cart_id]
+                return None
+            self._carts.move_to_end(cart_id)
+            return cart
+
+    def save(self, cart):
+        # Every request shares this one Cart object, so there's nothing to replay.
+        cart.changes.clear()
+        with self._lock:
+            self._carts[cart.id] = cart
+            self._carts.move_to_end(cart.id)
+            while len(self._carts) > self.max_carts:
+                self._carts.popitem(last=False)
+
+    def delete(self, cart_id):
+        with self._lock:
+            self._carts.pop(cart_id, None)
+
+    def summary(self, cart_id):
+        """Returns (count, total) without materializing the lines."""
+        cart = self.load(cart_id)
+        return (cart.count, cart.total) if cart else (0, 0.0)
+
+    def claim_idempotency_key(self, cart_id, key):
+        """
+        Returns CLAIMED if this request owns `key`, IN_PROGRESS if another
+        request holds it, or the stored response of a finished request.
+        """
+        now = time.time()
+        with self._lock:
+            # Entries are in creation order, so expired ones are at the front.
+            while self._idempotency:
+                oldest_key, (created_at, _) = next(iter(self._idempotency.items()))
+                if now - created_at <= self.idempotency_ttl and len(self._idempotency) < self.max_idempotency_keys:
+                    break
+                del self._idempotency[oldest_key]
+
+            entry = self._idempotency.get((cart_id, key))
+            if entry is None:
+                self._idempotency[(cart_id, key)] = (now, None)
+                return CLAIMED
+            return entry[1] if entry[1] is not None else IN_PROGRESS
+
+    def complete_idempotency_key(self, cart_id, key, response):
+        with self._lock:
+            entry = self._idempotency.get((cart_id, key))
+            if entry is not None:
+                self._idempotency[(cart_id, key)] = (entry[0], response)
+
+    def release_idempotency_key(self, cart_id, key):
+        """Drops a claim whose request failed, so a retry can run it again."""
+        with self._lock:
+            self._idempotency.pop((cart_id, key), None)
+
+
+class SqliteCartStore:
+    """
+    SQLite-backed cart store, shared by every worker that points at the same file.
+
+    The count and total are stored as columns so the header badge is a
+    single indexed read.
+    """
+
+    def __init__(self, path, ttl=7 * 24 * 3600, idempotency_ttl=600):
+        self.path = path
+        self.ttl = ttl
+        self.idempotency_ttl = idempotency_ttl
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS carts ("
+                " id TEXT PRIMARY KEY,"
+                " lines TEXT NOT NULL,"
+                " item_count INTEGER NOT NULL,"
+                " total REAL NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS carts_updated_at ON carts (updated_at)")
+            if 'version' not in {row[1] for row in conn.execute("PRAGMA table_info(carts)")}:
+                conn.execute("ALTER TABLE carts ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS idempotency_keys ("
+                " cart_id TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " response TEXT,"
+                " created_at REAL NOT NULL,"
+                " PRIMARY KEY (cart_id, key))"
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        # Connections must not cross a fork: a forked worker opens its own.
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def load(self, cart_id):
+        row = self._connect().execute(
+            "SELECT lines, updated_at, version FROM carts WHERE id = ? AND updated_at > ?",
+            (cart_id, time.time() - self.ttl),
+        ).fetchone()
+        if row is None:
+            return None
+        return Cart.from_json(cart_id, row[0], updated_at=row[1], version=row[2])
+
+    def save(self, cart, attempts=10):
+        """
+        Writes `cart` if the stored copy is still the version it was loaded
+        at. If another request saved it in between, the changes made to this
+        copy are replayed on the newer one (updating `cart` in place) and the
+        write is tried again.
+        """
+        for _ in range(attempts):
+            values = (cart.to_json(), cart.count, cart.total, cart.updated_at, cart.id)
+            with self._connect() as conn:
+                written = False
+                if cart.version is not None:
+                    written = conn.execute(
+                        "UPDATE carts SET lines = ?, item_count = ?, total = ?, updated_at = ?, version = version + 1"
+                        " WHERE id = ? AND version = ?", values + (cart.version,)).rowcount
+                    version = cart.version + 1
+                if not written:
+                    # New, or purged meanwhile: only the first insert wins.
+                    written = conn.execute(
+                        "INSERT INTO carts (lines, item_count, total, updated_at, id, version) VALUES (?, ?, ?, ?, ?, 1)"
+                        " ON CONFLICT (id) DO NOTHING", values).rowcount
+                    version = 1
+            if written:
+                cart.version = version
+                cart.changes.clear()
+                return
+            cart.rebase(self._load_any(cart.id))
+        raise RuntimeError(f"Could not save cart {cart.id}: too many concurrent updates")
+
+    def _load_any(self, cart_id):
+        """The stored cart, expired or not (a concurrent writer's copy is never stale)."""
+        row = self._connect().execute("SELECT lines, updated_at, version FROM carts WHERE id = ?",
+                                      (cart_id,)).fetchone()
+        return Cart.from_json(cart_id, row[0], updated_at=row[1], version=row[2]) if row else None
+
+    def delete(self, cart_id):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM carts WHERE id = ?", (cart_id,))
+
+    def summary(self, cart_id):
+        row = self._connect().execute(
+            "SELECT item_count, total FROM carts WHERE id = ? AND updated_at > ?",
+            (cart_id, time.time() - self.ttl),
+        ).fetchone()
+        return (row[0], row[1]) if row else (0, 0.0)
+
+    def claim_idempotency_key(self, cart_id, key):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM idempotency_keys WHERE cart_id = ? AND key = ? AND created_at <= ?",
+                (cart_id, key, now - self.idempotency_ttl),
+            )
+            # The primary key makes the insert the atomic claim across workers.
+            claimed = conn.execute(
+                "INSERT OR IGNORE INTO idempotency_keys (cart_id, key, response, created_at) VALUES (?, ?, NULL, ?)",
+                (cart_id, key, now),
+            ).rowcount
+            if claimed:
+                return CLAIMED
+            row = conn.execute(
+                "SELECT response FROM idempotency_keys WHERE cart_id = ? AND key = ?", (cart_id, key)
+            ).fetchone()
+        if row is None or row[0] is None:
+            return IN_PROGRESS
+        return json.loads(row[0])
+
+    def complete_idempotency_key(self, cart_id, key, response):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE idempotency_keys SET response = ? WHERE cart_id = ? AND key = ?",
+                (json.dumps(response), cart_id, key),
+            )
+
+    def release_idempotency_key(self, cart_id, key):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM idempotency_keys WHERE cart_id = ? AND key = ? AND response IS NULL",
+                         (cart_id, key))
+
+    def purge_expired(self):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM carts WHERE updated_at <= ?", (now - self.ttl,))
+            conn.execute("DELETE FROM idempotency_keys WHERE created_at <= ?", (now - self.idempotency_ttl,))
+
+
+# --- Flask integration ---
+def init_app(app):
+    """Creates the configured cart backend and registers it on the app."""
+    app.config.setdefault('CART_BACKEND', 'memory')
+    app.config.setdefault('CART_TTL', 7 * 24 * 3600)
+    app.config.setdefault('CART_MAX_ENTRIES', 10000)
+    app.config.setdefault('CART_DB_PATH', 'carts.sqlite3')
+    # How long a retried mutation with the same Idempotency-Key replays the first response
+    app.config.setdefault('CART_IDEMPOTENCY_TTL', 600)
+
+    backend = app.config['CART_BACKEND']
+    if backend == 'memory':
+        store = MemoryCartStore(max_carts=app.config['CART_MAX_ENTRIES'], ttl=app.config['CART_TTL'],
+                                idempotency_ttl=app.config['CART_IDEMPOTENCY_TTL'])
+    elif backend == 'sqlite':
+        store = SqliteCartStore(app.config['CART_DB_PATH'], ttl=app.config['CART_TTL'],
+                                idempotency_ttl=app.config['CART_IDEMPOTENCY_TTL'])
+    else:
+        raise ValueError(f"Unknown CART_BACKEND {backend!r}")
+
+    app.extensions['cart_store'] = store
+    return store
+
+
+def get_store():
+    return current_app.extensions['cart_store']
+
+
+def get_cart(create=False):
+    """
+    Returns the current visitor's Cart, or None if they don't have one
+    and `create` is False. Cached on `g` for the rest of the request.
+    """
+    cart = g.get('cart')
+    if cart is not None:
+        return cart
+
+    store = get_store()
+    cart_id = session.get('cart_id')
+    if cart_id is not None:
+        cart = store.load(cart_id)
+
+    if cart is None and (create or 'cart' in session):
+        # New visitor (or an expired cart): the cookie changes only here.
+        cart = Cart(uuid.uuid4().hex)
+        session['cart_id'] = cart.id
+
+    # Migrate carts from the old cookie-stored list format.
+    legacy_lines = session.pop('cart', None)
+    if legacy_lines:
+        for line in legacy_lines:
+            if line.get('type') == 'premade':
+                key = premade_line_key(line.get('id'))
+            else:
+                # Old cookie carts kept no component ids: every build stays its own line, as it was.
+                key = f"custom:legacy:{uuid.uuid4().hex}"
+            cart.add(key, line.get('type'), line.get('name'), line.get('price', 0.0),
+                     quantity=line.get('quantity', 1), item_id=line.get('id'))
+        store.save(cart)
+
+    g.cart = cart
+    return cart
+
+
+def save_cart(cart):
+    get_store().save(cart)
+
+
+def cart_summary():
+    """(count, total) for the current visitor, without loading the lines when possible."""
+    cart = g.get('cart')
+    if cart is not None:
+        return cart.count, cart.total
+    cart_id = session.get('cart_id')
+    if cart_id is None:
+        return 0, 0.0
+    return get_store().summary(cart_id)
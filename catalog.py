@@ -0,0 +1,349 @@
+"""
+In-memory product catalog.
+
+Products are held as compact slotted records and indexed by id, by
+normalized name and by price band, so lookups stay constant-time no matter
+how many SKUs are loaded or whether the ids are contiguous.
+
+A Catalog is an immutable snapshot. CatalogReloader watches the source CSV
+and swaps in a fresh snapshot in the background when it changes.
+"""
+import hashlib
+from bisect import bisect_left, bisect_right
+import os
+import threading
+import time
+from collections import namedtuple
+
+
+# --- Product record ---
+class Product:
+    """A single premade terrarium. Slotted to keep per-record memory small."""
+
+    __slots__ = ('id', 'name', 'price', 'original_price', 'description', 'image', 'media')
+
+    def __init__(self, id, name, price, original_price=0.0, description='', image='default.jpg', media=None):
+        # Records are shared across threads via snapshots, so they are write-once.
+        set_field = object.__setattr__
+        set_field(self, 'id', id)
+        set_field(self, 'name', name)
+        set_field(self, 'price', price)
+        set_field(self, 'original_price', original_price)
+        set_field(self, 'description', description)
+        set_field(self, 'image', image)
+        # images.ImageAsset (dimensions + resized variants) when the image pipeline has run
+        set_field(self, 'media', media)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"Product is immutable; cannot set {name!r}")
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            id=int(data['id']),
+            name=data['name'],
+            price=float(data['price']),
+            original_price=float(data.get('original_price', 0.0)),
+            description=data.get('description', ''),
+            image=data.get('image', 'default.jpg'),
+            media=data.get('media'),
+        )
+
+    def to_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    def __eq__(self, other):
+        if not isinstance(other, Product):
+            return NotImplemented
+        return all(getattr(self, slot) == getattr(other, slot) for slot in self.__slots__)
+
+    def __hash__(self):
+        return hash(self.id)
+
+    @property
+    def discount_percent(self):
+        """Percentage off the original price (0 when there is no markdown)."""
+        if self.original_price and self.original_price > self.price:
+            return round((self.original_price - self.price) * 100.0 / self.original_price, 1)
+        return 0.0
+
+    def __repr__(self):
+        return f"Product(id={self.id!r}, name={self.name!r}, price={self.price!r})"
+
+
+def normalize_name(name):
+    """Case- and whitespace-insensitive key used by the name index."""
+    return ' '.join(name.lower().split())
+
+
+# Sort keys exposed to the product API. Ties are always broken by id so
+# every ordering is total and cursors stay stable.
+SORT_KEYS = {
+    'id': lambda product: product.id,
+    'price': lambda product: product.price,
+    'discount': lambda product: product.discount_percent,
+    'name': lambda product: normalize_name(product.name),
+}
+
+
+# --- Catalog ---
+class Catalog:
+    """
+    Immutable collection of products with O(1) lookups.
+
+    Iteration order is the load order of the source data, which is what
+    the shop grid renders.
+    """
+
+    # Width (in ₹) of each bucket in the price-band index.
+    PRICE_BAND_WIDTH = 500
+
+    def __init__(self, products, version=None, loaded_at=None):
+        self._products = tuple(products)
+        # Content hash of the source data; identifies the snapshot to caches.
+        self.version = version or 'static'
+        self.loaded_at = loaded_at if loaded_at is not None else time.time()
+        self._by_id = {}
+        self._by_name = {}
+        self._by_price_band = {}
+        # sort key -> (products in order, [(sort value, id), ...]); built on first use
+        self._orderings = {}
+
+        for product in self._products:
+            self._by_id[product.id] = product
+            self._by_name.setdefault(normalize_name(product.name), []).append(product)
+            self._by_price_band.setdefault(self._band(product.price), []).append(product)
+
+    @classmethod
+    def from_dicts(cls, rows, version=None):
+        return cls((Product.from_dict(row) for row in rows), version=version)
+
+    def _band(self, price):
+        return int(price // self.PRICE_BAND_WIDTH)
+
+    # --- Lookups ---
+    def get(self, product_id):
+        """Returns the product with the given id, or None."""
+        return self._by_id.get(product_id)
+
+    def find_by_name(self, name):
+        """Returns every product whose normalized name matches exactly."""
+        return list(self._by_name.get(normalize_name(name), ()))
+
+    def in_price_range(self, min_price=None, max_price=None):
+        """Returns products priced within [min_price, max_price], using the band index."""
+        if not self._by_price_band:
+            return []
+        # Clamp to the populated bands so open-ended ranges don't walk empty buckets.
+        low_band = min(self._by_price_band)
+        high_band = max(self._by_price_band)
+        if min_price is not None:
+            low_band = max(low_band, self._band(min_price))
+        if max_price is not None:
+            high_band = min(high_band, self._band(max_price))
+
+        matches = []
+        for band in range(low_band, high_band + 1):
+            for product in self._by_price_band.get(band, ()):
+                if min_price is not None and product.price < min_price:
+                    continue
+                if max_price is not None and product.price > max_price:
+                    continue
+                matches.append(product)
+        return matches
+
+    # --- Ordered traversal (pagination) ---
+    def _ordering(self, sort):
+        ordering = self._orderings.get(sort)
+        if ordering is None:
+            key = SORT_KEYS[sort]
+            ordered = sorted(self._products, key=lambda product: (key(product), product.id))
+            ordering = (tuple(ordered), [(key(product), product.id) for product in ordered])
+            # Racing threads build identical orderings, so last write wins harmlessly.
+            self._orderings[sort] = ordering
+        return ordering
+
+    def iter_sorted(self, sort='id', descending=False, after=None):
+        """
+        Yields products in `sort` order, starting just past the position
+        `after` (a (sort value, id) pair from a previous page). Seeking is a
+        binary search, so deep pages cost the same as the first one.
+        """
+        ordered, keys = self._ordering(sort)
+        if descending:
+            end = bisect_left(keys, tuple(after)) if after is not None else len(ordered)
+            for index in range(end - 1, -1, -1):
+                yield ordered[index]
+        else:
+            start = bisect_right(keys, tuple(after)) if after is not None else 0
+            for index in range(start, len(ordered)):
+                yield ordered[index]
+
+    @staticmethod
+    def sort_value(product, sort):
+        return SORT_KEYS[sort](product)
+
+    def ids(self):
+        """Every product id, without materializing records where the backend can avoid it."""
+        return iter(self._by_id)
+
+    # --- Sequence protocol ---
+    def __contains__(self, product_id):
+        return product_id in self._by_id
+
+    def __iter__(self):
+        return iter(self._products)
+
+    def __len__(self):
+        return len(self._products)
+
+    def __bool__(self):
+        return bool(self._products)
+
+
+# --- Snapshot diffing ---
+CatalogDiff = namedtuple('CatalogDiff', ['added', 'removed', 'changed'])
+
+
+def diff_catalogs(old, new):
+    """Returns the ids added, removed and changed between two snapshots."""
+    old_ids = set(old.ids())
+    new_ids = set(new.ids())
+    changed = [pid for pid in old_ids & new_ids if old.get(pid) != new.get(pid)]
+    return CatalogDiff(
+        added=sorted(new_ids - old_ids),
+        removed=sorted(old_ids - new_ids),
+        changed=sorted(changed),
+    )
+
+
+def file_digest(path):
+    """SHA-1 of a file's contents, or None if it can't be read."""
+    try:
+        with open(path, 'rb') as file:
+            return hashlib.sha1(file.read()).hexdigest()
+    except OSError:
+        return None
+
+
+# --- Hot reloading ---
+class CatalogReloader:
+    """
+    Holds the current Catalog snapshot and replaces it when the source changes.
+
+    Readers just take `current`, a plain attribute read, so the request path
+    never takes a lock. A request that grabbed a snapshot keeps using it even
+    if a reload swaps in a new one halfway through.
+    """
+
+    def __init__(self, path, builder, initial, interval=2.0):
+        self.path = path
+        self.interval = interval
+        self.last_diff = None
+        # builder(raw_bytes, version) -> Catalog; it runs on the reload thread only.
+        self._builder = builder
+        # callback(snapshot) for derived indexes; see on_snapshot()
+        self._listeners = []
+        self._stat = self._stat_key()
+        self._check_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.current = initial
+
+    def _stat_key(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def check(self):
+        """Reloads the snapshot if the file changed. Returns True when a new snapshot was swapped in."""
+        with self._check_lock:
+            stat_key = self._stat_key()
+            if stat_key is None or stat_key == self._stat:
+                return False
+            self._stat = stat_key
+
+            try:
+                with open(self.path, 'rb') as file:
+                    raw = file.read()
+            except OSError as e:
+                print(f"Warning: Could not read catalog for reload: {e}")
+                return False
+
+            # mtime alone is not enough (touch, identical re-exports); compare content.
+            version = hashlib.sha1(raw).hexdigest()
+            if version == self.current.version:
+                return False
+
+            try:
+                snapshot = self._builder(raw, version)
+            except Exception as e:
+                print(f"Warning: Catalog reload failed, keeping version {self.current.version}. Error: {e}")
+                return False
+
+            if not snapshot:
+                print("Warning: Reloaded catalog is empty, keeping the current snapshot.")
+                return False
+
+            self.last_diff = diff_catalogs(self.current, snapshot)
+            self.install(snapshot)
+            print(
+                f"Catalog reloaded to version {version[:12]}: "
+                f"+{len(self.last_diff.added)} -{len(self.last_diff.removed)} ~{len(self.last_diff.changed)}"
+            )
+            return True
+
+    def install(self, snapshot):
+        """Hands `snapshot` to every on_snapshot() callback, then makes it current."""
+        for listener in self._listeners:
+            try:
+                listener(snapshot)
+            except Exception as e:
+                print(f"Warning: Catalog listener {listener!r} failed for version {str(snapshot.version)[:12]}: {e}")
+        # Single reference assignment: atomic for every reader.
+        self.current = snapshot
+
+    def on_snapshot(self, callback):
+        """
+        Registers callback(snapshot), called with the current snapshot right
+        away and then on the reload thread with every new one, before it is
+        swapped in, so indexes derived from it are ready first.
+        """
+        self._listeners.append(callback)
+        callback(self.current)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"Warning: Catalog watcher error: {e}")
+
+    def start(self):
+        """Starts the background watcher thread (idempotent)."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='catalog-reloader', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+
+    def restart_after_fork(self):
+        """
+        For os.register_at_fork(after_in_child=...): threads don't survive a
+        fork and a lock held by the parent's watcher would stay held forever,
+        so the child gets fresh primitives and its own watcher.
+        """
+        was_running = self._thread is not None
+        self._check_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        if was_running:
+            self.start()
@@ -0,0 +1,316 @@
+"""
+Compiled, memory-mappable catalog snapshot.
+
+    python catalog_snapshot.py build [--csv product_detail/terra.csv] [--out product_detail/terra.tncat]
+
+compiles terra.csv (through the same column mapping as data.parse_products)
+into a binary file that workers open in constant time:
+
+    header      magic, format version, record count, flags, and the size,
+                mtime and SHA-1 of the CSV it was built from
+    offsets     one u64 per section below, then the string table's offset
+                and length
+    columns     fixed-width native little-endian arrays, 8-byte aligned:
+                ids u32, price f64, original_price f64,
+                name/description/image as (offset, length) u32 pairs,
+                ids sorted + their record index (lookups by id),
+                record order for the price / discount / name sorts
+    strings     deduplicated UTF-8 string table
+
+MappedCatalog reads straight from the mapping: a Product is only built the
+first time a route touches it, and the name and price-band indexes are
+built on first use. The file is replaced atomically, so a rebuild never
+disturbs processes that still have the old one mapped.
+
+open_snapshot() returns None when the snapshot is missing, from another
+format version, or doesn't match the CSV's current contents; data.py then
+parses the CSV as before.
+"""
+import argparse
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_left
+
+from catalog import SORT_KEYS, Catalog, Product, file_digest, normalize_name
+
+MAGIC = b'TNCAT\0'
+FORMAT_VERSION = 1
+FLAG_DENSE_IDS = 1  # ids are exactly 1..count in record order
+
+# magic, format, count, flags, source size, source mtime_ns, source sha1
+HEADER = struct.Struct('<6sHIIQq20s')
+# (section, array typecode, values per record)
+SECTIONS = (
+    ('ids', 'I', 1),
+    ('price', 'd', 1),
+    ('original_price', 'd', 1),
+    ('name', 'I', 2),
+    ('description', 'I', 2),
+    ('image', 'I', 2),
+    ('id_sorted', 'I', 1),
+    ('id_sorted_index', 'I', 1),
+    ('order_price', 'I', 1),
+    ('order_discount', 'I', 1),
+    ('order_name', 'I', 1),
+)
+OFFSETS = struct.Struct(f'<{len(SECTIONS) + 2}Q')
+STRING_COLUMNS = ('name', 'description', 'image')
+SORT_SECTIONS = {'id': 'id_sorted_index', 'price': 'order_price', 'discount': 'order_discount', 'name': 'order_name'}
+
+
+# --- Build ---
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def build(products, source_path, out_path):
+    """Writes a snapshot of `products` (Product records in catalog order) built from `source_path`."""
+    if sys.byteorder != 'little':
+        raise SystemExit('Catalog snapshots are little-endian; build them on a little-endian host.')
+
+    products = list(products)
+    count = len(products)
+    strings = {}
+    blob = bytearray()
+
+    def intern(text):
+        ref = strings.get(text)
+        if ref is None:
+            raw = text.encode('utf-8')
+            ref = strings[text] = (len(blob), len(raw))
+            blob.extend(raw)
+        return ref
+
+    columns = {name: array(typecode) for name, typecode, _ in SECTIONS}
+    for product in products:
+        columns['ids'].append(product.id)
+        columns['price'].append(product.price)
+        columns['original_price'].append(product.original_price)
+        for name in STRING_COLUMNS:
+            columns[name].extend(intern(getattr(product, name)))
+
+    by_id = sorted(range(count), key=lambda index: products[index].id)
+    columns['id_sorted'].extend(products[index].id for index in by_id)
+    columns['id_sorted_index'].extend(by_id)
+    for sort in ('price', 'discount', 'name'):
+        key = SORT_KEYS[sort]
+        # Same (value, id) order Catalog._ordering produces.
+        order = sorted(range(count), key=lambda index: (key(products[index]), products[index].id))
+        columns[SORT_SECTIONS[sort]].extend(order)
+
+    dense = all(product.id == index + 1 for index, product in enumerate(products))
+    stat = os.stat(source_path)
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, count, FLAG_DENSE_IDS if dense else 0,
+                         stat.st_size, stat.st_mtime_ns, bytes.fromhex(file_digest(source_path)))
+
+    offsets = []
+    position = _align(HEADER.size + OFFSETS.size)
+    for name, _, _ in SECTIONS:
+        offsets.append(position)
+        position = _align(position + len(columns[name]) * columns[name].itemsize)
+    offsets.extend([position, len(blob)])
+
+    tmp_path = out_path + '.tmp'
+    with open(tmp_path, 'wb') as file:
+        file.write(header)
+        file.write(OFFSETS.pack(*offsets))
+        for (name, _, _), offset in zip(SECTIONS, offsets):
+            file.write(b'\0' * (offset - file.tell()))
+            columns[name].tofile(file)
+        file.write(b'\0' * (offsets[-2] - file.tell()))
+        file.write(blob)
+    os.replace(tmp_path, out_path)
+    return count
+
+
+# --- Load ---
+def _is_fresh(source_path, size, mtime_ns, sha1):
+    try:
+        stat = os.stat(source_path)
+    except OSError:
+        return False
+    if (stat.st_size, stat.st_mtime_ns) == (size, mtime_ns):
+        return True
+    # Touched or re-exported without changes: the content hash decides.
+    digest = file_digest(source_path)
+    return digest is not None and bytes.fromhex(digest) == sha1
+
+
+def open_snapshot(path, source_path, media_lookup=None):
+    """Maps the snapshot at `path`, or returns None if it is missing, unreadable, stale or empty."""
+    try:
+        with open(path, 'rb') as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    if len(mapped) < HEADER.size + OFFSETS.size or sys.byteorder != 'little':
+        return None
+    magic, format_version, count, flags, size, mtime_ns, sha1 = HEADER.unpack_from(mapped, 0)
+    if magic != MAGIC or format_version != FORMAT_VERSION:
+        print(f"Warning: Ignoring catalog snapshot {path} (format {format_version}, expected {FORMAT_VERSION})")
+        return None
+    if not _is_fresh(source_path, size, mtime_ns, sha1):
+        print(f"Catalog snapshot {path} is stale; loading the CSV (rebuild: python catalog_snapshot.py build)")
+        return None
+    if not count:
+        # Built from a CSV with no usable rows: let the CSV load (and its fallback) decide.
+        print(f"Catalog snapshot {path} has no products; loading the CSV")
+        return None
+
+    return MappedCatalog(mapped, count, flags, version=sha1.hex(), media_lookup=media_lookup)
+
+
+class _Permuted:
+    """Read-only sequence view: item k is `getter(order[k])`."""
+
+    __slots__ = ('order', 'getter')
+
+    def __init__(self, order, getter):
+        self.order = order
+        self.getter = getter
+
+    def __len__(self):
+        return len(self.order)
+
+    def __getitem__(self, position):
+        return self.getter(self.order[position])
+
+
+class MappedCatalog(Catalog):
+    """A Catalog backed by a mapped snapshot; records and indexes materialize on demand."""
+
+    def __init__(self, buffer, count, flags, version, media_lookup=None, loaded_at=None):
+        # Catalog.__init__ would index every record up front; that is what this class avoids.
+        self.version = version
+        self.loaded_at = loaded_at if loaded_at is not None else time.time()
+        self._buffer = buffer
+        self._count = count
+        self._dense = bool(flags & FLAG_DENSE_IDS)
+        self._media_lookup = media_lookup or (lambda image: None)
+        self._records = {}
+        self._by_name = None
+        self._by_price_band = None
+        self._orderings = {}
+
+        view = memoryview(buffer)
+        offsets = OFFSETS.unpack_from(buffer, HEADER.size)
+        self._columns = {}
+        for (name, typecode, width), offset in zip(SECTIONS, offsets):
+            length = count * width * struct.calcsize(typecode)
+            self._columns[name] = view[offset:offset + length].cast(typecode)
+        self._strings = view[offsets[-2]:offsets[-2] + offsets[-1]]
+        self._ids = self._columns['ids']
+
+    # --- Records ---
+    def _string(self, column, index):
+        refs = self._columns[column]
+        offset = refs[2 * index]
+        return str(self._strings[offset:offset + refs[2 * index + 1]], 'utf-8')
+
+    def _record(self, index):
+        product = self._records.get(index)
+        if product is None:
+            image = self._string('image', index)
+            product = Product(
+                id=self._ids[index],
+                name=self._string('name', index),
+                price=self._columns['price'][index],
+                original_price=self._columns['original_price'][index],
+                description=self._string('description', index),
+                image=image,
+                media=self._media_lookup(image),
+            )
+            # Racing threads build equal records; either one may win.
+            self._records[index] = product
+        return product
+
+    def _index_of(self, product_id):
+        if not isinstance(product_id, int):
+            return None
+        if self._dense:
+            return product_id - 1 if 1 <= product_id <= self._count else None
+        id_sorted = self._columns['id_sorted']
+        position = bisect_left(id_sorted, product_id)
+        if position < self._count and id_sorted[position] == product_id:
+            return self._columns['id_sorted_index'][position]
+        return None
+
+    # --- Lookups ---
+    def get(self, product_id):
+        index = self._index_of(product_id)
+        return None if index is None else self._record(index)
+
+    def ids(self):
+        return iter(self._ids)
+
+    def find_by_name(self, name):
+        if self._by_name is None:
+            by_name = {}
+            for index in range(self._count):
+                by_name.setdefault(normalize_name(self._string('name', index)), []).append(index)
+            self._by_name = by_name
+        return [self._record(index) for index in self._by_name.get(normalize_name(name), ())]
+
+    def in_price_range(self, min_price=None, max_price=None):
+        if self._by_price_band is None:
+            # Bands of record indexes straight from the price column; no records needed.
+            by_band = {}
+            for index, price in enumerate(self._columns['price']):
+                by_band.setdefault(self._band(price), []).append(index)
+            self._by_price_band = {band: _Permuted(indexes, self._record) for band, indexes in by_band.items()}
+        return Catalog.in_price_range(self, min_price, max_price)
+
+    # --- Ordered traversal: orders are precomputed in the file ---
+    def _ordering(self, sort):
+        ordering = self._orderings.get(sort)
+        if ordering is None:
+            order = self._columns[SORT_SECTIONS[sort]]
+            key = SORT_KEYS[sort]
+            if sort == 'id':
+                keys = _Permuted(order, lambda index: (self._ids[index], self._ids[index]))
+            elif sort == 'price':
+                keys = _Permuted(order, lambda index: (self._columns['price'][index], self._ids[index]))
+            else:
+                keys = _Permuted(order, lambda index: (key(self._record(index)), self._ids[index]))
+            ordering = (_Permuted(order, self._record), keys)
+            self._orderings[sort] = ordering
+        return ordering
+
+    # --- Sequence protocol ---
+    def __contains__(self, product_id):
+        return self._index_of(product_id) is not None
+
+    def __iter__(self):
+        return (self._record(index) for index in range(self._count))
+
+    def __len__(self):
+        return self._count
+
+    def __bool__(self):
+        return self._count > 0
+
+
+def main(argv=None):
+    import data
+
+    parser = argparse.ArgumentParser(description='Compile terra.csv into a memory-mappable catalog snapshot.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    build_cmd = sub.add_parser('build')
+    build_cmd.add_argument('--csv', default=data.resolve_data_path(data.CSV_FILE_PATH))
+    build_cmd.add_argument('--out', default=data.resolve_data_path(data.SNAPSHOT_FILE_PATH))
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    with open(args.csv, encoding='utf-8') as file:
+        products = [Product.from_dict(row) for row in data.parse_products(file)]
+    count = build(products, args.csv, args.out)
+    print(f"Catalog snapshot written to {args.out} ({count} products, {time.perf_counter() - started:.2f}s)")
+
+
+if __name__ == '__main__':
+    main()
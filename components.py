@@ -0,0 +1,99 @@
+"""
+Component catalog for the custom terrarium builder.
+
+Loaded once at startup into an id-keyed table. Prices are integer paise,
+so a build's total is an exact integer sum; rupee floats only appear at the
+display edge. The customize form posts component ids and build_summary
+prices them with O(1) lookups.
+"""
+
+
+# --- Records ---
+class Component:
+    """One selectable builder option."""
+
+    __slots__ = ('id', 'name', 'price_paise', 'group')
+
+    def __init__(self, id, name, price_paise, group):
+        self.id = id
+        self.name = name
+        self.price_paise = price_paise
+        self.group = group
+
+    @property
+    def price_inr(self):
+        return self.price_paise / 100
+
+    def __repr__(self):
+        return f"Component(id={self.id!r}, price_paise={self.price_paise!r})"
+
+
+class ComponentGroup:
+    """A builder step: a form field plus the options it accepts."""
+
+    __slots__ = ('key', 'field', 'title', 'multiple', 'components')
+
+    def __init__(self, key, field, title, multiple, components):
+        self.key = key
+        self.field = field
+        self.title = title
+        self.multiple = multiple
+        self.components = components
+
+
+def rupees_to_paise(value):
+    """Converts a rupee amount written in source data (e.g. '700.00' or 700.0) to integer paise."""
+    rupees, _, paise = str(value).partition('.')
+    return int(rupees) * 100 + int((paise + '00')[:2])
+
+
+# --- Catalog ---
+class ComponentCatalog:
+    """Builder options grouped by step, with an id-keyed lookup table."""
+
+    def __init__(self, group_specs):
+        self.groups = []
+        self._by_id = {}
+
+        for spec in group_specs:
+            group = ComponentGroup(spec['key'], spec['field'], spec['title'], spec['multiple'], [])
+            for component_id, name, price in spec['options']:
+                if component_id in self._by_id:
+                    raise ValueError(f"Duplicate component id {component_id!r}")
+                component = Component(component_id, name, rupees_to_paise(price), group.key)
+                group.components.append(component)
+                self._by_id[component_id] = component
+            group.components = tuple(group.components)
+            self.groups.append(group)
+        self.groups = tuple(self.groups)
+
+    def get(self, component_id):
+        return self._by_id.get(component_id)
+
+    def select(self, form):
+        """
+        Validates a submitted builder form and returns the chosen components
+        in step order, or None if a required single choice is missing or
+        invalid. Unknown ids in multi-select steps are ignored.
+        """
+        selected = []
+        for group in self.groups:
+            if group.multiple:
+                for component_id in dict.fromkeys(form.getlist(group.field)):
+                    component = self._by_id.get(component_id)
+                    if component is not None and component.group == group.key:
+                        selected.append(component)
+            else:
+                component = self._by_id.get(form.get(group.field, ''))
+                if component is None or component.group != group.key:
+                    return None
+                selected.append(component)
+        return selected
+
+    def lookup_all(self, component_ids):
+        """Resolves stored ids back to components; None if any id no longer exists."""
+        components = [self._by_id.get(component_id) for component_id in component_ids]
+        return None if None in components else components
+
+    def __len__(self):
+        return len(self._by_id)
@@ -0,0 +1,140 @@
+"""
+On-the-fly compression of dynamic responses (HTML pages and JSON).
+
+The encoding is negotiated from Accept-Encoding, q-values included:
+brotli when the `brotli` package is installed and the client takes it,
+gzip otherwise. Pages like /shop and /customize repeat the same long
+Tailwind class strings on every card and option, so they shrink by an
+order of magnitude.
+
+  * bodies already in memory (rendered and cached pages) are compressed
+    in one go, unless smaller than COMPRESS_MIN_SIZE, where headers and
+    framing would eat the gain
+  * streamed bodies (/api/products) are compressed chunk by chunk as they
+    are produced. The encoder emits output whenever it has a block ready
+    and is flushed once at the end, so nothing is held back whole. Their
+    size isn't known up front, so they are always compressed.
+  * responses that already have a Content-Encoding (precompressed
+    /assets), send_file passthroughs, partial content, other media types
+    and Cache-Control: no-transform are left alone
+
+A strong ETag is downgraded to a weak one on compressed responses: the
+bytes differ from the identity representation, and If-None-Match
+compares weakly anyway (see page_cache).
+"""
+import time
+import zlib
+
+from flask import current_app, request
+
+import metrics
+
+try:
+    import brotli
+except ImportError:  # Optional: gzip is offered on its own.
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = frozenset([
+    'text/html', 'text/plain', 'text/css', 'text/csv', 'application/json',
+    'application/javascript', 'text/javascript', 'image/svg+xml',
+])
+# zlib window bits for a gzip wrapper (header + CRC) instead of a raw zlib stream
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+def offered_encodings():
+    """Encodings this process can produce, preferred first."""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def _encoder(encoding, config):
+    """(compress(chunk) -> bytes, finish() -> bytes) for one response."""
+    if encoding == 'br':
+        compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=config['COMPRESS_BROTLI_QUALITY'])
+        return compressor.process, compressor.finish
+    compressor = zlib.compressobj(config['COMPRESS_GZIP_LEVEL'], zlib.DEFLATED, GZIP_WBITS)
+    return compressor.compress, compressor.flush
+
+
+def _compressible(response):
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return False
+    if response.cache_control.no_transform:
+        return False
+    return response.mimetype in COMPRESSIBLE_MIMETYPES
+
+
+def _compress_stream(chunks, original, encoding, config):
+    compress, finish = _encoder(encoding, config)
+    size_in = size_out = 0
+    spent = 0.0
+    try:
+        for chunk in chunks:
+            started = time.perf_counter()
+            data = compress(chunk)
+            spent += time.perf_counter() - started
+            size_in += len(chunk)
+            if data:
+                size_out += len(data)
+                yield data
+        started = time.perf_counter()
+        data = finish()
+        spent += time.perf_counter() - started
+        size_out += len(data)
+        yield data
+        _record(encoding, size_in, size_out, spent)
+    finally:
+        # The server closes us, not the body we wrap: pass that on (stream_with_context cleanup).
+        close = getattr(original, 'close', None)
+        if close is not None:
+            close()
+
+
+def _record(encoding, size_in, size_out, spent):
+    metrics.COMPRESSION_BYTES.inc(encoding, 'in', amount=size_in)
+    metrics.COMPRESSION_BYTES.inc(encoding, 'out', amount=size_out)
+    metrics.COMPRESSION_SECONDS.observe(spent, encoding)
+
+
+def compress_response(response):
+    config = current_app.config
+    if not config['COMPRESS_ENABLED'] or not _compressible(response):
+        return response
+    # Whatever we send, caches must keep the variants apart.
+    response.vary.add('Accept-Encoding')
+    encoding = request.accept_encodings.best_match(offered_encodings())
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        original = response.response
+        response.response = _compress_stream(response.iter_encoded(), original, encoding, config)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < config['COMPRESS_MIN_SIZE']:
+            return response
+        compress, finish = _encoder(encoding, config)
+        started = time.perf_counter()
+        body = compress(data) + finish()
+        _record(encoding, len(data), len(body), time.perf_counter() - started)
+        response.set_data(body)
+
+    response.headers['Content-Encoding'] = encoding
+    tag, weak = response.get_etag()
+    if tag is not None and not weak:
+        response.set_etag(tag, weak=True)
+    return response
+
+
+def init_app(app):
+    app.config.setdefault('COMPRESS_ENABLED', True)
+    # Bodies smaller than this (bytes) go out as they are
+    app.config.setdefault('COMPRESS_MIN_SIZE', 1024)
+    # 1 (fastest) .. 9 (smallest); 6 is zlib's default trade-off
+    app.config.setdefault('COMPRESS_GZIP_LEVEL', 6)
+    # 0 .. 11; 11 is for build-time assets, 4-5 suits per-request compression
+    app.config.setdefault('COMPRESS_BROTLI_QUALITY', 4)
+    app.after_request(compress_response)
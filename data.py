@@ -1,84 +1,220 @@
 import csv
+import io
 import os
+from functools import partial
 
-# --- CRITICAL: Function to load data from CSV ---
-def load_products_from_csv(file_path):
+from catalog import Catalog, CatalogReloader, file_digest
+from catalog_snapshot import open_snapshot
+from components import ComponentCatalog
+from images import source_key
+
+# --- Path helper ---
+def resolve_data_path(file_path):
+    """Paths are RELATIVE to the data.py file. This calculates the absolute path."""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), file_path)
+
+# --- Row parsing (shared by the startup load, the background reloader and ingest.py) ---
+def _parse_price(row, column):
+    value = row.get(column, '0')
+    try:
+        price = float(value.replace(',', '').strip())
+    except ValueError:
+        raise ValueError(f"'{column}' is not a number: {value!r}") from None
+    if not 0 <= price < float('inf'):
+        raise ValueError(f"'{column}' must be a non-negative amount: {value!r}")
+    return price
+
+def map_row(row, product_id):
+    """
+    Maps one csv.DictReader row of terra.csv to the application's product
+    keys. Raises ValueError with a readable reason for rows that can't be used.
+    """
+    if None in row.values():
+        raise ValueError("row has fewer fields than the header")
+
+    return {
+        'id': product_id,
+        # MAPPING: 'Name' -> 'name'
+        'name': row.get('Name', f'Unnamed Product {product_id}').strip(),
+
+        # MAPPING: 'Sale Price' -> 'price' (The price used in cart/display)
+        'price': _parse_price(row, 'Sale Price'),
+
+        # NEW MAPPING: Include original_price for discount display
+        'original_price': _parse_price(row, 'Original Price (₹)'),
+
+        # MAPPING: 'Short Description' -> 'description'
+        'description': row.get('Short Description', 'A lovely terrarium.').strip(),
+
+        # MAPPING: 'image_url' -> 'image'
+        'image': row.get('image_url', 'default.jpg').strip()
+    }
+
+def parse_products(lines, on_reject=None):
     """
-    Loads product data from the terra.csv format and maps columns
+    Parses terra.csv-formatted lines and maps columns
     to the required Flask application keys.
+    on_reject(product_id, reason) is called for each skipped row.
     """
     products = []
-    
-    # --- MISSING DEFINITION FIX ---
-    # Path is RELATIVE to the data.py file. This line calculates the absolute path.
-    absolute_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), file_path)
-    # --- END MISSING DEFINITION FIX ---
-    
+    reader = csv.DictReader(lines)
+
+    for index, row in enumerate(reader):
+        product_id = index + 1
+        try:
+            products.append(map_row(row, product_id))
+        except Exception as e:
+            if on_reject is not None:
+                on_reject(product_id, str(e))
+            else:
+                print(f"Warning: Failed to process row {product_id}. Error: {e}. Skipping.")
+
+    return products
+
+def default_rejects_path(csv_path):
+    """Where rows rejected from `csv_path` are reported: <csv name>.rejects.csv next to it."""
+    return os.path.splitext(csv_path)[0] + '.rejects.csv'
+
+# --- CRITICAL: Function to load data from CSV ---
+def load_products_from_csv(file_path, rejects_path=None):
+    """
+    Loads product data from the terra.csv format through the streaming
+    ingestion pipeline (ingest.py). Rejected rows go to `rejects_path`
+    (default: <csv name>.rejects.csv next to the file) instead of the log.
+    """
+    import ingest
+
+    absolute_path = resolve_data_path(file_path)
+
     if not os.path.exists(absolute_path):
         print(f"Error: Product data file not found at {absolute_path}")
-        return products
+        return []
 
+    if rejects_path is None:
+        rejects_path = default_rejects_path(absolute_path)
     try:
-        with open(absolute_path, mode='r', encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            
-            for index, row in enumerate(reader):
-                product_id = index + 1
-                try:
-                    product = {
-                        'id': product_id,
-                        # MAPPING: 'Name' -> 'name'
-                        'name': row.get('Name', f'Unnamed Product {product_id}').strip(),
-                        
-                        # MAPPING: 'Sale Price' -> 'price' (The price used in cart/display)
-                        'price': float(row.get('Sale Price', '0').replace(',', '').strip()), 
-                        
-                        # NEW MAPPING: Include original_price for discount display
-                        'original_price': float(row.get('Original Price (₹)', '0').replace(',', '').strip()),
-                        
-                        # MAPPING: 'Short Description' -> 'description'
-                        'description': row.get('Short Description', 'A lovely terrarium.').strip(),
-                        
-                        # MAPPING: 'image_url' -> 'image'
-                        'image': row.get('image_url', 'default.jpg').strip()
-                    }
-                    products.append(product)
-                except Exception as e:
-                    print(f"Warning: Failed to process row {product_id}. Error: {e}. Skipping.")
-            
+        products = []
+        stats = ingest.ingest(absolute_path, products.append, rejects_path=rejects_path)
     except Exception as e:
         print(f"An error occurred while reading the CSV: {e}")
+        return []
 
+    print(f"Catalog CSV: {stats.summary()}")
     return products
 
+def attach_media(products, manifest):
+    """Adds resized-variant metadata from the image manifest to each product dict."""
+    for product in products:
+        product['media'] = manifest.get(source_key(product.get('image', 'default.jpg')))
+    return products
+
+def build_catalog(raw_bytes, version, manifest=None, rejects_path=None):
+    """
+    Parses raw CSV bytes into an immutable Catalog snapshot (used by the
+    reloader). Goes through the same ingestion pipeline as the startup load,
+    so rejected rows land in `rejects_path` rather than the log.
+    """
+    import ingest
+
+    products = []
+    stats = ingest.ingest_file(io.StringIO(raw_bytes.decode('utf-8'), newline=''), products.append,
+                               rejects_path=rejects_path, workers=ingest.default_workers(len(raw_bytes)))
+    if stats.rejected:
+        print(f"Catalog CSV: {stats.summary()}")
+    return Catalog.from_dicts(attach_media(products, manifest or {}), version=version)
+
 # --- CENTRALIZED PRODUCT DATA LIST ---
 # FIX: Updated file path to the new CSV
-CSV_FILE_PATH = 'product_detail/terra.csv' 
+CSV_FILE_PATH = 'product_detail/terra.csv'
+# Compiled from terra.csv by `python catalog_snapshot.py build`; used while it matches the CSV
+SNAPSHOT_FILE_PATH = 'product_detail/terra.tncat'
 
-PREMADE_TERRARIUMS = load_products_from_csv(CSV_FILE_PATH)
-
-# --- Customization Options (Still hardcoded) ---
-VESSELS = [
-    {'name': 'Classic Jar (Small)', 'price': 15.00},
-    {'name': 'Geometric Glass', 'price': 25.00},
-    {'name': 'Open Bowl (Large)', 'price': 30.00}
+# Served when terra.csv is missing or yields zero products
+FALLBACK_TERRARIUMS = [
+    {'id': 1, 'name': 'The Misty Rainforest (Fallback)', 'price': 45.00, 'description': 'Lush closed ecosystem. (Fallback Data)', 'image': 'misty.jpg'},
+    {'id': 2, 'name': 'Desert Dune (Fallback)', 'price': 35.50, 'description': 'Open terrarium with succulent cacti. (Fallback Data)', 'image': 'desert.jpg'},
 ]
 
-PLANTS = [
-    {'name': 'Fittonia (Red)', 'price': 8.00},
-    {'name': 'Moss Mat', 'price': 5.00},
-    {'name': 'Small Succulent Mix', 'price': 7.50}
+# --- Customization Options: builder steps, ids and prices (₹) ---
+# Ids are what the customize form posts; keep them stable once published.
+COMPONENT_GROUPS = [
+    {'key': 'growing_medium', 'field': 'growing_medium', 'multiple': False,
+     'title': '1. Substrates & Growing Medium (Choose One)',
+     'options': [
+         ('medium-coco-peat', 'Coco Peat / Peat', '700.00'),
+         ('medium-potting-soil', 'Potting Soil / Medium', '650.00'),
+         ('medium-vermicompost', 'Vermicompost / Compost', '790.00'),
+         ('medium-bark', 'Bark', '440.00'),
+         ('medium-wood', 'Wood', '400.00'),
+         ('medium-humic', 'Humic', '530.00'),
+     ]},
+    {'key': 'drainage_layer', 'field': 'drainage_layer', 'multiple': False,
+     'title': '2. Drainage & Aeration Layer (Choose One)',
+     'options': [
+         ('drainage-perlite', 'Perlite', '350.00'),
+         ('drainage-vermiculite', 'Vermiculite', '310.00'),
+         ('drainage-clay-aggregate', 'Clay Aggregate', '530.00'),
+         ('drainage-sand', 'Sand', '175.00'),
+         ('drainage-gravel', 'Gravel', '220.00'),
+         ('drainage-charcoal', 'Charcoal', '620.00'),
+     ]},
+    {'key': 'hardscape_stones', 'field': 'hardscape_stones', 'multiple': False,
+     'title': '3. Hardscape & Decorative Stones (Choose One)',
+     'options': [
+         ('stones-pebbles', 'Pebbles (Onyx, River, Coloured)', '1060.00'),
+         ('stones-rocks', 'Stone / Rocks', '1320.00'),
+         ('stones-quartz', 'Quartz / Quartzite', '1590.00'),
+         ('stones-marble', 'Marble / Jasper', '1770.00'),
+         ('stones-polished', 'Polished / Tumbled (Finish)', '1230.00'),
+     ]},
+    {'key': 'plants', 'field': 'plants[]', 'multiple': True,
+     'title': '4. Plants & Living Elements (Choose 1 or more)',
+     'options': [
+         ('plant-succulents', 'Succulents / Cactus', '1320.00'),
+         ('plant-flowering', 'Jasmine / Rose / Lavender', '2200.00'),
+         ('plant-bonsai', 'Bonsai', '3980.00'),
+         ('plant-vines', 'Vines / Creepers', '1590.00'),
+         ('plant-moss', 'Moss', '880.00'),
+     ]},
+    {'key': 'care', 'field': 'care[]', 'multiple': True,
+     'title': '5. Care & Amendments (Choose 1 or more)',
+     'options': [
+         ('care-fertilizer', 'Fertilizer / Nutrients', '790.00'),
+         ('care-pest-control', 'Pest Control (Neem / Insecticide)', '1060.00'),
+         ('care-fungicide', 'Fungicide', '700.00'),
+     ]},
+    {'key': 'accessories', 'field': 'accessories[]', 'multiple': True,
+     'title': '6. Accessories & Containers (Choose 1 or more)',
+     'options': [
+         ('accessory-container', 'Terrarium / Container / Vase', '2650.00'),
+         ('accessory-figurines', 'Figurines / Toys (Suggestion based on your request)', '1320.00'),
+         ('accessory-glass', 'Glass', '1940.00'),
+         ('accessory-rod', 'Rod (Support)', '440.00'),
+     ]},
 ]
 
-SUBSTRATES = [
-    {'name': 'Drainage Layer + Soil', 'price': 5.00},
-    {'name': 'Sand & Grit Mix', 'price': 4.00}
-]
+COMPONENTS = ComponentCatalog(COMPONENT_GROUPS)
+
+# --- Hot-reloadable catalog ---
+def load_catalog_source(manifest, file_path=CSV_FILE_PATH, snapshot_path=SNAPSHOT_FILE_PATH):
+    """
+    Loads the initial snapshot and returns the reloader that serves it.
+    Called once by create_app(), before workers fork, so nothing is parsed
+    at import time. A compiled snapshot that still matches terra.csv is
+    memory-mapped; otherwise the CSV is parsed. Routes read `.current` once
+    per request; the reloader swaps in a new immutable snapshot whenever the
+    CSV changes.
+    """
+    absolute_path = resolve_data_path(file_path)
+    reload_builder = partial(build_catalog, manifest=manifest, rejects_path=default_rejects_path(absolute_path))
+
+    initial = open_snapshot(resolve_data_path(snapshot_path), absolute_path,
+                            media_lookup=lambda image: manifest.get(source_key(image)))
+    if initial is None:
+        products = load_products_from_csv(file_path)
+        if not products:
+            print("WARNING: Using hardcoded fallback products as CSV loading failed or resulted in zero products.")
+            products = [dict(product) for product in FALLBACK_TERRARIUMS]
+        initial = Catalog.from_dicts(attach_media(products, manifest), version=file_digest(absolute_path))
 
-# Fallback in case of zero products loaded
-if not PREMADE_TERRARIUMS:
-    print("WARNING: Using hardcoded fallback products as CSV loading failed or resulted in zero products.")
-    PREMADE_TERRARIUMS = [
-        {'id': 1, 'name': 'The Misty Rainforest (Fallback)', 'price': 45.00, 'description': 'Lush closed ecosystem. (Fallback Data)', 'image': 'misty.jpg'},
-        {'id': 2, 'name': 'Desert Dune (Fallback)', 'price': 35.50, 'description': 'Open terrarium with succulent cacti. (Fallback Data)', 'image': 'desert.jpg'},
-    ]
\ No newline at end of file
+    return CatalogReloader(absolute_path, reload_builder, initial=initial)
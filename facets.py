@@ -0,0 +1,246 @@
+"""
+Faceted filtering for the shop grid: price band, discount and keyword
+categories.
+
+Every facet value ("₹500 – ₹999", "25% off or more", "Moss") is computed
+once per catalog snapshot as a bitset over product ids, like the common
+terms in search.py. A request then costs a handful of big-int operations
+whatever the catalog size:
+
+  * values of one facet are alternatives (OR), facets narrow each other
+    (AND), so the matching products are one intersection
+  * each value's live count is its bitset ANDed with the selections of the
+    *other* facets, so every link says how many products it would show
+
+Filters arrive as query parameters on /shop and /api/products, one per
+facet, comma-separated or repeated: ?price=500-999&category=moss,gift.
+Keyword categories match whole words (search.tokenize) in the name or
+description and can be configured with FACET_CATEGORIES.
+
+Like the search index, facets are rebuilt off the request path for every
+catalog snapshot before it is swapped in.
+"""
+import time
+from collections import namedtuple
+from urllib.parse import urlencode
+
+from flask import current_app, url_for
+
+from search import BitsetMembers, tokenize
+
+Facet = namedtuple('Facet', ['name', 'label', 'values'])
+# test(product, tokens) -> bool
+FacetValue = namedtuple('FacetValue', ['key', 'label', 'test'])
+# members: BitsetMembers of matching ids (None when nothing is selected)
+# counts: {facet name: {value key: products it would match}}
+FacetResult = namedtuple('FacetResult', ['members', 'total', 'counts'])
+
+# (key, label, min price inclusive, max price exclusive)
+PRICE_BANDS = (
+    ('under-500', 'Under ₹500', None, 500),
+    ('500-999', '₹500 – ₹999', 500, 1000),
+    ('1000-1999', '₹1,000 – ₹1,999', 1000, 2000),
+    ('2000-up', '₹2,000 & up', 2000, None),
+)
+# Minimum discount percentages; each level includes the ones above it.
+DISCOUNT_LEVELS = (10, 25, 40)
+# key -> (label, words in the name or description that put a product in it)
+DEFAULT_CATEGORIES = {
+    'succulent': ('Succulents', ('succulent', 'succulents', 'cactus', 'cacti', 'jade', 'sansevieria', 'aloe',
+                                 'echeveria', 'haworthia')),
+    'moss': ('Moss', ('moss', 'mosses')),
+    'bonsai': ('Bonsai', ('bonsai', 'ficus')),
+    'jar': ('Jars & bottles', ('jar', 'jars', 'bottle', 'bottles', 'mason')),
+    'gift': ('Gifts', ('gift', 'gifts', 'birthday', 'hbd', 'anniversary', 'housewarming', 'love')),
+}
+
+
+def _price_test(low, high):
+    return lambda product, tokens: (low is None or product.price >= low) and (high is None or product.price < high)
+
+
+def _discount_test(minimum):
+    return lambda product, tokens: product.discount_percent >= minimum
+
+
+def _keyword_test(words):
+    words = frozenset(word.casefold() for word in words)
+    return lambda product, tokens: not words.isdisjoint(tokens)
+
+
+def define_facets(categories=None):
+    """The facets shown on /shop, in display order."""
+    categories = DEFAULT_CATEGORIES if categories is None else categories
+    return (
+        Facet('price', 'Price', tuple(FacetValue(key, label, _price_test(low, high))
+                                      for key, label, low, high in PRICE_BANDS)),
+        Facet('discount', 'Discount', tuple(FacetValue(str(minimum), f"{minimum}% off or more",
+                                                       _discount_test(minimum))
+                                            for minimum in DISCOUNT_LEVELS)),
+        Facet('category', 'Category', tuple(FacetValue(key, label, _keyword_test(words))
+                                            for key, (label, words) in categories.items())),
+    )
+
+
+class FacetIndex:
+    """Per-value bitsets over one catalog snapshot."""
+
+    def __init__(self, products, facets, version=None):
+        self.version = version
+        self.facets = facets
+        ids = {(facet.name, value.key): [] for facet in facets for value in facet.values}
+        everything = []
+        for product in products:
+            tokens = set(tokenize(product.name))
+            tokens.update(tokenize(product.description))
+            everything.append(product.id)
+            for facet in facets:
+                for value in facet.values:
+                    if value.test(product, tokens):
+                        ids[facet.name, value.key].append(product.id)
+
+        self.size = len(everything)
+        self._bitset_bytes = max(everything, default=0) // 8 + 1
+        self._all = self._bitset(everything)
+        self._bits = {facet.name: {value.key: self._bitset(ids[facet.name, value.key]) for value in facet.values}
+                      for facet in facets}
+
+    def _bitset(self, product_ids):
+        raw = bytearray(self._bitset_bytes)
+        for product_id in product_ids:
+            raw[product_id >> 3] |= 1 << (product_id & 7)
+        return int.from_bytes(raw, 'little')
+
+    def _chosen(self, selection):
+        """{facet name: OR of its selected values' bitsets}"""
+        chosen = {}
+        for name, keys in selection.items():
+            bits = 0
+            for key in keys:
+                bits |= self._bits[name][key]
+            chosen[name] = bits
+        return chosen
+
+    def members(self, selection):
+        """Ids matching `selection` ({facet name: [value keys]}), or None when it selects nothing."""
+        if not selection:
+            return None
+        matched = self._all
+        for bits in self._chosen(selection).values():
+            matched &= bits
+        return BitsetMembers(matched, self._bitset_bytes)
+
+    def select(self, selection):
+        """The matching ids plus, for every facet value, how many products choosing it would leave."""
+        chosen = self._chosen(selection)
+        matched = self._all
+        for bits in chosen.values():
+            matched &= bits
+
+        counts = {}
+        for facet in self.facets:
+            # A facet's own selection doesn't narrow its counts: its values are alternatives.
+            base = self._all
+            for name, bits in chosen.items():
+                if name != facet.name:
+                    base &= bits
+            counts[facet.name] = {key: (base & bits).bit_count() for key, bits in self._bits[facet.name].items()}
+
+        members = BitsetMembers(matched, self._bitset_bytes) if chosen else None
+        return FacetResult(members, matched.bit_count(), counts)
+
+
+class FacetService:
+    """
+    Holds the facets for the newest snapshot and the one before it, so a
+    request still pinned to the old snapshot during a swap gets bitsets
+    that match its ids.
+    """
+
+    def __init__(self, facets):
+        self.facets = facets
+        self.index = FacetIndex((), facets)
+        self._previous = None
+
+    def rebuild(self, catalog):
+        started = time.perf_counter()
+        index = FacetIndex(catalog, self.facets, version=catalog.version)
+        self._previous, self.index = self.index, index
+        print(f"Facets built for version {str(catalog.version)[:12]}: "
+              f"{index.size} products in {time.perf_counter() - started:.2f}s")
+
+    def index_for(self, catalog):
+        previous = self._previous
+        if previous is not None and previous.version == catalog.version:
+            return previous
+        return self.index
+
+
+def init_app(app, catalog_source):
+    # key -> (label, words); None: DEFAULT_CATEGORIES
+    app.config.setdefault('FACET_CATEGORIES', None)
+    service = FacetService(define_facets(app.config['FACET_CATEGORIES']))
+    catalog_source.on_snapshot(service.rebuild)
+    app.extensions['facets'] = service
+    app.add_template_global(facet_url)
+
+
+def get_facets():
+    return current_app.extensions['facets'].facets
+
+
+def parse_selection(args):
+    """
+    {facet name: [value keys]} from query parameters, in display order and
+    without duplicates. Raises ValueError for an unknown value.
+    """
+    selection = {}
+    for facet in get_facets():
+        requested = {key.strip() for raw in args.getlist(facet.name) for key in raw.split(',') if key.strip()}
+        if not requested:
+            continue
+        known = [value.key for value in facet.values]
+        unknown = requested.difference(known)
+        if unknown:
+            raise ValueError(f"Unknown {facet.name} filter {sorted(unknown)[0]!r}")
+        selection[facet.name] = [key for key in known if key in requested]
+    return selection
+
+
+def query_string(selection):
+    """Canonical query string for `selection` (same filters, same string)."""
+    return urlencode([(name, ','.join(keys)) for name, keys in selection.items()])
+
+
+def facet_url(selection, name, key):
+    """/shop URL with `key` of facet `name` toggled in `selection`."""
+    keys = list(selection.get(name, ()))
+    if key in keys:
+        keys.remove(key)
+    else:
+        keys.append(key)
+    toggled = dict(selection)
+    toggled[name] = keys
+    params = {}
+    for facet in get_facets():
+        chosen = [value.key for value in facet.values if value.key in toggled.get(facet.name, ())]
+        if chosen:
+            params[facet.name] = ','.join(chosen)
+    return url_for('shop', **params)
+
+
+def select(catalog, selection):
+    """FacetResult for `selection` against the facets built for `catalog`."""
+    return current_app.extensions['facets'].index_for(catalog).select(selection)
+
+
+def members(catalog, selection):
+    return current_app.extensions['facets'].index_for(catalog).members(selection)
+
+
+def iter_members(catalog, members, after_id=0):
+    """Products whose ids are in `members`, in id order, starting after `after_id`."""
+    for product_id in members.after(after_id):
+        product = catalog.get(product_id)
+        if product is not None:
+            yield product
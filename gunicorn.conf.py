@@ -0,0 +1,17 @@
+# gunicorn -c gunicorn.conf.py wsgi:app
+import multiprocessing
+import os
+
+bind = os.environ.get('TN_BIND', '0.0.0.0:8000')
+# Several workers need state they can share: wsgi.py puts carts and stock in
+# SQLite for that. Set WEB_CONCURRENCY=1 if you switch it to TN_CART_BACKEND=memory.
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+threads = int(os.environ.get('TN_THREADS', 2))
+
+# Build, warm and gc.freeze() the app once in the master; workers fork from it
+# and share the catalog, compiled templates and cached pages copy-on-write.
+preload_app = True
+
+# Probes: GET /healthz (liveness), GET /readyz (readiness)
+timeout = 30
+graceful_timeout = 30
@@ -0,0 +1,39 @@
+"""
+Liveness and readiness probes for the process manager / load balancer.
+
+GET /healthz   200 while the worker can answer at all (no dependencies checked)
+GET /readyz    200 once create_app() finished preloading and warming up and
+               the catalog snapshot is non-empty, 503 before that
+
+Both are cheap enough to poll every second: no templates, no cart lookups.
+"""
+import os
+
+from flask import current_app, jsonify
+
+
+def healthz():
+    return jsonify({'status': 'ok', 'pid': os.getpid()})
+
+
+def readyz():
+    state = current_app.extensions['health']
+    catalog = current_app.extensions['catalog_source'].current
+    ready = state['ready'] and len(catalog) > 0
+    body = {
+        'status': 'ready' if ready else 'starting',
+        'pid': os.getpid(),
+        'catalog_version': catalog.version,
+        'products': len(catalog),
+    }
+    return jsonify(body), 200 if ready else 503
+
+
+def init_app(app):
+    app.extensions['health'] = {'ready': False}
+    app.add_url_rule('/healthz', 'healthz', healthz)
+    app.add_url_rule('/readyz', 'readyz', readyz)
+
+
+def mark_ready(app):
+    app.extensions['health']['ready'] = True
@@ -0,0 +1,237 @@
+"""
+Image pipeline: resized, fingerprinted variants and the manifest that maps
+source images to them.
+
+Offline build (needs Pillow):
+
+    python images.py build                 # catalog images + static/img/*
+    python images.py build --offline       # skip remote image_url sources
+    python images.py build --source tests/fixtures/images/terrarium_landscape.jpg
+
+For every source image this writes JPEG and WebP variants at several widths
+to static/img/variants/ with content-hashed names, and records the source's
+width, height and variant paths in product_detail/image_manifest.json. At
+runtime the manifest is read once (no Pillow needed) and attached to
+catalog records, so templates can emit srcset/sizes and explicit
+dimensions.
+"""
+import argparse
+import csv
+import hashlib
+import io
+import json
+import os
+import urllib.request
+from collections import namedtuple
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+VARIANT_DIR = 'img/variants'
+MANIFEST_PATH = os.path.join(BASE_DIR, 'product_detail', 'image_manifest.json')
+MANIFEST_FORMAT = 1
+
+# Target widths in CSS pixels; a source is never upscaled past its own width.
+VARIANT_WIDTHS = (320, 480, 640, 960, 1280)
+JPEG_QUALITY = 80
+WEBP_QUALITY = 75
+
+
+# --- Runtime: manifest lookups ---
+ImageAsset = namedtuple('ImageAsset', ['width', 'height', 'jpeg', 'webp'])
+ImageAsset.__doc__ = """Source dimensions plus ((width, static path), ...) variants per format, smallest first."""
+
+
+def load_manifest(path=MANIFEST_PATH):
+    """Returns {source key: ImageAsset}; empty if the pipeline has not been run."""
+    try:
+        with open(path, encoding='utf-8') as file:
+            raw = json.load(file)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not read image manifest {path}: {e}")
+        return {}
+
+    if raw.get('format') != MANIFEST_FORMAT:
+        print(f"Warning: Ignoring image manifest with unsupported format {raw.get('format')!r}")
+        return {}
+
+    return {
+        key: ImageAsset(
+            width=entry['width'],
+            height=entry['height'],
+            jpeg=tuple((width, path) for width, path in entry['jpeg']),
+            webp=tuple((width, path) for width, path in entry['webp']),
+        )
+        for key, entry in raw['images'].items()
+    }
+
+
+def source_key(image):
+    """Manifest key for a catalog image value: remote URLs as-is, local files under img/."""
+    if image.startswith('http'):
+        return image
+    return 'img/' + image.lstrip('/')
+
+
+def srcset(variants):
+    """Jinja filter: ((width, path), ...) -> 'url 320w, url 640w'."""
+    from flask import url_for
+    return ', '.join(f"{url_for('static', filename=path)} {width}w" for width, path in variants)
+
+
+def init_app(app, manifest):
+    """Registers the srcset filter and an image_asset(key) lookup for templates."""
+    app.jinja_env.filters['srcset'] = srcset
+    app.jinja_env.globals['image_asset'] = manifest.get
+
+
+# --- Build: variant generation ---
+def _require_pillow():
+    try:
+        from PIL import Image
+    except ImportError:
+        raise SystemExit("The image pipeline needs Pillow: pip install Pillow")
+    return Image
+
+
+def _resolve_source(source, static_dir):
+    """Returns (manifest key, local path or None for remote URLs)."""
+    if source.startswith('http'):
+        return source, None
+    if os.path.isfile(source):
+        # Explicit file (e.g. a local fixture): keyed like a file under static/img.
+        return source_key(os.path.basename(source)), source
+    return source_key(source), os.path.join(static_dir, 'img', source)
+
+
+def _read_source(source, path, offline):
+    if path is None:
+        if offline:
+            return None
+        request = urllib.request.Request(source, headers={'User-Agent': 'TerraNova image pipeline'})
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.read()
+    with open(path, 'rb') as file:
+        return file.read()
+
+
+def _target_widths(source_width):
+    widths = [width for width in VARIANT_WIDTHS if width < source_width]
+    # Always keep one variant at (or capped to) the source width.
+    widths.append(min(source_width, VARIANT_WIDTHS[-1]))
+    return sorted(set(widths))
+
+
+def _write_variant(image, stem, width, fmt, out_dir):
+    height = round(image.height * width / image.width)
+    resized = image.resize((width, height), resample=3)  # 3 = LANCZOS
+    buffer = io.BytesIO()
+    if fmt == 'jpeg':
+        resized.convert('RGB').save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+        extension = 'jpg'
+    else:
+        resized.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=6)
+        extension = 'webp'
+
+    data = buffer.getvalue()
+    # Content-hashed names can be cached forever; a changed image gets a new URL.
+    fingerprint = hashlib.sha1(data).hexdigest()[:10]
+    filename = f"{stem}-{width}w.{fingerprint}.{extension}"
+    path = os.path.join(out_dir, filename)
+    if not os.path.exists(path):
+        with open(path, 'wb') as file:
+            file.write(data)
+    return f"{VARIANT_DIR}/{filename}"
+
+
+def build_variants(key, data, static_dir=STATIC_DIR):
+    """Generates every variant for one source image and returns its manifest entry."""
+    Image = _require_pillow()
+    out_dir = os.path.join(static_dir, VARIANT_DIR)
+    os.makedirs(out_dir, exist_ok=True)
+
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+        # Basename plus a short hash of the key, so equal basenames from different sources never collide.
+        stem = os.path.splitext(os.path.basename(key.split('?')[0]))[0][:40] or 'image'
+        stem = f"{stem}-{hashlib.sha1(key.encode('utf-8')).hexdigest()[:6]}"
+
+        widths = _target_widths(image.width)
+        return {
+            'width': image.width,
+            'height': image.height,
+            'jpeg': [[width, _write_variant(image, stem, width, 'jpeg', out_dir)] for width in widths],
+            'webp': [[width, _write_variant(image, stem, width, 'webp', out_dir)] for width in widths],
+        }
+
+
+def catalog_sources(csv_path):
+    """Distinct image values referenced by the catalog CSV."""
+    with open(csv_path, encoding='utf-8') as file:
+        for row in csv.DictReader(file):
+            image = (row.get('image_url') or '').strip()
+            if image and image != 'default.jpg':
+                yield image
+
+
+def static_sources(static_dir=STATIC_DIR):
+    image_dir = os.path.join(static_dir, 'img')
+    for name in sorted(os.listdir(image_dir)):
+        if name.lower().endswith(('.jpg', '.jpeg', '.png')):
+            yield name
+
+
+def build_manifest(sources, manifest_path=MANIFEST_PATH, static_dir=STATIC_DIR, offline=False):
+    """Builds variants for `sources` and merges them into the manifest. Returns the manifest dict."""
+    try:
+        with open(manifest_path, encoding='utf-8') as file:
+            manifest = json.load(file)
+        if manifest.get('format') != MANIFEST_FORMAT:
+            manifest = None
+    except (OSError, ValueError):
+        manifest = None
+    if manifest is None:
+        manifest = {'format': MANIFEST_FORMAT, 'images': {}}
+
+    for source in dict.fromkeys(sources):
+        key, path = _resolve_source(source, static_dir)
+        try:
+            data = _read_source(source, path, offline)
+        except OSError as e:
+            print(f"Warning: Could not read image {source}: {e}. Skipping.")
+            continue
+        if data is None:
+            continue
+        try:
+            manifest['images'][key] = build_variants(key, data, static_dir=static_dir)
+        except Exception as e:
+            print(f"Warning: Failed to process image {source}: {e}. Skipping.")
+            continue
+        print(f"  > {key}: {len(manifest['images'][key]['jpeg'])} widths")
+
+    with open(manifest_path, 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build resized, fingerprinted image variants.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build')
+    build.add_argument('--csv', default=os.path.join(BASE_DIR, 'product_detail', 'terra.csv'))
+    build.add_argument('--source', action='append', help='Only process these images (paths or URLs)')
+    build.add_argument('--static-dir', default=STATIC_DIR)
+    build.add_argument('--manifest', default=MANIFEST_PATH)
+    build.add_argument('--offline', action='store_true', help='Skip remote image URLs')
+    args = parser.parse_args(argv)
+
+    sources = args.source or [*static_sources(args.static_dir), *catalog_sources(args.csv)]
+    manifest = build_manifest(sources, manifest_path=args.manifest, static_dir=args.static_dir, offline=args.offline)
+    print(f"Image manifest written to {args.manifest} ({len(manifest['images'])} images)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+"""
+Streaming, parallel ingestion of terra.csv-format product feeds.
+
+    python ingest.py FEED.csv [--out clean.csv] [--rejects rejects.csv]
+                              [--workers N] [--chunk-rows N]
+
+The file is read as a stream of chunks of whole CSV records (quoted fields
+may span lines). Each chunk is parsed and validated in a process pool with
+the same column mapping as the app (data.map_row). Results come back in
+file order. At most 2 x workers chunks are in flight, so memory stays flat
+however large the feed is.
+
+Every rejected row goes to a rejects CSV (row, line, reason, record)
+instead of the log. Product ids keep the loader's numbering (the n-th data
+row is id n, rejected rows included), so a row number in the rejects file
+is the id the product would have had.
+
+Small files are parsed in-process: a pool only pays off past a few MB.
+"""
+import argparse
+import csv
+import io
+import os
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from data import map_row
+
+CHUNK_ROWS = 20000
+# Below this size a process pool costs more to start than it saves.
+PARALLEL_MIN_BYTES = 4 * 1024 * 1024
+# A "record" still inside quotes after this many lines is a stray quote, not a multi-line field.
+MAX_RECORD_LINES = 1000
+OUTPUT_COLUMNS = ['Name', 'Sale Price', 'Original Price (₹)', 'Short Description', 'image_url']
+REJECT_COLUMNS = ['row', 'line', 'reason', 'record']
+
+# first_row: id of the chunk's first record; lines: physical line each record starts on
+Chunk = namedtuple('Chunk', ['first_row', 'lines', 'text'])
+# accepted: product dicts; rejected: (row, line, reason, record) tuples
+ChunkResult = namedtuple('ChunkResult', ['accepted', 'rejected'])
+
+
+class IngestStats:
+    __slots__ = ('rows', 'accepted', 'rejected', 'seconds', 'rejects_path')
+
+    def __init__(self):
+        self.rows = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.seconds = 0.0
+        self.rejects_path = None
+
+    @property
+    def rows_per_sec(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def summary(self):
+        text = (f"{self.rows} rows ({self.accepted} accepted, {self.rejected} rejected) "
+                f"in {self.seconds:.2f}s, {self.rows_per_sec:,.0f} rows/s")
+        if self.rejected and self.rejects_path:
+            text += f"; rejects in {self.rejects_path}"
+        return text
+
+
+# --- Chunking (main process) ---
+def _records(file):
+    """Yields (line number, raw record) for every non-blank CSV record, header first."""
+    record = []
+    line_number = start = 0
+    in_quotes = False
+    for line in file:
+        line_number += 1
+        if not record:
+            start = line_number
+            if line in ('\n', '\r\n'):
+                continue  # csv.DictReader skips blank lines; so must the row numbering
+        record.append(line)
+        # Doubled quotes ("") inside a field flip the state twice, so parity is enough.
+        if line.count('"') % 2:
+            in_quotes = not in_quotes
+        if in_quotes and len(record) < MAX_RECORD_LINES:
+            continue
+        in_quotes = False
+        yield start, ''.join(record)
+        record = []
+    if record:
+        yield start, ''.join(record)
+
+
+def iter_chunks(file, chunk_rows=CHUNK_ROWS):
+    """Returns (header record, generator of Chunks) for an open CSV file."""
+    records = _records(file)
+    try:
+        _, header = next(records)
+    except StopIteration:
+        return '', iter(())
+
+    def chunks():
+        first_row = 1
+        lines, parts = [], []
+        for line_number, text in records:
+            lines.append(line_number)
+            parts.append(text)
+            if len(lines) >= chunk_rows:
+                yield Chunk(first_row, lines, ''.join(parts))
+                first_row += len(lines)
+                lines, parts = [], []
+        if lines:
+            yield Chunk(first_row, lines, ''.join(parts))
+
+    return header, chunks()
+
+
+# --- Parsing (worker processes) ---
+def _encode_record(row):
+    buffer = io.StringIO()
+    values = [value for key, value in row.items() if key is not None and value is not None]
+    values.extend(row.get(None) or ())
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue().rstrip('\r\n')
+
+
+def parse_chunk(header, chunk):
+    accepted, rejected = [], []
+    reader = csv.DictReader(io.StringIO(header + chunk.text))
+    for offset, row in enumerate(reader):
+        product_id = chunk.first_row + offset
+        try:
+            accepted.append(map_row(row, product_id))
+        except Exception as e:
+            line = chunk.lines[offset] if offset < len(chunk.lines) else chunk.lines[-1]
+            rejected.append((product_id, line, str(e), _encode_record(row)))
+    return ChunkResult(accepted, rejected)
+
+
+# --- Pipeline ---
+def _results(header, chunks, workers):
+    """ChunkResults in file order, with at most 2 x workers chunks in flight."""
+    if not workers:
+        for chunk in chunks:
+            yield parse_chunk(header, chunk)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(parse_chunk, header, chunk))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def default_workers(size):
+    """Pool size for a feed of `size` bytes: 0 (in-process) below PARALLEL_MIN_BYTES."""
+    return (os.cpu_count() or 1) if size >= PARALLEL_MIN_BYTES else 0
+
+
+def ingest(path, sink, rejects_path=None, workers=None, chunk_rows=CHUNK_ROWS):
+    """
+    Streams the products in `path` to `sink(product_dict)` in file order and
+    returns IngestStats. workers=None picks a pool size from the file size;
+    0 parses in-process. The rejects file is only left behind when rows were
+    rejected.
+    """
+    if workers is None:
+        workers = default_workers(os.path.getsize(path))
+    with open(path, encoding='utf-8', newline='') as file:
+        return ingest_file(file, sink, rejects_path=rejects_path, workers=workers, chunk_rows=chunk_rows)
+
+
+def ingest_file(file, sink, rejects_path=None, workers=0, chunk_rows=CHUNK_ROWS):
+    """ingest() for an already open text file (opened with newline='')."""
+    stats = IngestStats()
+    started = time.perf_counter()
+    rejects_file = rejects_writer = None
+    try:
+        header, chunks = iter_chunks(file, chunk_rows)
+        for result in _results(header, chunks, workers):
+            for product in result.accepted:
+                sink(product)
+            if result.rejected and rejects_path:
+                if rejects_writer is None:
+                    rejects_file = open(rejects_path, 'w', encoding='utf-8', newline='')
+                    rejects_writer = csv.writer(rejects_file)
+                    rejects_writer.writerow(REJECT_COLUMNS)
+                rejects_writer.writerows(result.rejected)
+            stats.accepted += len(result.accepted)
+            stats.rejected += len(result.rejected)
+    finally:
+        if rejects_file is not None:
+            rejects_file.close()
+
+    stats.rows = stats.accepted + stats.rejected
+    stats.seconds = time.perf_counter() - started
+    if rejects_path:
+        if rejects_file is not None:
+            stats.rejects_path = rejects_path
+        elif os.path.exists(rejects_path):
+            # A clean run: don't leave the previous run's rejects lying around.
+            os.remove(rejects_path)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Validate and normalize a terra.csv-format product feed.')
+    parser.add_argument('feed')
+    parser.add_argument('--out', help='Write accepted rows here, in terra.csv format')
+    parser.add_argument('--rejects', help='Rejects CSV (default: <feed>.rejects.csv)')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: CPUs for large files, 0 = in-process)')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    args = parser.parse_args(argv)
+
+    rejects_path = args.rejects or os.path.splitext(args.feed)[0] + '.rejects.csv'
+    out_file = None
+    if args.out:
+        out_file = open(args.out, 'w', encoding='utf-8', newline='')
+        writer = csv.writer(out_file)
+        writer.writerow(OUTPUT_COLUMNS)
+
+        def sink(product):
+            writer.writerow([product['name'], product['price'], product['original_price'],
+                             product['description'], product['image']])
+    else:
+        def sink(product):
+            pass
+
+    try:
+        stats = ingest(args.feed, sink, rejects_path=rejects_path, workers=args.workers,
+                       chunk_rows=args.chunk_rows)
+    finally:
+        if out_file is not None:
+            out_file.close()
+    print(stats.summary())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,382 @@
+"""
+Stock levels and cart reservations for premade terrariums.
+
+Adding a product to a cart reserves the units for that cart; removing the
+line or clearing the cart releases them, and reservations that aren't
+checked out within INVENTORY_RESERVATION_TTL seconds lapse on their own.
+Checkout commits every line of the cart at once: either all of them are
+taken from stock or none are, so the last unit can only ever be sold once.
+
+Stock comes from product_detail/stock.csv (columns: id, stock), which ships
+with a level for every product in terra.csv; add a row when adding a
+product. Products that aren't listed are not stock-tracked and can always
+be added, unless INVENTORY_DEFAULT_STOCK gives every product a starting
+quantity. The SQLite ledger only seeds products it doesn't know yet, so
+editing the file doesn't reset stock already in inventory.sqlite3. Custom
+builds are made to order and never tracked.
+
+Backends (INVENTORY_BACKEND, as for the cart store):
+    MemoryStockLedger  - in-process; the lock is sharded by product, so a
+                         flash sale on one product only queues the threads
+                         buying that product, and each of them holds the
+                         lock for a handful of dict operations
+    SqliteStockLedger  - shared by every worker process; each check-and-
+                         reserve is one write transaction
+
+Use the SQLite backend whenever more than one worker process serves the
+shop: each process would otherwise sell the same units.
+"""
+import csv
+import heapq
+import os
+import sqlite3
+import threading
+import time
+from contextlib import ExitStack
+
+from flask import current_app
+
+STOCK_FILE_PATH = 'product_detail/stock.csv'
+
+
+class OutOfStock(Exception):
+    """Not enough units left; `available` is how many could still be had."""
+
+    def __init__(self, product_id, requested, available):
+        super().__init__(f"product {product_id}: requested {requested}, {available} available")
+        self.product_id = product_id
+        self.requested = requested
+        self.available = available
+
+
+def load_stock(path):
+    """{product id: units} from a stock CSV, or {} when there is none."""
+    stock = {}
+    try:
+        with open(path, encoding='utf-8', newline='') as file:
+            for line_number, row in enumerate(csv.DictReader(file), start=2):
+                try:
+                    units = int(row['stock'])
+                    if units < 0:
+                        raise ValueError('negative stock')
+                    stock[int(row['id'])] = units
+                except (KeyError, TypeError, ValueError) as e:
+                    print(f"Warning: Skipping stock row {line_number} of {path}: {e}")
+    except FileNotFoundError:
+        return {}
+    except OSError as e:
+        print(f"Warning: Could not read stock file {path}: {e}")
+    return stock
+
+
+# --- In-process backend ---
+class _Shard:
+    __slots__ = ('lock', 'on_hand', 'held', 'reservations', 'expiry')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # product id -> units in stock (tracked products only)
+        self.on_hand = {}
+        # product id -> units held by live reservations
+        self.held = {}
+        # (product id, cart id) -> [quantity, expires_at]
+        self.reservations = {}
+        # min-heap of (expires_at, product id, cart id); entries for renewed reservations go stale
+        self.expiry = []
+
+
+class MemoryStockLedger:
+    """Reservation ledger for one process, with one lock per shard of products."""
+
+    def __init__(self, stock=None, default_stock=None, ttl=900, shards=64):
+        self.ttl = ttl
+        self.default_stock = default_stock
+        self._shards = [_Shard() for _ in range(shards)]
+        for product_id, units in (stock or {}).items():
+            self._shard(product_id).on_hand[product_id] = units
+
+    def _shard(self, product_id):
+        return self._shards[hash(product_id) % len(self._shards)]
+
+    def _on_hand(self, shard, product_id):
+        """Units in stock, or None for an untracked product. Call with the shard locked."""
+        units = shard.on_hand.get(product_id)
+        if units is None and self.default_stock is not None:
+            units = shard.on_hand[product_id] = self.default_stock
+        return units
+
+    def _expire(self, shard, now):
+        expiry = shard.expiry
+        while expiry and expiry[0][0] <= now:
+            _, product_id, cart_id = heapq.heappop(expiry)
+            entry = shard.reservations.get((product_id, cart_id))
+            if entry is not None and entry[1] <= now:
+                del shard.reservations[(product_id, cart_id)]
+                shard.held[product_id] -= entry[0]
+
+    def set_stock(self, product_id, units):
+        shard = self._shard(product_id)
+        with shard.lock:
+            shard.on_hand[product_id] = units
+
+    def available(self, product_id):
+        """Units that can still be reserved, or None when the product isn't tracked."""
+        shard = self._shard(product_id)
+        with shard.lock:
+            self._expire(shard, time.time())
+            on_hand = self._on_hand(shard, product_id)
+            return None if on_hand is None else on_hand - shard.held.get(product_id, 0)
+
+    def reserve(self, product_id, cart_id, quantity):
+        """Holds `quantity` more units for the cart (renewing its TTL) or raises OutOfStock."""
+        shard = self._shard(product_id)
+        now = time.time()
+        with shard.lock:
+            self._expire(shard, now)
+            on_hand = self._on_hand(shard, product_id)
+            if on_hand is None:
+                return
+            held = shard.held.get(product_id, 0)
+            if on_hand - held < quantity:
+                raise OutOfStock(product_id, quantity, on_hand - held)
+            shard.held[product_id] = held + quantity
+            entry = shard.reservations.get((product_id, cart_id))
+            if entry is None:
+                entry = shard.reservations[(product_id, cart_id)] = [0, 0.0]
+            entry[0] += quantity
+            entry[1] = now + self.ttl
+            heapq.heappush(shard.expiry, (entry[1], product_id, cart_id))
+
+    def release(self, product_id, cart_id, quantity=None):
+        """Gives back `quantity` of the cart's held units (all of them when None)."""
+        shard = self._shard(product_id)
+        with shard.lock:
+            entry = shard.reservations.get((product_id, cart_id))
+            if entry is None:
+                return
+            released = entry[0] if quantity is None else min(quantity, entry[0])
+            entry[0] -= released
+            shard.held[product_id] -= released
+            if not entry[0]:
+                del shard.reservations[(product_id, cart_id)]
+
+    def commit(self, cart_id, lines):
+        """
+        Sells `lines` ([(product id, quantity)]) to the cart: its reservations
+        are consumed and lapsed ones are topped up from free stock. All lines
+        or none; raises OutOfStock for the first line that can't be covered.
+        """
+        now = time.time()
+        indexes = sorted({hash(product_id) % len(self._shards) for product_id, _ in lines})
+        with ExitStack() as stack:
+            # Always in index order, so two multi-shard commits can't deadlock.
+            for index in indexes:
+                stack.enter_context(self._shards[index].lock)
+            for product_id, quantity in lines:
+                shard = self._shard(product_id)
+                self._expire(shard, now)
+                on_hand = self._on_hand(shard, product_id)
+                if on_hand is None:
+                    continue
+                entry = shard.reservations.get((product_id, cart_id))
+                reserved = entry[0] if entry is not None else 0
+                free = on_hand - shard.held.get(product_id, 0) + reserved
+                if free < quantity:
+                    raise OutOfStock(product_id, quantity, free)
+            for product_id, quantity in lines:
+                shard = self._shard(product_id)
+                if self._on_hand(shard, product_id) is None:
+                    continue
+                entry = shard.reservations.pop((product_id, cart_id), None)
+                if entry is not None:
+                    shard.held[product_id] -= entry[0]
+                shard.on_hand[product_id] -= quantity
+
+    def restock(self, lines):
+        """Puts committed units back, e.g. when the order could not be recorded."""
+        for product_id, quantity in lines:
+            shard = self._shard(product_id)
+            with shard.lock:
+                if product_id in shard.on_hand:
+                    shard.on_hand[product_id] += quantity
+
+
+# --- Shared backend ---
+class SqliteStockLedger:
+    """
+    Reservation ledger in a SQLite file, shared by every worker that points at it.
+
+    Each operation is one write transaction (SQLite serializes writers), so
+    the availability check and the reservation can't interleave with
+    another process's.
+    """
+
+    def __init__(self, path, stock=None, default_stock=None, ttl=900):
+        self.path = path
+        self.ttl = ttl
+        self.default_stock = default_stock
+        self._local = threading.local()
+        conn = self._connect()
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS stock (product_id INTEGER PRIMARY KEY, on_hand INTEGER NOT NULL)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS stock_reservations ("
+                " product_id INTEGER NOT NULL,"
+                " cart_id TEXT NOT NULL,"
+                " quantity INTEGER NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " PRIMARY KEY (product_id, cart_id))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS stock_reservations_expires_at ON stock_reservations (expires_at)")
+            # The file is the source of truth once seeded: restarts must not undo sales.
+            conn.executemany("INSERT OR IGNORE INTO stock (product_id, on_hand) VALUES (?, ?)",
+                             (stock or {}).items())
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        # Connections must not cross a fork: a forked worker opens its own.
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            # isolation_level=None: transactions are opened explicitly with BEGIN IMMEDIATE.
+            conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _transaction(self):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        return conn
+
+    def _on_hand(self, conn, product_id):
+        row = conn.execute("SELECT on_hand FROM stock WHERE product_id = ?", (product_id,)).fetchone()
+        if row is not None:
+            return row[0]
+        if self.default_stock is None:
+            return None
+        conn.execute("INSERT INTO stock (product_id, on_hand) VALUES (?, ?)", (product_id, self.default_stock))
+        return self.default_stock
+
+    @staticmethod
+    def _held(conn, product_id, now):
+        return conn.execute(
+            "SELECT COALESCE(SUM(quantity), 0) FROM stock_reservations WHERE product_id = ? AND expires_at > ?",
+            (product_id, now),
+        ).fetchone()[0]
+
+    def _run(self, operation):
+        conn = self._transaction()
+        try:
+            result = operation(conn)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    def set_stock(self, product_id, units):
+        self._run(lambda conn: conn.execute(
+            "INSERT OR REPLACE INTO stock (product_id, on_hand) VALUES (?, ?)", (product_id, units)))
+
+    def available(self, product_id):
+        def operation(conn):
+            on_hand = self._on_hand(conn, product_id)
+            return None if on_hand is None else on_hand - self._held(conn, product_id, time.time())
+        return self._run(operation)
+
+    def reserve(self, product_id, cart_id, quantity):
+        def operation(conn):
+            now = time.time()
+            on_hand = self._on_hand(conn, product_id)
+            if on_hand is None:
+                return
+            conn.execute("DELETE FROM stock_reservations WHERE product_id = ? AND expires_at <= ?", (product_id, now))
+            free = on_hand - self._held(conn, product_id, now)
+            if free < quantity:
+                raise OutOfStock(product_id, quantity, free)
+            conn.execute(
+                "INSERT INTO stock_reservations (product_id, cart_id, quantity, expires_at) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (product_id, cart_id) DO UPDATE"
+                " SET quantity = quantity + excluded.quantity, expires_at = excluded.expires_at",
+                (product_id, cart_id, quantity, now + self.ttl),
+            )
+        self._run(operation)
+
+    def release(self, product_id, cart_id, quantity=None):
+        def operation(conn):
+            if quantity is None:
+                conn.execute("DELETE FROM stock_reservations WHERE product_id = ? AND cart_id = ?",
+                             (product_id, cart_id))
+            else:
+                conn.execute("UPDATE stock_reservations SET quantity = quantity - ? WHERE product_id = ? AND cart_id = ?",
+                             (quantity, product_id, cart_id))
+                conn.execute("DELETE FROM stock_reservations WHERE product_id = ? AND cart_id = ? AND quantity <= 0",
+                             (product_id, cart_id))
+        self._run(operation)
+
+    def commit(self, cart_id, lines):
+        def operation(conn):
+            now = time.time()
+            tracked = []
+            for product_id, quantity in lines:
+                on_hand = self._on_hand(conn, product_id)
+                if on_hand is None:
+                    continue
+                row = conn.execute(
+                    "SELECT quantity FROM stock_reservations WHERE product_id = ? AND cart_id = ? AND expires_at > ?",
+                    (product_id, cart_id, now),
+                ).fetchone()
+                free = on_hand - self._held(conn, product_id, now) + (row[0] if row else 0)
+                if free < quantity:
+                    raise OutOfStock(product_id, quantity, free)
+                tracked.append((product_id, quantity))
+            for product_id, quantity in tracked:
+                conn.execute("DELETE FROM stock_reservations WHERE product_id = ? AND cart_id = ?",
+                             (product_id, cart_id))
+                conn.execute("UPDATE stock SET on_hand = on_hand - ? WHERE product_id = ?", (quantity, product_id))
+        self._run(operation)
+
+    def restock(self, lines):
+        self._run(lambda conn: conn.executemany(
+            "UPDATE stock SET on_hand = on_hand + ? WHERE product_id = ?",
+            [(quantity, product_id) for product_id, quantity in lines]))
+
+    def purge_expired(self):
+        self._run(lambda conn: conn.execute("DELETE FROM stock_reservations WHERE expires_at <= ?", (time.time(),)))
+
+
+# --- Flask integration ---
+def init_app(app):
+    app.config.setdefault('INVENTORY_BACKEND', app.config.get('CART_BACKEND', 'memory'))
+    app.config.setdefault('INVENTORY_STOCK_PATH', os.path.join(app.root_path, STOCK_FILE_PATH))
+    # Starting stock for products missing from the stock file (None: not tracked)
+    app.config.setdefault('INVENTORY_DEFAULT_STOCK', None)
+    # Seconds a cart holds its units before they go back on sale
+    app.config.setdefault('INVENTORY_RESERVATION_TTL', 15 * 60)
+    app.config.setdefault('INVENTORY_SHARDS', 64)
+    app.config.setdefault('INVENTORY_DB_PATH', 'inventory.sqlite3')
+
+    stock = load_stock(app.config['INVENTORY_STOCK_PATH'])
+    backend = app.config['INVENTORY_BACKEND']
+    if backend == 'memory':
+        ledger = MemoryStockLedger(stock, default_stock=app.config['INVENTORY_DEFAULT_STOCK'],
+                                   ttl=app.config['INVENTORY_RESERVATION_TTL'], shards=app.config['INVENTORY_SHARDS'])
+    elif backend == 'sqlite':
+        ledger = SqliteStockLedger(app.config['INVENTORY_DB_PATH'], stock,
+                                   default_stock=app.config['INVENTORY_DEFAULT_STOCK'],
+                                   ttl=app.config['INVENTORY_RESERVATION_TTL'])
+    else:
+        raise ValueError(f"Unknown INVENTORY_BACKEND {backend!r}")
+
+    app.extensions['inventory'] = ledger
+    return ledger
+
+
+def get_ledger():
+    return current_app.extensions['inventory']
+
+
+def premade_lines(cart):
+    """[(product id, quantity)] for the stock-tracked lines of a cart."""
+    return [(line['id'], line['quantity']) for line in cart.items() if line['type'] == 'premade']
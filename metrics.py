@@ -0,0 +1,308 @@
+"""
+In-process request instrumentation, exported at /metrics in the Prometheus
+text format (version 0.0.4).
+
+Recorded:
+    tn_request_duration_seconds     per endpoint/method, handler time up to the
+                                    response (streamed bodies finish later)
+    tn_requests_total               per endpoint/method/status
+    tn_template_render_seconds      per template, actual Jinja renders only
+                                    (page-cache hits don't render)
+    tn_context_processor_seconds    inject_global_vars and friends
+    tn_session_seconds              session cookie decode (open) / encode (save)
+    tn_session_cookie_bytes         size of each Set-Cookie session value
+    tn_cart_lines                   lines in the cart a request touched
+    tn_catalog_lookup_seconds       catalog index lookups, by operation
+    tn_order_commit_seconds         checkout order queued -> durably committed
+    tn_order_batch_size             orders per group commit
+    tn_orders_total                 orders by outcome (committed/failed/timeout)
+    tn_compression_bytes_total      response bytes into and out of compression,
+                                    by encoding
+    tn_compression_seconds          time spent compressing one response body
+    tn_rate_limited_total           cart mutations turned away with 429, by
+                                    the bucket that ran dry (ip/session)
+    tn_catalog_*                    snapshot version, size and load time,
+                                    read at scrape time
+
+Every observation is a bisect plus a short locked update, so it stays on
+under load. Counters are per process: under gunicorn each worker reports
+its own, the same as any other in-process state here.
+"""
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+
+from flask import Response, g, request
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Upper bounds (seconds / bytes / lines); a +Inf bucket is always added.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+FAST_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.01)
+BYTE_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+# --- Metric types ---
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def expose(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = sorted(self._values.items())
+        for labelvalues, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}"
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labelvalues -> [per-bucket counts (+Inf last), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def time(self, *labelvalues):
+        return _Timer(self, labelvalues)
+
+    def expose(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._series.items())
+        bounds = self.buckets + (float('inf'),)
+        for labelvalues, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, labelvalues, ('le', _format_value(bound)))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, labelvalues)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labelvalues', 'started')
+
+    def __init__(self, histogram, labelvalues):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labelvalues)
+
+
+class GaugeCallback:
+    """A gauge computed at scrape time; `callback` yields (labelvalues, value) pairs."""
+
+    def __init__(self, name, documentation, callback, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def expose(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} gauge"
+        for labelvalues, value in self.callback():
+            yield f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        # Same name replaces: a second create_app() re-points the catalog gauges.
+        self._metrics[metric.name] = metric
+        return metric
+
+    def expose(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.expose())
+        return '\n'.join(lines) + '\n'
+
+
+# --- Application metrics ---
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'tn_request_duration_seconds', 'Time spent handling a request.', ('endpoint', 'method')))
+REQUESTS_TOTAL = REGISTRY.register(Counter(
+    'tn_requests_total', 'Requests handled.', ('endpoint', 'method', 'status')))
+TEMPLATE_SECONDS = REGISTRY.register(Histogram(
+    'tn_template_render_seconds', 'Jinja render time per template.', ('template',)))
+CONTEXT_PROCESSOR_SECONDS = REGISTRY.register(Histogram(
+    'tn_context_processor_seconds', 'Time spent in template context processors.', ('processor',), FAST_BUCKETS))
+SESSION_SECONDS = REGISTRY.register(Histogram(
+    'tn_session_seconds', 'Session cookie decode (open) and encode (save) time.', ('operation',), FAST_BUCKETS))
+SESSION_COOKIE_BYTES = REGISTRY.register(Histogram(
+    'tn_session_cookie_bytes', 'Size of the session cookie value set on a response.', (), BYTE_BUCKETS))
+CART_LINES = REGISTRY.register(Histogram(
+    'tn_cart_lines', 'Lines in the cart loaded by a request.', (), COUNT_BUCKETS))
+CATALOG_LOOKUP_SECONDS = REGISTRY.register(Histogram(
+    'tn_catalog_lookup_seconds', 'Catalog index lookup time.', ('operation',), FAST_BUCKETS))
+ORDER_COMMIT_SECONDS = REGISTRY.register(Histogram(
+    'tn_order_commit_seconds', 'Time from queueing an order to its durable commit.'))
+ORDER_BATCH_SIZE = REGISTRY.register(Histogram(
+    'tn_order_batch_size', 'Orders written per group commit.', (), COUNT_BUCKETS))
+ORDERS_TOTAL = REGISTRY.register(Counter(
+    'tn_orders_total', 'Orders by outcome.', ('status',)))
+COMPRESSION_BYTES = REGISTRY.register(Counter(
+    'tn_compression_bytes_total', 'Response body bytes before (in) and after (out) compression.',
+    ('encoding', 'direction')))
+COMPRESSION_SECONDS = REGISTRY.register(Histogram(
+    'tn_compression_seconds', 'Time spent compressing one response body.', ('encoding',), FAST_BUCKETS))
+RATE_LIMITED_TOTAL = REGISTRY.register(Counter(
+    'tn_rate_limited_total', 'Requests rejected with 429 by the rate limiter.', ('scope',)))
+
+
+def timed(histogram, *labelvalues):
+    """Decorator: observes the wrapped function's run time in `histogram`."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started, *labelvalues)
+        return wrapper
+    return decorator
+
+
+def register_catalog_source(source):
+    """Scrape-time gauges describing the catalog snapshot `source.current`."""
+    def snapshot_info():
+        yield (source.current.version,), 1
+
+    REGISTRY.register(GaugeCallback(
+        'tn_catalog_info', 'Catalog snapshot currently served.', snapshot_info, ('version',)))
+    REGISTRY.register(GaugeCallback(
+        'tn_catalog_products', 'Products in the current catalog snapshot.',
+        lambda: [((), len(source.current))]))
+    REGISTRY.register(GaugeCallback(
+        'tn_catalog_loaded_timestamp_seconds', 'When the current catalog snapshot was loaded.',
+        lambda: [((), source.current.loaded_at)]))
+
+
+# --- Flask wiring ---
+class TimedSessionInterface:
+    """Wraps the app's session interface to time cookie decode/encode and record its size."""
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    def open_session(self, app, request):
+        started = time.perf_counter()
+        try:
+            return self.inner.open_session(app, request)
+        finally:
+            SESSION_SECONDS.observe(time.perf_counter() - started, 'open')
+
+    def save_session(self, app, session, response):
+        started = time.perf_counter()
+        try:
+            return self.inner.save_session(app, session, response)
+        finally:
+            SESSION_SECONDS.observe(time.perf_counter() - started, 'save')
+            prefix = self.inner.get_cookie_name(app) + '='
+            for header in response.headers.getlist('Set-Cookie'):
+                if header.startswith(prefix):
+                    SESSION_COOKIE_BYTES.observe(len(header.split(';', 1)[0]) - len(prefix))
+
+
+def _start_timer():
+    g.metrics_started = time.perf_counter()
+
+
+def _record_request(response):
+    started = g.pop('metrics_started', None)
+    if started is not None:
+        # Unmatched URLs share one label so scanners can't blow up the series count.
+        endpoint = request.endpoint or '<unmatched>'
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint, request.method)
+        REQUESTS_TOTAL.inc(endpoint, request.method, str(response.status_code))
+    cart = g.get('cart')
+    if cart is not None:
+        CART_LINES.observe(len(cart.lines))
+    return response
+
+
+def _render_started(sender, template, context, **extra):
+    g.setdefault('metrics_renders', []).append(time.perf_counter())
+
+
+def _render_finished(sender, template, context, **extra):
+    renders = g.get('metrics_renders')
+    if renders:
+        TEMPLATE_SECONDS.observe(time.perf_counter() - renders.pop(), template.name or '<string>')
+
+
+def metrics_view():
+    return Response(REGISTRY.expose(), content_type=CONTENT_TYPE)
+
+
+def init_app(app):
+    app.config.setdefault('METRICS_ENABLED', True)
+    if not app.config['METRICS_ENABLED']:
+        return
+
+    from flask import before_render_template, template_rendered
+
+    app.session_interface = TimedSessionInterface(app.session_interface)
+    # Registered first so the timer also covers the app's own before_request hooks.
+    app.before_request_funcs.setdefault(None, []).insert(0, _start_timer)
+    app.after_request(_record_request)
+    before_render_template.connect(_render_started, app)
+    template_rendered.connect(_render_finished, app)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+    app.extensions['metrics'] = REGISTRY
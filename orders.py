@@ -0,0 +1,346 @@
+"""
+Durable order log.
+
+Checkout records each order and its lines in an embedded SQLite database
+(WAL mode, synchronous=FULL: a committed order survives a power cut).
+
+Writes are group-committed. Request threads never open a transaction of
+their own: they queue the order and wait for it to become durable. One
+writer thread per process drains everything queued since its last commit
+(up to ORDER_MAX_BATCH orders) into a single transaction, so N checkouts
+arriving together cost one WAL fsync instead of N. While a commit is being
+synced the next batch piles up behind it, so batches grow with load and
+an idle shop still commits each order immediately.
+
+If a batch fails, its orders are retried one by one so a single bad order
+can't fail its neighbours.
+
+Each checkout carries a token derived from the cart as it was checked out
+(checkout_token). The log keeps at most one order per token, so placing
+the same cart twice - a shopper retrying after a timed-out confirmation,
+or two tabs racing - records one order and tells the later caller it was
+a duplicate. A timeout is not a failure: the write may still land, and
+the next attempt finds it (find) instead of selling the cart again.
+"""
+import hashlib
+import os
+import queue
+import secrets
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from flask import current_app
+
+import metrics
+
+# lines: cart line dicts (key, id, type, name, price, quantity)
+# token: checkout_token() of the cart it was placed from (None for orders placed without one)
+Order = namedtuple('Order', ['id', 'cart_id', 'created_at', 'item_count', 'total', 'lines', 'token'])
+
+_STOP = object()
+
+
+class OrderLogError(Exception):
+    """The order was not written, and won't be."""
+
+
+class OrderTimeout(OrderLogError):
+    """The order wasn't confirmed in time; it is still queued and may yet commit."""
+
+
+class _Pending:
+    __slots__ = ('order', 'submitted', 'done', 'error', 'existing', 'on_failure')
+
+    def __init__(self, order, on_failure=None):
+        self.order = order
+        self.submitted = time.perf_counter()
+        self.done = threading.Event()
+        self.error = None
+        # The order recorded earlier with the same token, if there was one
+        self.existing = None
+        # Called by the writer if the write fails, so work done for the order can be undone
+        # even when its caller stopped waiting.
+        self.on_failure = on_failure
+
+
+def new_order_id(created_at):
+    return f"TN-{time.strftime('%Y%m%d', time.localtime(created_at))}-{secrets.token_hex(4).upper()}"
+
+
+def checkout_token(cart):
+    """
+    Identifies one checkout of `cart`: the same until the cart changes. Any
+    add or removal moves updated_at, so buying the same things again later
+    is a new order, while retrying an unchanged cart is not.
+    """
+    raw = f"{cart.id}\n{cart.updated_at!r}\n{cart.to_json()}".encode('utf-8')
+    return hashlib.sha256(raw).hexdigest()[:32]
+
+
+class OrderLog:
+    """Append-only order store with a background group-commit writer."""
+
+    def __init__(self, path, max_batch=256):
+        self.path = path
+        self.max_batch = max_batch
+        # Written by the writer thread only; benchmarks read them to report orders per commit.
+        self.commits = 0
+        self.committed = 0
+        self._queue = queue.SimpleQueue()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        # token -> _Pending, from queueing until the writer is done with it
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self._local = threading.local()
+
+        # Schema on a short-lived connection: SQLite connections must not cross a fork.
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS orders ("
+                    " id TEXT PRIMARY KEY,"
+                    " cart_id TEXT,"
+                    " item_count INTEGER NOT NULL,"
+                    " total REAL NOT NULL,"
+                    " created_at REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS orders_created_at ON orders (created_at)")
+                columns = {row[1] for row in conn.execute("PRAGMA table_info(orders)")}
+                if 'token' not in columns:
+                    # Logs written before checkout tokens: their orders keep a NULL token.
+                    conn.execute("ALTER TABLE orders ADD COLUMN token TEXT")
+                conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS orders_token ON orders (token)")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS order_lines ("
+                    " order_id TEXT NOT NULL REFERENCES orders (id),"
+                    " position INTEGER NOT NULL,"
+                    " item_type TEXT NOT NULL,"
+                    " item_id INTEGER,"
+                    " name TEXT NOT NULL,"
+                    " unit_price REAL NOT NULL,"
+                    " quantity INTEGER NOT NULL,"
+                    " PRIMARY KEY (order_id, position))"
+                )
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10.0)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL")
+        return conn
+
+    # --- Request side ---
+    def place(self, cart_id, lines, item_count, total, timeout=5.0, token=None, on_failure=None):
+        """
+        Queues an order and blocks until it is committed. Returns (Order,
+        created): created is False when an order with the same `token` was
+        already recorded, and the Order is then that earlier one.
+
+        Raises OrderTimeout if the write isn't confirmed within `timeout`
+        (it may still commit) and OrderLogError if it failed. `on_failure()`
+        runs on the writer thread if the write fails, whether or not the
+        caller is still waiting.
+        """
+        created_at = time.time()
+        order = Order(new_order_id(created_at), cart_id, created_at, item_count, total,
+                      [dict(line) for line in lines], token)
+        pending = _Pending(order, on_failure)
+        if token is not None:
+            with self._inflight_lock:
+                self._inflight.setdefault(token, pending)
+        self._ensure_writer()
+        self._queue.put(pending)
+        return self._wait(pending, timeout)
+
+    def _wait(self, pending, timeout):
+        order = pending.order
+        if not pending.done.wait(timeout):
+            # It may still commit; the shopper just can't be told so yet.
+            metrics.ORDERS_TOTAL.inc('timeout')
+            raise OrderTimeout(f"order {order.id} not confirmed within {timeout}s")
+        if pending.error is not None:
+            raise OrderLogError(f"order {order.id} failed: {pending.error}") from pending.error
+        if pending.existing is not None:
+            return pending.existing, False
+        return order, True
+
+    def find(self, token, timeout=5.0):
+        """
+        The order recorded for `token`, or None if there is none. An order
+        for it still queued in this process is waited for first (raising
+        OrderTimeout if it stays unconfirmed); one that failed counts as none.
+        """
+        with self._inflight_lock:
+            pending = self._inflight.get(token)
+        if pending is not None:
+            try:
+                return self._wait(pending, timeout)[0]
+            except OrderTimeout:
+                raise
+            except OrderLogError:
+                return None
+        return self._load(self._reader(), token)
+
+    def _reader(self):
+        conn = getattr(self._local, 'conn', None)
+        # Connections must not cross a fork: a forked worker opens its own.
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = self._local.conn = self._connect()
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _load(conn, token):
+        row = conn.execute("SELECT id, cart_id, created_at, item_count, total FROM orders WHERE token = ?",
+                           (token,)).fetchone()
+        if row is None:
+            return None
+        lines = [{'type': item_type, 'id': item_id, 'name': name, 'price': price, 'quantity': quantity}
+                 for item_type, item_id, name, price, quantity in conn.execute(
+                     "SELECT item_type, item_id, name, unit_price, quantity FROM order_lines"
+                     " WHERE order_id = ? ORDER BY position", (row[0],))]
+        return Order(row[0], row[1], row[2], row[3], row[4], lines, token)
+
+    # --- Writer thread ---
+    def _ensure_writer(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                thread = threading.Thread(target=self._run, name='order-writer', daemon=True)
+                thread.start()
+                self._thread = thread
+
+    def _run(self):
+        conn = self._connect()
+        try:
+            while True:
+                batch = [self._queue.get()]
+                # Everything that queued up during the previous commit joins this one.
+                while len(batch) < self.max_batch:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                stopping = _STOP in batch
+                batch = [pending for pending in batch if pending is not _STOP]
+                if batch:
+                    self._commit(conn, batch)
+                if stopping:
+                    return
+        finally:
+            conn.close()
+
+    def _commit(self, conn, batch):
+        try:
+            with conn:
+                # A token already in the log (or earlier in this batch) inserts nothing...
+                conn.executemany(
+                    "INSERT INTO orders (id, cart_id, item_count, total, created_at, token) VALUES (?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT (token) DO NOTHING",
+                    [(p.order.id, p.order.cart_id, p.order.item_count, p.order.total, p.order.created_at,
+                      p.order.token) for p in batch],
+                )
+                # ...and its request gets the order that holds the token instead.
+                for pending in batch:
+                    if pending.order.token is not None:
+                        stored = self._load(conn, pending.order.token)
+                        if stored.id != pending.order.id:
+                            pending.existing = stored
+                conn.executemany(
+                    "INSERT INTO order_lines (order_id, position, item_type, item_id, name, unit_price, quantity)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(p.order.id, position, line['type'], line.get('id'), line['name'], line['price'], line['quantity'])
+                     for p in batch if p.existing is None for position, line in enumerate(p.order.lines)],
+                )
+        except Exception as e:
+            for pending in batch:
+                # Nothing of the rolled-back transaction stands.
+                pending.existing = None
+            if len(batch) > 1:
+                for pending in batch:
+                    self._commit(conn, [pending])
+                return
+            pending = batch[0]
+            print(f"Warning: Could not write order {pending.order.id}: {e}")
+            pending.error = e
+            metrics.ORDERS_TOTAL.inc('failed')
+            if pending.on_failure is not None:
+                try:
+                    pending.on_failure()
+                except Exception as undo_error:
+                    print(f"Warning: Could not undo order {pending.order.id}: {undo_error}")
+            self._finish(pending)
+            return
+
+        self.commits += 1
+        self.committed += len(batch)
+        now = time.perf_counter()
+        metrics.ORDER_BATCH_SIZE.observe(len(batch))
+        metrics.ORDERS_TOTAL.inc('committed', amount=len(batch))
+        for pending in batch:
+            metrics.ORDER_COMMIT_SECONDS.observe(now - pending.submitted)
+            self._finish(pending)
+
+    def _finish(self, pending):
+        pending.done.set()
+        token = pending.order.token
+        if token is not None:
+            with self._inflight_lock:
+                if self._inflight.get(token) is pending:
+                    del self._inflight[token]
+
+    def close(self, timeout=10.0):
+        """Commits everything already queued, then stops the writer."""
+        thread = self._thread
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+            self._thread = None
+
+    def restart_after_fork(self):
+        """
+        For os.register_at_fork(after_in_child=...): the parent's writer
+        thread doesn't exist in the child, so it gets a fresh queue and
+        starts its own writer on its first order.
+        """
+        self._queue = queue.SimpleQueue()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self._local = threading.local()
+        self.commits = self.committed = 0
+
+
+# --- Flask integration ---
+def init_app(app):
+    app.config.setdefault('ORDER_DB_PATH', 'orders.sqlite3')
+    # Most orders one group commit may carry
+    app.config.setdefault('ORDER_MAX_BATCH', 256)
+    # How long checkout waits for its order to become durable before giving up
+    app.config.setdefault('ORDER_COMMIT_TIMEOUT', 5.0)
+
+    order_log = OrderLog(app.config['ORDER_DB_PATH'], max_batch=app.config['ORDER_MAX_BATCH'])
+    app.extensions['order_log'] = order_log
+    return order_log
+
+
+def place_order(cart, token=None, on_failure=None):
+    """
+    Durably records the contents of `cart` as an order. Returns (Order,
+    created); see OrderLog.place.
+    """
+    return current_app.extensions['order_log'].place(
+        cart.id, cart.items(), cart.count, cart.total, timeout=current_app.config['ORDER_COMMIT_TIMEOUT'],
+        token=token, on_failure=on_failure)
+
+
+def find_order(token):
+    """The order already placed with `token`, or None (raises OrderTimeout while it is unconfirmed)."""
+    return current_app.extensions['order_log'].find(token, timeout=current_app.config['ORDER_COMMIT_TIMEOUT'])
@@ -0,0 +1,161 @@
+"""
+Rendered-page cache and conditional GET for catalog-driven pages.
+
+/shop and /customize only change when the catalog snapshot changes, apart
+from the cart badge in the header. Pages are rendered once per
+(template, catalog version, variant) with a placeholder where the badge
+count goes, and the count is spliced in per request. The variant tells
+apart versions of one page, such as /shop under different filters. Every response carries a strong
+ETag built from the cache key plus the count, so a repeat visitor whose
+copy is still current gets a 304 before anything is rendered.
+
+Below the page level, each product card is a cached fragment per
+(product id, catalog version): a page that has to be rendered (a new
+snapshot, another page of results) only renders the cards it hasn't
+seen yet and concatenates the rest.
+
+Compiled templates are also kept on disk (Jinja's bytecode cache, in
+TEMPLATE_BYTECODE_CACHE_DIR), so a freshly started process loads them
+instead of compiling them again.
+"""
+import hashlib
+import os
+import threading
+from datetime import datetime, timezone
+
+from flask import current_app, g, make_response, render_template, request
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
+
+from cart_store import cart_summary
+
+# Stands in for the per-user cart count inside cached bodies.
+CART_COUNT_MARKER = '__TN_CART_COUNT__'
+
+
+class PageCache:
+    """Rendered bodies for the current catalog version, split around the cart-count marker."""
+
+    def __init__(self, salt, max_entries=None):
+        # Changes whenever a template or the asset manifest changes, so ETags never outlive a deploy.
+        self.salt = salt
+        # None: unbounded
+        self.max_entries = max_entries
+        self._version = None
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def etag_base(self, template_name, version, year, variant=''):
+        key = f"{self.salt}:{template_name}:{variant}:{version}:{year}"
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+
+    def get(self, version, key):
+        if version != self._version:
+            return None
+        return self._entries.get(key)
+
+    def put(self, version, key, parts):
+        with self._lock:
+            if version != self._version:
+                # New catalog snapshot: every cached page is stale.
+                self._entries = {}
+                self._version = version
+            if self.max_entries is not None and len(self._entries) >= self.max_entries:
+                return
+            self._entries[key] = parts
+
+
+def _templates_digest(app):
+    digest = hashlib.sha1()
+    # Fingerprinted asset URLs are baked into rendered pages too.
+    digest.update(repr(sorted(app.extensions.get('asset_manifest', {}).items())).encode('utf-8'))
+    template_dir = os.path.join(app.root_path, app.template_folder)
+    for root, _, files in sorted(os.walk(template_dir)):
+        for name in sorted(files):
+            with open(os.path.join(root, name), 'rb') as file:
+                digest.update(name.encode('utf-8'))
+                digest.update(file.read())
+    return digest.hexdigest()[:12]
+
+
+def init_app(app):
+    # Compiled templates on disk; None turns the bytecode cache off
+    app.config.setdefault('TEMPLATE_BYTECODE_CACHE_DIR', os.path.join(app.root_path, '.jinja_cache'))
+    # Rendered product cards kept per catalog version
+    app.config.setdefault('FRAGMENT_CACHE_MAX_ENTRIES', 20000)
+    # Rendered pages per catalog version; every /shop filter combination is its own page
+    app.config.setdefault('PAGE_CACHE_MAX_ENTRIES', 512)
+
+    cache_dir = app.config['TEMPLATE_BYTECODE_CACHE_DIR']
+    if cache_dir:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+        except OSError as e:
+            print(f"Warning: Template bytecode cache disabled, cannot use {cache_dir}: {e}")
+
+    salt = _templates_digest(app)
+    app.extensions['page_cache'] = PageCache(salt, max_entries=app.config['PAGE_CACHE_MAX_ENTRIES'])
+    app.extensions['fragment_cache'] = PageCache(salt, max_entries=app.config['FRAGMENT_CACHE_MAX_ENTRIES'])
+    app.add_template_global(product_card)
+
+
+def product_card(product):
+    """The rendered _product_card.html for `product`, from the fragment cache when possible."""
+    cache = current_app.extensions['fragment_cache']
+    version = g.catalog.version
+    html = cache.get(version, product.id)
+    if html is None:
+        # Rendered without the request context processors: a card must not depend on the visitor.
+        html = Markup(current_app.jinja_env.get_template('_product_card.html').render(product=product))
+        cache.put(version, product.id, html)
+    return html
+
+
+def render_cached_page(template_name, cache_variant='', **context):
+    """
+    Like render_template, but served from the page cache with ETag and
+    Last-Modified validators. Only use it for pages whose output depends on
+    nothing but the catalog, the cart count and `cache_variant`.
+    """
+    cache = current_app.extensions['page_cache']
+    catalog = g.catalog
+    year = datetime.now().year
+    cart_count, _ = cart_summary()
+
+    etag = f"{cache.etag_base(template_name, catalog.version, year, cache_variant)}-{cart_count}"
+    last_modified = datetime.fromtimestamp(int(catalog.loaded_at), tz=timezone.utc)
+
+    # --- Conditional GET: answer before rendering anything ---
+    if request.if_none_match:
+        # Weak comparison (RFC 9110): compressed responses carry the tag as W/"..."
+        if request.if_none_match.contains_weak(etag):
+            return _not_modified(etag, last_modified)
+    elif request.if_modified_since and cart_count == 0:
+        # Last-Modified tracks the catalog only, so it can't vouch for a non-empty badge.
+        if last_modified <= request.if_modified_since:
+            return _not_modified(etag, last_modified)
+
+    key = (template_name, year, cache_variant)
+    parts = cache.get(catalog.version, key)
+    if parts is None:
+        body = render_template(template_name, cart_count=CART_COUNT_MARKER, **context)
+        parts = tuple(body.split(CART_COUNT_MARKER))
+        cache.put(catalog.version, key, parts)
+
+    response = make_response(str(cart_count).join(parts))
+    _set_validators(response, etag, last_modified)
+    return response
+
+
+def _not_modified(etag, last_modified):
+    response = make_response('', 304)
+    _set_validators(response, etag, last_modified)
+    return response
+
+
+def _set_validators(response, etag, last_modified):
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    # The body embeds this visitor's cart count: browsers may keep it, shared caches may not.
+    response.headers['Cache-Control'] = 'private, no-cache'
@@ -0,0 +1,300 @@
+"""
+Persistent crawl state for the Pinterest scraper, so a re-run only picks
+up pins it hasn't seen before.
+
+The state is a small SQLite database (product_detail/crawl_state.sqlite3
+by default, wherever the scraper is run from):
+
+    pins    one row per canonical pin key (pin_extract.pin_key), so a pin
+            seen at 236x and at 474x is one pin: the URL first seen, the
+            run that found it, the hash of its image once downloaded and
+            whether it has been appended to the output CSV
+    images  SHA-256 of downloaded image bytes -> the first pin with them;
+            the same photo re-pinned under another key is a duplicate and
+            is not exported
+    runs    when each run started, from where, and how many new pins it found
+
+New pins are committed scroll by scroll, then appended to the output CSV
+(never rewritten). On start, rows already in the CSV are reconciled with
+the database, so a run interrupted between the two neither loses nor
+repeats a row: the next run flushes whatever is pending and carries on.
+
+Nothing here needs Selenium. `replay` drives the same pipeline from saved
+search pages, so the whole crawl can be exercised offline:
+
+    python crawl_state.py replay page1.html [page2.html ...] [--state s.sqlite3]
+        [--out urls.csv] [--images-from DIR]
+
+--images-from stands in for the network when checking content dedup:
+each image is read from DIR by the file name in its URL. Saved pages and
+their images are in tests/fixtures/pinterest/.
+
+A download that fails is tried once per run: the pin stays out of the
+output until a later run fetches its image.
+"""
+import argparse
+import csv
+import hashlib
+import os
+import sqlite3
+import time
+import urllib.request
+
+from pin_extract import DEFAULT_PARSER, IncrementalExtractor, pin_key, split_grid_items
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATE_PATH = os.path.join(BASE_DIR, 'crawl_state.sqlite3')
+OUTPUT_CSV = os.path.join(BASE_DIR, 'terrarium_image_urls.csv')
+OUTPUT_COLUMN = 'image_url'
+DOWNLOAD_TIMEOUT = 20
+USER_AGENT = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+              'Chrome/100.0.4896.127 Safari/537.36')
+
+
+class CrawlState:
+    """What earlier runs found, downloaded and exported."""
+
+    def __init__(self, path=STATE_PATH):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " started_at REAL NOT NULL,"
+                " source TEXT NOT NULL,"
+                " new_pins INTEGER NOT NULL DEFAULT 0)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS pins ("
+                " key TEXT PRIMARY KEY,"
+                " src TEXT NOT NULL,"
+                " run_id INTEGER NOT NULL REFERENCES runs (id),"
+                " seen_at REAL NOT NULL,"
+                " content_hash TEXT,"
+                " duplicate_of TEXT,"
+                " exported INTEGER NOT NULL DEFAULT 0)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS images ("
+                " content_hash TEXT PRIMARY KEY,"
+                " pin_key TEXT NOT NULL,"
+                " path TEXT)"
+            )
+        # Every known key in memory: checking a scroll's pins never touches the database.
+        self._keys = {key for key, in self._conn.execute("SELECT key FROM pins")}
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __len__(self):
+        return len(self._keys)
+
+    def start_run(self, source):
+        with self._conn:
+            cursor = self._conn.execute("INSERT INTO runs (started_at, source) VALUES (?, ?)", (time.time(), source))
+        return cursor.lastrowid
+
+    def add_pins(self, run_id, srcs):
+        """Records the pins among `srcs` not seen by any run yet. Returns them as [(key, src)]."""
+        new = []
+        for src in srcs:
+            key = pin_key(src)
+            if key not in self._keys:
+                self._keys.add(key)
+                new.append((key, src))
+        if new:
+            now = time.time()
+            with self._conn:
+                self._conn.executemany("INSERT INTO pins (key, src, run_id, seen_at) VALUES (?, ?, ?, ?)",
+                                       [(key, src, run_id, now) for key, src in new])
+                self._conn.execute("UPDATE runs SET new_pins = new_pins + ? WHERE id = ?", (len(new), run_id))
+        return new
+
+    def record_image(self, key, data, path=None):
+        """
+        Stores the content hash of pin `key`'s image. Returns the key of an
+        earlier pin with identical bytes, or None if the image is new.
+        """
+        content_hash = hashlib.sha256(data).hexdigest()
+        with self._conn:
+            self._conn.execute("INSERT OR IGNORE INTO images (content_hash, pin_key, path) VALUES (?, ?, ?)",
+                               (content_hash, key, path))
+            owner, = self._conn.execute("SELECT pin_key FROM images WHERE content_hash = ?",
+                                        (content_hash,)).fetchone()
+            duplicate_of = owner if owner != key else None
+            self._conn.execute("UPDATE pins SET content_hash = ?, duplicate_of = ? WHERE key = ?",
+                               (content_hash, duplicate_of, key))
+        return duplicate_of
+
+    def has_image(self, data):
+        return self._conn.execute("SELECT 1 FROM images WHERE content_hash = ?",
+                                  (hashlib.sha256(data).hexdigest(),)).fetchone() is not None
+
+    def pending_downloads(self):
+        """[(key, src)] of unexported pins whose image hasn't been fetched yet, oldest first."""
+        return self._conn.execute(
+            "SELECT key, src FROM pins WHERE content_hash IS NULL AND exported = 0 ORDER BY rowid").fetchall()
+
+    def pending_exports(self, require_image=False):
+        """[(key, src)] of pins not yet in the output, oldest first; duplicates never are."""
+        query = "SELECT key, src FROM pins WHERE exported = 0 AND duplicate_of IS NULL"
+        if require_image:
+            query += " AND content_hash IS NOT NULL"
+        return self._conn.execute(query + " ORDER BY rowid").fetchall()
+
+    def mark_exported(self, keys):
+        with self._conn:
+            self._conn.executemany("UPDATE pins SET exported = 1 WHERE key = ?", [(key,) for key in keys])
+
+    def reconcile(self, out_path):
+        """Marks pins already present in `out_path` as exported (a run may have stopped in between)."""
+        keys = [pin_key(src) for src in read_output(out_path)]
+        self.mark_exported([key for key in keys if key in self._keys])
+
+    def close(self):
+        self._conn.close()
+
+
+# --- Output CSV (append-only) ---
+def read_output(out_path):
+    try:
+        with open(out_path, newline='', encoding='utf-8') as file:
+            return [row[OUTPUT_COLUMN] for row in csv.DictReader(file) if row.get(OUTPUT_COLUMN)]
+    except FileNotFoundError:
+        return []
+
+
+def append_output(out_path, srcs):
+    """Appends one row per URL, writing the header first if the file is new, and syncs it to disk."""
+    write_header = not os.path.exists(out_path) or os.path.getsize(out_path) == 0
+    with open(out_path, 'a', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        if write_header:
+            writer.writerow([OUTPUT_COLUMN])
+        writer.writerows([src] for src in srcs)
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def fetch_url(src):
+    request = urllib.request.Request(src, headers={'User-Agent': USER_AGENT})
+    with urllib.request.urlopen(request, timeout=DOWNLOAD_TIMEOUT) as response:
+        return response.read()
+
+
+# --- One crawl run ---
+class Crawl:
+    """
+    Feeds batches of grid items through the extractor, keeps the pins no
+    earlier run has seen, optionally downloads and dedups their images,
+    and appends them to the output CSV.
+    """
+
+    def __init__(self, state, out_path=OUTPUT_CSV, source='', fetch=None, images_dir=None, parser=DEFAULT_PARSER):
+        self.state = state
+        self.out_path = out_path
+        # fetch(url) -> bytes; None skips downloads (and content dedup)
+        self.fetch = fetch
+        self.images_dir = images_dir
+        self.extractor = IncrementalExtractor(parser)
+        self.run_id = state.start_run(source)
+        self.new_pins = 0
+        self.known_pins = 0
+        self.duplicates = 0
+        self.exported = 0
+        # Pins whose download failed this run: retried by the next run, not on every scroll of this one
+        self.failed_downloads = set()
+        if images_dir:
+            os.makedirs(images_dir, exist_ok=True)
+        state.reconcile(out_path)
+        # Whatever an interrupted run left behind goes out first.
+        self.flush()
+
+    def feed(self, fragments):
+        """Processes newly added grid items. Returns the URLs of pins new to the crawl state."""
+        srcs = self.extractor.feed(fragments)
+        new = self.state.add_pins(self.run_id, srcs)
+        self.new_pins += len(new)
+        self.known_pins += len(srcs) - len(new)
+        self.flush()
+        return [src for _, src in new]
+
+    def _download(self, key, src):
+        try:
+            data = self.fetch(src)
+        except Exception as e:
+            print(f"Warning: Could not download {src}: {e}. Retrying next run.")
+            self.failed_downloads.add(key)
+            return
+        path = None
+        if self.images_dir and not self.state.has_image(data):
+            extension = os.path.splitext(src.split('?', 1)[0])[1] or '.jpg'
+            path = os.path.join(self.images_dir, hashlib.sha256(data).hexdigest()[:20] + extension)
+            with open(path, 'wb') as file:
+                file.write(data)
+        if self.state.record_image(key, data, path) is not None:
+            self.duplicates += 1
+
+    def flush(self):
+        if self.fetch is not None:
+            for key, src in self.state.pending_downloads():
+                if key not in self.failed_downloads:
+                    self._download(key, src)
+        rows = self.state.pending_exports(require_image=self.fetch is not None)
+        if rows:
+            # File first, then the database: a crash in between is repaired by reconcile().
+            append_output(self.out_path, [src for _, src in rows])
+            self.state.mark_exported([key for key, _ in rows])
+            self.exported += len(rows)
+
+    def summary(self):
+        summary = (f"{self.new_pins} new pins, {self.known_pins} already known, "
+                   f"{self.duplicates} duplicate images, {self.exported} rows appended to {self.out_path}")
+        if self.failed_downloads:
+            summary += f", {len(self.failed_downloads)} downloads left for the next run"
+        return summary
+
+
+# --- Offline replay ---
+def _fetch_from(directory):
+    def fetch(src):
+        with open(os.path.join(directory, os.path.basename(src.split('?', 1)[0])), 'rb') as file:
+            return file.read()
+    return fetch
+
+
+def replay(page_paths, state, out_path, batch_size=25, fetch=None, images_dir=None):
+    """Runs a crawl over saved search pages, one batch of grid items per "scroll"."""
+    crawl = Crawl(state, out_path, source='replay:' + ','.join(page_paths), fetch=fetch, images_dir=images_dir)
+    for page_path in page_paths:
+        with open(page_path, encoding='utf-8') as file:
+            fragments = split_grid_items(file.read())
+        for start in range(0, len(fragments), batch_size):
+            crawl.feed(fragments[start:start + batch_size])
+    return crawl
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description='Crawl-state tools for the Pinterest scraper.')
+    sub = arg_parser.add_subparsers(dest='command', required=True)
+    replay_cmd = sub.add_parser('replay', help='Run a crawl over saved search pages, offline')
+    replay_cmd.add_argument('pages', nargs='+')
+    replay_cmd.add_argument('--state', default=STATE_PATH)
+    replay_cmd.add_argument('--out', default=OUTPUT_CSV)
+    replay_cmd.add_argument('--batch-size', type=int, default=25)
+    replay_cmd.add_argument('--images-from', metavar='DIR', help='Read images from DIR instead of downloading')
+    replay_cmd.add_argument('--images-dir', metavar='DIR', help='Keep one copy of each distinct image here')
+    args = arg_parser.parse_args(argv)
+
+    state = CrawlState(args.state)
+    try:
+        fetch = _fetch_from(args.images_from) if args.images_from else None
+        crawl = replay(args.pages, state, args.out, args.batch_size, fetch, args.images_dir)
+        print(f"Run {crawl.run_id}: {crawl.summary()} ({len(state)} pins known)")
+    finally:
+        state.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""
+Selenium-free extraction core for the Pinterest scraper.
+
+The scraper hands this module only the grid items that appeared since the
+last scroll, so each scroll costs O(new pins) rather than O(all pins seen).
+The same code runs offline against saved HTML for benchmarking:
+
+    python pin_extract.py bench saved_search_page.html [--repeat 5]
+
+tests/fixtures/pinterest/ holds saved search pages for this and the tests.
+"""
+import argparse
+import re
+import time
+from urllib.parse import urlsplit
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    import lxml  # noqa: F401  (only checked for availability)
+    DEFAULT_PARSER = 'lxml'
+except ImportError:
+    DEFAULT_PARSER = 'html.parser'
+
+GRID_ITEM_SELECTOR = 'div[data-grid-item="true"]'
+# Filter criteria: must be an external URL and contain size info (like 236x or 474x)
+IMAGE_SIZE_MARKERS = ('236x', '474x')
+
+# Only build tree nodes for <img>; everything else is skipped by the parser.
+_IMG_ONLY = SoupStrainer('img')
+# i.pinimg.com/<size>/ab/cd/ef/abcdef....jpg: everything after the size names the image
+_PINIMG_PATH_RE = re.compile(r'^/[^/]+/((?:[0-9a-f]{2}/){3}[0-9a-f]+)\.\w+$', re.IGNORECASE)
+
+
+def is_pin_image(src):
+    return bool(src) and src.startswith('https') and any(marker in src for marker in IMAGE_SIZE_MARKERS)
+
+
+def pin_key(src):
+    """Canonical key for a pin image: the same for every size Pinterest serves it at."""
+    parts = urlsplit(src)
+    if parts.netloc.lower() == 'i.pinimg.com':
+        match = _PINIMG_PATH_RE.match(parts.path)
+        if match:
+            return match.group(1).lower()
+    # Some other layout: the URL without scheme, query or fragment.
+    return parts.netloc.lower() + parts.path
+
+
+def extract_image_urls(html, parser=DEFAULT_PARSER):
+    """Pin image URLs in one HTML fragment, in document order."""
+    soup = BeautifulSoup(html, parser, parse_only=_IMG_ONLY)
+    return [img.get('src') for img in soup.find_all('img') if is_pin_image(img.get('src'))]
+
+
+def split_grid_items(page_html, parser=DEFAULT_PARSER):
+    """Splits a saved full page into grid-item fragments, as the live scraper would receive them."""
+    strainer = SoupStrainer('div', attrs={'data-grid-item': 'true'})
+    soup = BeautifulSoup(page_html, parser, parse_only=strainer)
+    return [str(item) for item in soup.find_all('div', attrs={'data-grid-item': 'true'}, recursive=False)]
+
+
+# --- Throughput stats ---
+class ScrapeStats:
+    """Pins/sec and parse time per scroll for one scrape run."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.scrolls = 0
+        self.pins = 0
+        self.parse_seconds = []
+
+    def record_scroll(self, new_pins, parse_seconds):
+        self.scrolls += 1
+        self.pins += new_pins
+        self.parse_seconds.append(parse_seconds)
+
+    @property
+    def pins_per_sec(self):
+        elapsed = time.perf_counter() - self.started
+        return self.pins / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def parse_ms_per_scroll(self):
+        if not self.parse_seconds:
+            return 0.0
+        return 1000.0 * sum(self.parse_seconds) / len(self.parse_seconds)
+
+    def summary(self):
+        return (f"{self.pins} pins in {self.scrolls} scrolls | "
+                f"{self.pins_per_sec:.1f} pins/sec | {self.parse_ms_per_scroll:.2f} ms parse/scroll")
+
+
+# --- Incremental extraction ---
+class IncrementalExtractor:
+    """
+    Accumulates unique pins from batches of newly added grid items. Pins
+    are told apart by pin_key(), so one image at 236x and 474x counts once.
+    """
+
+    def __init__(self, parser=DEFAULT_PARSER):
+        self.parser = parser
+        self.image_urls = {}  # pin key -> first URL seen; dict keeps first-seen order
+        self.stats = ScrapeStats()
+
+    def feed(self, fragments):
+        """Parses only the given new grid items. Returns the URLs of pins not seen before."""
+        started = time.perf_counter()
+        new_urls = []
+        for fragment in fragments:
+            for src in extract_image_urls(fragment, self.parser):
+                key = pin_key(src)
+                if key not in self.image_urls:
+                    self.image_urls[key] = src
+                    new_urls.append(src)
+        self.stats.record_scroll(len(new_urls), time.perf_counter() - started)
+        return new_urls
+
+    def __len__(self):
+        return len(self.image_urls)
+
+
+# --- Offline benchmark ---
+def bench(page_html, batch_size=25, repeat=3):
+    """
+    Replays a saved page as scroll batches and compares re-parsing the whole
+    page every scroll (the old loop) with feeding only the new batch.
+    """
+    fragments = split_grid_items(page_html)
+    batches = [fragments[i:i + batch_size] for i in range(0, len(fragments), batch_size)]
+    results = {}
+
+    for parser in dict.fromkeys(('html.parser', DEFAULT_PARSER)):
+        # Old behaviour: the page grows by one batch, and all of it is parsed again.
+        best_full = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for count in range(1, len(batches) + 1):
+                grown = ''.join(''.join(batch) for batch in batches[:count])
+                BeautifulSoup(grown, parser).find_all('img')
+            best_full = min(best_full, time.perf_counter() - started)
+
+        best_incremental = float('inf')
+        for _ in range(repeat):
+            extractor = IncrementalExtractor(parser)
+            started = time.perf_counter()
+            for batch in batches:
+                extractor.feed(batch)
+            best_incremental = min(best_incremental, time.perf_counter() - started)
+
+        results[parser] = {
+            'grid_items': len(fragments),
+            'scrolls': len(batches),
+            'full_reparse_ms': round(best_full * 1000, 2),
+            'incremental_ms': round(best_incremental * 1000, 2),
+            'pins': len(extractor),
+        }
+    return results
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description='Offline benchmark for pin extraction.')
+    sub = arg_parser.add_subparsers(dest='command', required=True)
+    bench_cmd = sub.add_parser('bench')
+    bench_cmd.add_argument('html_file')
+    bench_cmd.add_argument('--batch-size', type=int, default=25)
+    bench_cmd.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args(argv)
+
+    with open(args.html_file, encoding='utf-8') as file:
+        page_html = file.read()
+    for label, result in bench(page_html, args.batch_size, args.repeat).items():
+        print(f"{label:>12}: {result}")
+
+
+if __name__ == '__main__':
+    main()
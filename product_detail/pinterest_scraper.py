@@ -1,21 +1,55 @@
-import pandas as pd
+import argparse
+
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
 from webdriver_manager.chrome import ChromeDriverManager
-from bs4 import BeautifulSoup
-import time
+
+from crawl_state import OUTPUT_CSV, STATE_PATH, Crawl, CrawlState, fetch_url
+from pin_extract import GRID_ITEM_SELECTOR
 
 # --- Configuration ---
 PINTEREST_URL = "https://in.pinterest.com/search/pins/?q=terrarium&rs=typed"
 # We aim for ~20, so we set a higher limit to ensure we get enough unique, high-quality images.
+# Counts pins new to the crawl state: pins found by earlier runs are skipped.
 TARGET_IMAGE_COUNT = 30
+# Max seconds to wait for new grid items after a scroll (replaces the fixed 3s sleep)
+SCROLL_TIMEOUT = 10
 # --- End Configuration ---
 
-def scrape_pinterest_images(url, target_count):
+# Returns outerHTML of grid items not handed out before and tags them as seen.
+# Pinterest recycles grid nodes as you scroll, so positions can't be used to find new ones.
+_TAKE_NEW_ITEMS_JS = """
+const items = document.querySelectorAll(arguments[0] + ':not([data-tn-seen])');
+return Array.from(items, item => { item.setAttribute('data-tn-seen', '1'); return item.outerHTML; });
+"""
+_COUNT_NEW_ITEMS_JS = "return document.querySelectorAll(arguments[0] + ':not([data-tn-seen])').length;"
+
+def _take_new_grid_items(driver):
+    return driver.execute_script(_TAKE_NEW_ITEMS_JS, GRID_ITEM_SELECTOR)
+
+def _wait_for_new_grid_items(driver, timeout):
+    """Blocks until unseen grid items exist. Returns False on timeout."""
+    try:
+        WebDriverWait(driver, timeout, poll_frequency=0.2).until(
+            lambda d: d.execute_script(_COUNT_NEW_ITEMS_JS, GRID_ITEM_SELECTOR) > 0
+        )
+        return True
+    except TimeoutException:
+        return False
+
+def scrape_pinterest_images(url, target_count, state_path=STATE_PATH, out_path=OUTPUT_CSV,
+                            download=False, images_dir=None):
+    """
+    Scrolls the search until `target_count` pins no earlier run has seen
+    were found, appending them to `out_path` as it goes (see crawl_state.py).
+    With `download`, images are fetched and pins whose bytes match an
+    earlier image are left out.
+    """
     print(f"Starting Selenium scrape for Pinterest: {url}")
     
     options = Options()
@@ -40,7 +74,9 @@ def scrape_pinterest_images(url, target_count):
         print(f"ERROR: Could not initialize WebDriver. Error: {e}")
         return []
     
-    image_urls = set()
+    state = CrawlState(state_path)
+    crawl = Crawl(state, out_path, source=url, fetch=fetch_url if download else None, images_dir=images_dir)
+    print(f"Crawl state: {len(state)} pins known from earlier runs.")
 
     try:
         driver.get(url)
@@ -48,60 +84,49 @@ def scrape_pinterest_images(url, target_count):
         
         # Initial wait targeting a common element on the page (more stable)
         WebDriverWait(driver, 20).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, 'div[data-grid-item="true"]'))
+            EC.presence_of_element_located((By.CSS_SELECTOR, GRID_ITEM_SELECTOR))
         )
         print("Initial pins loaded. Starting scroll to fetch more...")
+
+        # Pins already on the first screen
+        crawl.feed(_take_new_grid_items(driver))
         
         scroll_count = 0
         max_scrolls = 10 
         
-        while len(image_urls) < target_count and scroll_count < max_scrolls:
+        while crawl.new_pins < target_count and scroll_count < max_scrolls:
             # Scroll to the bottom to load new pins
             driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(3) # Increased wait for the slow Pinterest image loading
-
-            html = driver.page_source
-            soup = BeautifulSoup(html, 'html.parser')
-            
-            # --- CRITICAL FIX: Target all <img> tags and filter them ---
-            img_elements = soup.find_all('img')
-            
-            initial_count = len(image_urls)
-            
-            for img in img_elements:
-                src = img.get('src')
-                # Filter criteria: must be an external URL and contain size info (like 236x or 474x)
-                if src and src.startswith('https') and any(s in src for s in ['236x', '474x']):
-                    image_urls.add(src)
 
-            # Check if we made progress
-            if len(image_urls) == initial_count and scroll_count > 1:
-                print("No new unique images found after scrolling. Stopping.")
+            # Wait for the grid to grow instead of sleeping a fixed interval
+            if not _wait_for_new_grid_items(driver, SCROLL_TIMEOUT):
+                print("No new pins appeared after scrolling. Stopping.")
                 break
 
-            print(f"  > Scrolled {scroll_count + 1} times. Found {len(image_urls)} unique image URLs.")
+            # Parse only the newly added grid items; new pins are appended to the CSV right away
+            new_urls = crawl.feed(_take_new_grid_items(driver))
             scroll_count += 1
+            print(f"  > Scrolled {scroll_count} times. +{len(new_urls)} new, {crawl.new_pins} new this run.")
 
-        # Finalize the list
-        final_list = list(image_urls)[:target_count]
-        
-        print(f"\nSUCCESS: Extracted {len(final_list)} image URLs.")
-        
-        # Convert to DataFrame and save to CSV
-        df = pd.DataFrame(final_list, columns=['image_url'])
-        df.to_csv("terrarium_image_urls.csv", index=False, encoding='utf-8')
-        
-        print(f"Data saved to terrarium_image_urls.csv")
-        return final_list
+        print(f"Throughput: {crawl.extractor.stats.summary()}")
+        print(f"\nSUCCESS: {crawl.summary()}")
+        return list(crawl.extractor.image_urls.values())
 
     except Exception as e:
         print(f"\nCRITICAL FAILURE: An error occurred during page interaction: {e}")
         return []
     finally:
         driver.quit()
-
-# ... (The if __name__ == "__main__": block remains the same)
+        state.close()
 
 # --- Execution ---
 if __name__ == "__main__":
-    scrape_pinterest_images(PINTEREST_URL, TARGET_IMAGE_COUNT)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Collect terrarium pin images from a Pinterest search.')
+    parser.add_argument('--url', default=PINTEREST_URL)
+    parser.add_argument('--target', type=int, default=TARGET_IMAGE_COUNT, help='New pins to collect')
+    parser.add_argument('--state', default=STATE_PATH, help='Crawl-state database')
+    parser.add_argument('--out', default=OUTPUT_CSV, help='CSV that new image URLs are appended to')
+    parser.add_argument('--download', action='store_true', help='Fetch images and drop duplicate content')
+    parser.add_argument('--images-dir', help='With --download, keep one copy of each distinct image here')
+    args = parser.parse_args()
+    scrape_pinterest_images(args.url, args.target, args.state, args.out, args.download, args.images_dir)
\ No newline at end of file
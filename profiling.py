@@ -0,0 +1,235 @@
+"""
+Opt-in, in-place profiling of live requests.
+
+A request is profiled when either
+  * it carries a valid X-Profile-Token header (signed with the app's secret
+    key, see `python profiling.py token`), or
+  * its endpoint is listed in PROFILE_SAMPLE_RATES, e.g. {'shop': 0.01}, and
+    it wins the coin toss.
+
+Each profiled request writes two files to PROFILE_DIR, which keeps only the
+newest PROFILE_MAX_FILES:
+    <stem>.pstats   cProfile data, for `python -m pstats` or snakeviz
+    <stem>.folded   collapsed stacks from a 1 ms wall-clock stack sampler,
+                    ready for flamegraph.pl / speedscope
+and the response gets an X-Profile-Id header naming <stem>.
+
+    python profiling.py report [--dir profiles] [--endpoint shop] [--top 30]
+
+merges every sample into one hot-function table and writes aggregate.folded.
+
+Only one request is profiled at a time per process; others that would have
+been sampled run normally. Unprofiled requests pay one header lookup and,
+for listed endpoints, one random() call.
+"""
+import argparse
+import cProfile
+import glob
+import io
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import current_app, g, request
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+TOKEN_HEADER = 'X-Profile-Token'
+ID_HEADER = 'X-Profile-Id'
+TOKEN_SALT = 'tn-profile'
+SAMPLE_INTERVAL = 0.001
+
+# One profiled request at a time: cProfile and the sampler both assume it.
+_profile_slot = threading.Lock()
+
+
+# --- Tokens ---
+def _serializer(secret_key):
+    return URLSafeTimedSerializer(secret_key, salt=TOKEN_SALT)
+
+
+def make_token(secret_key):
+    return _serializer(secret_key).dumps('profile')
+
+
+def _token_is_valid(token, secret_key, max_age):
+    try:
+        return _serializer(secret_key).loads(token, max_age=max_age) == 'profile'
+    except BadSignature:
+        return False
+
+
+# --- Stack sampler ---
+class StackSampler:
+    """Samples one thread's Python stack at a fixed interval into collapsed-stack counts."""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='tn-stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(names))] += 1
+
+    def folded(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+# --- Request hooks ---
+def _should_profile():
+    config = current_app.config
+    token = request.headers.get(TOKEN_HEADER)
+    if token is not None:
+        return _token_is_valid(token, current_app.secret_key, config['PROFILE_TOKEN_MAX_AGE'])
+    rate = config['PROFILE_SAMPLE_RATES'].get(request.endpoint)
+    return rate is not None and random.random() < rate
+
+
+def _start_profile():
+    if not _should_profile() or not _profile_slot.acquire(blocking=False):
+        return
+    sampler = StackSampler(threading.get_ident())
+    profiler = cProfile.Profile()
+    g.profile = (profiler, sampler, time.time())
+    sampler.start()
+    profiler.enable()
+
+
+def _stop_profile(response):
+    profile = g.pop('profile', None)
+    if profile is None:
+        return response
+    profiler, sampler, started = profile
+    try:
+        profiler.disable()
+        sampler.stop()
+        stem = _write_profile(current_app.config, profiler, sampler, started)
+        response.headers[ID_HEADER] = stem
+    finally:
+        _profile_slot.release()
+    return response
+
+
+def _abandon_profile(exc):
+    # after_request never ran (unhandled error): just free the slot.
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile[0].disable()
+        profile[1].stop()
+        _profile_slot.release()
+
+
+def _write_profile(config, profiler, sampler, started):
+    directory = config['PROFILE_DIR']
+    os.makedirs(directory, exist_ok=True)
+    stamp = time.strftime('%Y%m%dT%H%M%S', time.localtime(started))
+    stem = f"{stamp}-{int(started * 1000) % 1000:03d}-{request.endpoint or 'unmatched'}-{os.getpid()}"
+    profiler.dump_stats(os.path.join(directory, stem + '.pstats'))
+    with open(os.path.join(directory, stem + '.folded'), 'w', encoding='utf-8') as file:
+        file.write(sampler.folded())
+    _rotate(directory, config['PROFILE_MAX_FILES'])
+    return stem
+
+
+def _rotate(directory, max_files):
+    """Deletes the oldest profiles so at most `max_files` remain."""
+    stems = sorted({os.path.splitext(name)[0] for name in os.listdir(directory)
+                    if name.endswith(('.pstats', '.folded')) and not name.startswith('aggregate')})
+    for stem in stems[:-max_files] if max_files > 0 else stems:
+        for extension in ('.pstats', '.folded'):
+            try:
+                os.remove(os.path.join(directory, stem + extension))
+            except FileNotFoundError:
+                pass
+
+
+def init_app(app):
+    app.config.setdefault('PROFILE_ENABLED', False)
+    app.config.setdefault('PROFILE_DIR', os.path.join(app.root_path, 'profiles'))
+    app.config.setdefault('PROFILE_MAX_FILES', 200)
+    # endpoint -> fraction of its requests to profile, e.g. {'shop': 0.01}
+    app.config.setdefault('PROFILE_SAMPLE_RATES', {})
+    # Lifetime of a signed X-Profile-Token, in seconds
+    app.config.setdefault('PROFILE_TOKEN_MAX_AGE', 3600)
+    if not app.config['PROFILE_ENABLED']:
+        return
+
+    app.before_request(_start_profile)
+    app.after_request(_stop_profile)
+    app.teardown_request(_abandon_profile)
+
+
+# --- Offline report ---
+def report(directory, endpoint=None, top=30, out=sys.stdout):
+    pattern = f"*-{endpoint}-*" if endpoint else '*'
+    stat_files = sorted(glob.glob(os.path.join(directory, pattern + '.pstats')))
+    if not stat_files:
+        print(f"No profiles in {directory}", file=out)
+        return None
+
+    buffer = io.StringIO()
+    stats = pstats.Stats(*stat_files, stream=buffer)
+    stats.strip_dirs().sort_stats('tottime').print_stats(top)
+    print(f"{len(stat_files)} profiled requests", file=out)
+    print(buffer.getvalue(), file=out)
+
+    stacks = Counter()
+    for path in glob.glob(os.path.join(directory, pattern + '.folded')):
+        with open(path, encoding='utf-8') as file:
+            for line in file:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                if stack:
+                    stacks[stack] += int(count)
+    aggregate = os.path.join(directory, f"aggregate-{endpoint}.folded" if endpoint else 'aggregate.folded')
+    with open(aggregate, 'w', encoding='utf-8') as file:
+        file.writelines(f"{stack} {count}\n" for stack, count in stacks.most_common())
+    print(f"Collapsed stacks for a flamegraph: {aggregate}", file=out)
+    return aggregate
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Request profiling tools.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    token = commands.add_parser('token', help="Print an X-Profile-Token signed with the app's secret key")
+    token.add_argument('--secret', help="Defaults to app.secret_key")
+
+    summary = commands.add_parser('report', help='Aggregate saved profiles')
+    summary.add_argument('--dir', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles'))
+    summary.add_argument('--endpoint')
+    summary.add_argument('--top', type=int, default=30)
+
+    args = parser.parse_args(argv)
+    if args.command == 'token':
+        secret = args.secret
+        if secret is None:
+            from app import create_app
+            secret = create_app({'WARMUP_PATHS': []}).secret_key
+        print(make_token(secret))
+    else:
+        report(args.dir, args.endpoint, args.top)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""
+Token-bucket rate limiting for the cart mutation endpoints.
+
+/add-premade-to-cart-ajax, /buy-now, /add-premade-to-cart,
+/remove-from-cart, /clear-cart and /api/cart/lines each load the cart,
+touch the stock ledger and re-sign the session cookie. A bot or a client
+stuck in a retry loop can keep workers busy doing just that, so every
+request to them takes a token from two buckets first:
+
+    per IP       REMOTE_ADDR (put werkzeug's ProxyFix in front of the app
+                 when behind a proxy); sized for several shoppers behind
+                 one NAT
+    per session  the raw session cookie value, read without verifying
+                 its signature: a forged cookie only gets a bucket of its
+                 own, and the IP bucket still applies to it
+
+A bucket holds up to `burst` tokens and refills at `rate` per second, so a
+shopper can click through a burst and then keeps a steady allowance. An
+empty bucket answers 429 with Retry-After: the time until its next token.
+
+The check runs as WSGI middleware, in front of Flask: a rejected request
+never builds a request context, opens or saves the session or runs a
+hook, so turning one away costs a few microseconds. Buckets live in a
+bounded LRU per limiter (RATE_LIMIT_MAX_BUCKETS); evicting one only forgets
+how much a quiet client had spent. Like the in-memory cart store, buckets
+are per process: under gunicorn each worker counts on its own.
+"""
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from werkzeug.http import parse_cookie
+
+import metrics
+
+DEFAULT_PATHS = (
+    '/add-premade-to-cart-ajax/',
+    '/buy-now/',
+    '/add-premade-to-cart/',
+    '/remove-from-cart/',
+    '/clear-cart',
+    '/api/cart/lines',
+)
+
+
+class TokenBucketLimiter:
+    """Buckets of `burst` tokens refilled at `rate` per second, one per key, at most `max_buckets` kept."""
+
+    def __init__(self, rate, burst, max_buckets=100000):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.max_buckets = max_buckets
+        # key -> [tokens, monotonic time they were counted]
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, now=None):
+        """Takes a token for `key`. Returns 0.0 if one was there, else the seconds until there is."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now]
+                while len(self._buckets) > self.max_buckets:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1.0:
+                bucket[0] -= 1.0
+                return 0.0
+            return (1.0 - bucket[0]) / self.rate
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class RateLimitMiddleware:
+    """Wraps a WSGI app; requests under `paths` must get a token from every limiter that applies."""
+
+    def __init__(self, wsgi_app, ip_limiter, session_limiter, paths=DEFAULT_PATHS, session_cookie='session'):
+        self.wsgi_app = wsgi_app
+        self.ip_limiter = ip_limiter
+        self.session_limiter = session_limiter
+        self.paths = tuple(paths)
+        self.session_cookie = session_cookie
+        self.enabled = True
+
+    def __call__(self, environ, start_response):
+        if self.enabled and environ.get('PATH_INFO', '').startswith(self.paths):
+            scope, wait = self.check(environ)
+            if wait:
+                metrics.RATE_LIMITED_TOTAL.inc(scope)
+                return self._too_many_requests(wait, start_response)
+        return self.wsgi_app(environ, start_response)
+
+    def check(self, environ):
+        """(scope, seconds to wait), or (None, 0.0) when the request may go ahead."""
+        # The IP bucket first: a client rotating cookies shouldn't spend session tokens it never gets to use.
+        wait = self.ip_limiter.take(environ.get('REMOTE_ADDR') or '-')
+        if wait:
+            return 'ip', wait
+        cookie = environ.get('HTTP_COOKIE')
+        if cookie:
+            session_value = parse_cookie(cookie).get(self.session_cookie)
+            if session_value:
+                wait = self.session_limiter.take(session_value)
+                if wait:
+                    return 'session', wait
+        return None, 0.0
+
+    @staticmethod
+    def _too_many_requests(wait, start_response):
+        retry_after = max(1, math.ceil(wait))
+        body = json.dumps({
+            'success': False,
+            'message': f"Too many requests. Please try again in {retry_after} s.",
+        }).encode()
+        start_response('429 Too Many Requests', [
+            ('Content-Type', 'application/json'),
+            ('Content-Length', str(len(body))),
+            ('Retry-After', str(retry_after)),
+            ('Cache-Control', 'no-store'),
+        ])
+        return [body]
+
+
+def init_app(app):
+    app.config.setdefault('RATE_LIMIT_ENABLED', True)
+    # Path prefixes that take a token (the cart mutation endpoints)
+    app.config.setdefault('RATE_LIMIT_PATHS', DEFAULT_PATHS)
+    # Per session cookie: tokens per second and bucket size
+    app.config.setdefault('RATE_LIMIT_SESSION_RATE', 2.0)
+    app.config.setdefault('RATE_LIMIT_SESSION_BURST', 20)
+    # Per client IP: roomier, several shoppers can share one address
+    app.config.setdefault('RATE_LIMIT_IP_RATE', 10.0)
+    app.config.setdefault('RATE_LIMIT_IP_BURST', 60)
+    # Buckets kept per limiter before the least recently used are evicted
+    app.config.setdefault('RATE_LIMIT_MAX_BUCKETS', 100000)
+
+    config = app.config
+    middleware = RateLimitMiddleware(
+        app.wsgi_app,
+        TokenBucketLimiter(config['RATE_LIMIT_IP_RATE'], config['RATE_LIMIT_IP_BURST'],
+                           config['RATE_LIMIT_MAX_BUCKETS']),
+        TokenBucketLimiter(config['RATE_LIMIT_SESSION_RATE'], config['RATE_LIMIT_SESSION_BURST'],
+                           config['RATE_LIMIT_MAX_BUCKETS']),
+        config['RATE_LIMIT_PATHS'],
+        config['SESSION_COOKIE_NAME'],
+    )
+    middleware.enabled = config['RATE_LIMIT_ENABLED']
+    app.wsgi_app = middleware
+    app.extensions['rate_limit'] = middleware
+    return middleware
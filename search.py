@@ -0,0 +1,324 @@
+"""
+Full-text product search with prefix (type-ahead) matching.
+
+SearchIndex is an inverted index over product names and descriptions:
+
+  * tokens are case-folded runs of letters/digits, minus a few stop words
+  * each (term, product) posting carries a precomputed BM25 score, with
+    name matches weighted above description matches
+  * the vocabulary is a sorted list, so the terms that start with a prefix
+    are one contiguous range found by bisection (a flattened trie)
+  * per term, product ids are kept sorted for membership checks and an
+    impact order (best score first) lets a query stop scanning once nothing
+    left can reach the top results
+  * common terms also carry a bitset of their products, so queries made of
+    common words intersect with a few big-int ANDs
+
+Every query word must match. The last one also matches as a prefix, so
+"mos" finds "moss" while the shopper is still typing. Postings live in
+compact arrays (about 12 bytes each), so 100k products fit in a few tens
+of MB.
+
+The index is rebuilt for every new catalog snapshot, off the request path:
+CatalogReloader hands each new snapshot to SearchService.rebuild before
+swapping it in.
+"""
+import heapq
+import math
+import re
+import time
+from array import array
+from bisect import bisect_left
+
+from flask import current_app
+
+TOKEN_RE = re.compile(r'[^\W_]+')
+STOP_WORDS = frozenset(['a', 'an', 'and', 'for', 'in', 'of', 'on', 'or', 'the', 'to', 'with', 'your'])
+
+NAME_WEIGHT = 3.0
+BM25_K1 = 1.2
+BM25_B = 0.75
+# A prefix completion ranks a little below the same word typed out in full.
+PREFIX_PENALTY = 0.8
+MIN_PREFIX_LENGTH = 2
+MAX_PREFIX_TERMS = 64
+# Multi-word queries: intersect in C while the id arrays are at most this many times the candidates
+INTERSECT_RATIO = 10
+# ...and score every match directly when there are at most this many
+SCORE_ALL_BELOW = 2000
+# Terms in at least 1/BITSET_FRACTION of products (and BITSET_MIN_POSTINGS) also get a bitset
+BITSET_FRACTION = 32
+BITSET_MIN_POSTINGS = 256
+
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall(text.casefold()) if token not in STOP_WORDS]
+
+
+class _Postings:
+    __slots__ = ('ids', 'scores', 'impact', 'max_score', 'bits')
+
+    def __init__(self, entries):
+        # entries: [(product id, score)]
+        entries.sort()
+        self.ids = array('I', [product_id for product_id, _ in entries])
+        self.scores = array('f', [score for _, score in entries])
+        order = sorted(range(len(entries)), key=lambda i: (-entries[i][1], entries[i][0]))
+        self.impact = array('I', order)
+        self.max_score = self.scores[order[0]]
+        # int bitset of ids, set by SearchIndex for common terms only
+        self.bits = None
+
+    def score(self, product_id):
+        index = bisect_left(self.ids, product_id)
+        if index < len(self.ids) and self.ids[index] == product_id:
+            return self.scores[index]
+        return None
+
+    def by_impact(self, weight):
+        ids, scores = self.ids, self.scores
+        for index in self.impact:
+            yield scores[index] * weight, ids[index]
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class BitsetMembers:
+    """Set-like view of an int bitset: O(1) membership, iteration over the set bits."""
+
+    __slots__ = ('_bytes', '_count')
+
+    def __init__(self, bits, size):
+        self._bytes = bits.to_bytes(size, 'little')
+        self._count = bits.bit_count()
+
+    def __contains__(self, product_id):
+        index = product_id >> 3
+        return index < len(self._bytes) and self._bytes[index] >> (product_id & 7) & 1
+
+    def __iter__(self):
+        return self.after(-1)
+
+    def after(self, product_id):
+        """Set ids greater than `product_id`, ascending (resumes a page without walking the ones before it)."""
+        start = max(0, product_id + 1)
+        first = start >> 3
+        for index in range(first, len(self._bytes)):
+            byte = self._bytes[index]
+            if index == first:
+                byte &= 0xFF << (start & 7)
+            while byte:
+                low = byte & -byte
+                yield index * 8 + low.bit_length() - 1
+                byte ^= low
+
+    def __len__(self):
+        return self._count
+
+
+class SearchIndex:
+    """Immutable inverted index over one catalog snapshot."""
+
+    def __init__(self, products, version=None):
+        self.version = version
+        documents = []
+        total_length = 0.0
+        for product in products:
+            counts = {}
+            name_tokens = tokenize(product.name)
+            description_tokens = tokenize(product.description)
+            for token in name_tokens:
+                counts[token] = counts.get(token, 0.0) + NAME_WEIGHT
+            for token in description_tokens:
+                counts[token] = counts.get(token, 0.0) + 1.0
+            length = NAME_WEIGHT * len(name_tokens) + len(description_tokens)
+            documents.append((product.id, counts, length))
+            total_length += length
+
+        self.size = len(documents)
+        average_length = total_length / self.size if self.size else 1.0
+
+        entries = {}
+        for product_id, counts, length in documents:
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / (average_length or 1.0))
+            for term, frequency in counts.items():
+                # BM25 without idf yet: idf is per term, applied below.
+                entries.setdefault(term, []).append((product_id, frequency * (BM25_K1 + 1) / (frequency + norm)))
+
+        self._postings = {}
+        for term, term_entries in entries.items():
+            idf = math.log(1 + (self.size - len(term_entries) + 0.5) / (len(term_entries) + 0.5))
+            self._postings[term] = _Postings([(product_id, score * idf) for product_id, score in term_entries])
+        self._terms = sorted(self._postings)
+
+        # Common words also get a bitset over product ids, so intersecting them never walks their postings.
+        max_id = max((product_id for product_id, _, _ in documents), default=0)
+        self._bitset_bytes = max_id // 8 + 1
+        bitset_min = max(BITSET_MIN_POSTINGS, self.size // BITSET_FRACTION)
+        for postings in self._postings.values():
+            if len(postings) >= bitset_min:
+                raw = bytearray(self._bitset_bytes)
+                for product_id in postings.ids:
+                    raw[product_id >> 3] |= 1 << (product_id & 7)
+                postings.bits = int.from_bytes(raw, 'little')
+
+    # --- Vocabulary ---
+    def _prefix_terms(self, prefix):
+        """Terms starting with `prefix`, most common first, at most MAX_PREFIX_TERMS."""
+        start = bisect_left(self._terms, prefix)
+        end = bisect_left(self._terms, prefix + '\U0010ffff', start)
+        terms = self._terms[start:end]
+        if len(terms) > MAX_PREFIX_TERMS:
+            terms = heapq.nlargest(MAX_PREFIX_TERMS, terms, key=lambda term: len(self._postings[term]))
+        return terms
+
+    def suggest(self, query, limit=8):
+        """Completions of the last word of `query`, most common first."""
+        tokens = tokenize(query)
+        if not tokens or len(tokens[-1]) < MIN_PREFIX_LENGTH:
+            return []
+        head = ' '.join(tokens[:-1])
+        terms = sorted(self._prefix_terms(tokens[-1]), key=lambda term: (-len(self._postings[term]), term))
+        return [f"{head} {term}" if head else term for term in terms[:limit]]
+
+    # --- Queries ---
+    def _matchers(self, tokens):
+        """Per query word, the [(postings, weight)] it may match; None if a word matches nothing."""
+        groups = []
+        for position, token in enumerate(tokens):
+            group = []
+            exact = self._postings.get(token)
+            if exact is not None:
+                group.append((exact, 1.0))
+            if position == len(tokens) - 1 and len(token) >= MIN_PREFIX_LENGTH:
+                group.extend((self._postings[term], PREFIX_PENALTY)
+                             for term in self._prefix_terms(token) if term != token)
+            if not group:
+                return None
+            groups.append(group)
+        return groups
+
+    @staticmethod
+    def _group_score(group, product_id):
+        """Best weighted score of `product_id` among a word's terms, or None."""
+        best = None
+        for postings, weight in group:
+            score = postings.score(product_id)
+            if score is not None and (best is None or score * weight > best):
+                best = score * weight
+        return best
+
+    @staticmethod
+    def _restrict(candidates, group):
+        """The candidates that also match `group`."""
+        if sum(len(postings) for postings, _ in group) <= INTERSECT_RATIO * len(candidates):
+            # Walking the id arrays happens in C; cheaper unless they dwarf the candidates.
+            matched = set()
+            for postings, _ in group:
+                matched |= candidates.intersection(postings.ids)
+            return matched
+        return {product_id for product_id in candidates
+                if any(postings.score(product_id) is not None for postings, _ in group)}
+
+    def _intersect_bitsets(self, groups):
+        """Ids matching every group, as a set or (when large) a BitsetMembers."""
+        bits = -1
+        for group in groups:
+            group_bits = 0
+            for postings, _ in group:
+                group_bits |= postings.bits
+            bits &= group_bits
+        if not bits:
+            return None
+        members = BitsetMembers(bits, self._bitset_bytes)
+        if len(members) > SCORE_ALL_BELOW:
+            return members
+        return set(members)
+
+    def search(self, query, limit=24):
+        """Returns up to `limit` (product id, score) pairs, best first."""
+        tokens = tokenize(query)
+        groups = self._matchers(tokens) if tokens else None
+        if not groups:
+            return []
+
+        groups.sort(key=lambda group: sum(len(postings) for postings, _ in group))
+        driver, others = groups[0], groups[1:]
+
+        candidates = None
+        if others:
+            if all(postings.bits is not None for group in groups for postings, _ in group):
+                # Only common words: AND their bitsets rather than walking long id arrays.
+                candidates = self._intersect_bitsets(groups)
+            else:
+                # Intersect from the rarest word outwards so scoring only touches real matches.
+                candidates = set()
+                for postings, _ in driver:
+                    candidates.update(postings.ids)
+                for group in others:
+                    candidates = self._restrict(candidates, group)
+                    if not candidates:
+                        break
+            if not candidates:
+                return []
+            if len(candidates) <= SCORE_ALL_BELOW:
+                scored = []
+                for product_id in candidates:
+                    score = sum(self._group_score(group, product_id) for group in groups)
+                    scored.append((score, -product_id))
+                return [(-negative_id, score) for score, negative_id in heapq.nlargest(limit, scored)]
+
+        # Many matches: walk the rarest word in impact order and stop early.
+        others_ceiling = sum(max(postings.max_score * weight for postings, weight in group) for group in others)
+        if len(driver) == 1:
+            ranked = driver[0][0].by_impact(driver[0][1])
+        else:
+            ranked = heapq.merge(*(postings.by_impact(weight) for postings, weight in driver),
+                                 key=lambda candidate: -candidate[0])
+
+        top = []  # min-heap of (score, -id)
+        seen = set()
+        for score, product_id in ranked:
+            if len(top) == limit and score + others_ceiling <= top[0][0]:
+                break  # impact order: nothing further down can make the top results
+            if product_id in seen or (candidates is not None and product_id not in candidates):
+                continue  # not a match, or already taken through a better prefix term
+            seen.add(product_id)
+            for group in others:
+                score += self._group_score(group, product_id)
+            entry = (score, -product_id)
+            if len(top) < limit:
+                heapq.heappush(top, entry)
+            elif entry > top[0]:
+                heapq.heapreplace(top, entry)
+
+        return [(-negative_id, score) for score, negative_id in sorted(top, reverse=True)]
+
+    def __len__(self):
+        return len(self._terms)
+
+
+class SearchService:
+    """Holds the index for the newest catalog snapshot."""
+
+    def __init__(self):
+        self.index = SearchIndex(())
+
+    def rebuild(self, catalog):
+        started = time.perf_counter()
+        index = SearchIndex(catalog, version=catalog.version)
+        self.index = index
+        print(f"Search index built for version {str(catalog.version)[:12]}: "
+              f"{len(index)} terms, {index.size} products in {time.perf_counter() - started:.2f}s")
+
+
+def init_app(app, catalog_source):
+    app.config.setdefault('SEARCH_MAX_RESULTS', 48)
+    service = SearchService()
+    catalog_source.on_snapshot(service.rebuild)
+    app.extensions['search'] = service
+
+
+def get_index():
+    return current_app.extensions['search'].index
@@ -0,0 +1,366 @@
+"""
+"Similar terrariums": precomputed nearest neighbours by text similarity.
+
+    python similar.py build [--k 8] [--out product_detail/terra.similar]
+
+Build (needs NumPy): each product's name and description become a TF-IDF
+vector over search.tokenize() tokens, with name words weighted as in the
+search index, sublinear term frequency and unit length. Terms found in a
+single product or in more than half of them carry no similarity signal
+and are dropped. If more than MAX_DIMS terms remain, they are folded into
+MAX_DIMS columns by signed feature hashing, which keeps dot products
+unbiased. Neighbours are then found block by block: one block of rows
+times the whole matrix gives cosine scores against every product, and
+the best k per row are kept. Memory stays near BLOCK_BYTES however big
+the catalog is. To avoid ranking all N scores per row, a column sample
+gives each row a cut-off that cannot exceed its true k-th best score,
+and only the scores above it are sorted.
+
+The index is a small binary file next to the catalog:
+
+    header      magic, format version, k, count, flags, catalog version
+    ids         u32 product ids, ascending
+    neighbours  k u32 ids per product, best first, NO_NEIGHBOUR padded
+
+At runtime it is memory-mapped (no NumPy needed). A lookup is an array
+slice at a fixed offset when ids are 1..count, a bisection otherwise.
+An index built for another catalog version is ignored. When NumPy is
+installed, catalogs of up to SIMILAR_BUILD_ON_LOAD_MAX products are
+(re)indexed on load instead.
+"""
+import argparse
+import math
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+from array import array
+from bisect import bisect_left
+
+from flask import current_app, g
+
+from search import NAME_WEIGHT, tokenize
+
+try:
+    import numpy as np
+except ImportError:  # Optional: only needed to build the index.
+    np = None
+
+INDEX_FILE_PATH = 'product_detail/terra.similar'
+MAGIC = b'TNSIM\0'
+FORMAT_VERSION = 1
+FLAG_DENSE_IDS = 1  # ids are exactly 1..count
+# magic, format, k, count, flags, catalog version (ASCII, NUL-padded)
+HEADER = struct.Struct('<6sHIII64s')
+NO_NEIGHBOUR = 0xFFFFFFFF
+
+DEFAULT_K = 8
+MAX_DIMS = 256
+# Scores for one block of rows against every product stay under this size.
+BLOCK_BYTES = 64 * 1024 * 1024
+# Top-k selection: columns sampled per neighbour to find a cut-off, and the
+# candidates per row above it beyond which a block is ranked in full.
+SAMPLE_PER_K = 256
+CANDIDATES_PER_ROW = 512
+
+
+# --- Build ---
+def _require_numpy():
+    if np is None:
+        raise SystemExit("Building the similarity index needs NumPy: pip install numpy")
+    return np
+
+
+def _documents(products):
+    """(product ids, [{term: weighted count}]) in catalog order."""
+    ids, documents = [], []
+    for product in products:
+        counts = {}
+        for token in tokenize(product.name):
+            counts[token] = counts.get(token, 0.0) + NAME_WEIGHT
+        for token in tokenize(product.description):
+            counts[token] = counts.get(token, 0.0) + 1.0
+        ids.append(product.id)
+        documents.append(counts)
+    return ids, documents
+
+
+def vectorize(documents, max_dims=MAX_DIMS):
+    """Unit-length TF-IDF rows as a float32 matrix (one row per document)."""
+    _require_numpy()
+    df = {}
+    for counts in documents:
+        for term in counts:
+            df[term] = df.get(term, 0) + 1
+    count = len(documents)
+    terms = sorted(term for term, frequency in df.items() if 2 <= frequency <= max(2, count // 2))
+
+    if len(terms) <= max_dims:
+        columns = {term: (index, 1.0) for index, term in enumerate(terms)}
+        dims = max(1, len(terms))
+    else:
+        # crc32, not hash(): str hashes change from process to process.
+        columns = {}
+        for term in terms:
+            code = zlib.crc32(term.encode('utf-8'))
+            columns[term] = (code % max_dims, 1.0 if code & 0x80000000 else -1.0)
+        dims = max_dims
+    idf = {term: math.log(count / df[term]) + 1.0 for term in terms}
+
+    rows, cols, values = array('I'), array('I'), array('f')
+    for row, counts in enumerate(documents):
+        for term, frequency in counts.items():
+            column = columns.get(term)
+            if column is not None:
+                rows.append(row)
+                cols.append(column[0])
+                values.append(column[1] * (1.0 + math.log(frequency)) * idf[term])
+
+    matrix = np.zeros((count, dims), dtype=np.float32)
+    # add.at: hashed terms can share a column within one row.
+    np.add.at(matrix, (np.frombuffer(rows, dtype=np.uint32), np.frombuffer(cols, dtype=np.uint32)),
+              np.frombuffer(values, dtype=np.float32))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+def _top_k(scores, k, row_offset):
+    """(rows, columns) of the k best positive scores in each row of a block, best first."""
+    count = scores.shape[1]
+    # The k-th best of any subset of a row is a lower bound for the k-th best of the row,
+    # so everything at or above it is a candidate and the rest can be skipped.
+    stride = max(1, count // (SAMPLE_PER_K * k))
+    threshold = None
+    if count // stride >= k:
+        threshold = np.partition(scores[:, ::stride], -k, axis=1)[:, -k]
+        # Only positive scores count as similar.
+        np.maximum(threshold, np.nextafter(np.float32(0), np.float32(1)), out=threshold)
+        rows, columns = np.nonzero(scores >= threshold[:, None])
+    if threshold is None or len(rows) > CANDIDATES_PER_ROW * scores.shape[0]:
+        # Mostly ties (or a tiny catalog): rank the whole block instead.
+        top = np.argpartition(scores, count - k, axis=1)[:, count - k:]
+        rows = np.repeat(np.arange(scores.shape[0]), k)
+        columns = top.ravel()
+        keep = scores[rows, columns] > 0
+        rows, columns = rows[keep], columns[keep]
+
+    values = scores[rows, columns]
+    # Row by row, best first; ties go to the earlier product.
+    order = np.lexsort((columns, -values, rows))
+    rows, columns = rows[order], columns[order]
+    rank = np.arange(len(rows)) - np.searchsorted(rows, rows)
+    keep = rank < k
+    return rows[keep] + row_offset, rank[keep], columns[keep]
+
+
+def nearest(matrix, k, block_bytes=BLOCK_BYTES):
+    """Row indexes of the k most similar other rows, best first; -1 where fewer than k score above 0."""
+    count = matrix.shape[0]
+    k = min(k, max(0, count - 1))
+    result = np.full((count, k), -1, dtype=np.int64)
+    if not k:
+        return result
+
+    block_rows = max(1, min(count, block_bytes // (4 * count)))
+    transposed = np.ascontiguousarray(matrix.T)
+    for start in range(0, count, block_rows):
+        stop = min(count, start + block_rows)
+        scores = matrix[start:stop] @ transposed
+        scores[np.arange(stop - start), np.arange(start, stop)] = -1.0  # never your own neighbour
+        rows, ranks, columns = _top_k(scores, k, start)
+        result[rows, ranks] = columns
+    return result
+
+
+def build(products, version, out_path, k=DEFAULT_K):
+    """Writes the similarity index for `products` (a catalog snapshot at `version`). Returns timings."""
+    if sys.byteorder != 'little':
+        raise SystemExit('Similarity indexes are little-endian; build them on a little-endian host.')
+    _require_numpy()
+    timings = {}
+    started = time.perf_counter()
+    ids, documents = _documents(products)
+    matrix = vectorize(documents)
+    timings['vectorize_seconds'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    neighbours = nearest(matrix, k)
+    timings['neighbours_seconds'] = time.perf_counter() - started
+
+    ids = np.asarray(ids, dtype=np.int64)
+    order = np.argsort(ids, kind='stable')
+    # Row indexes -> product ids, rows in ascending id order.
+    neighbour_ids = np.where(neighbours >= 0, ids[np.maximum(neighbours, 0)], NO_NEIGHBOUR)[order]
+    if neighbour_ids.shape[1] < k:
+        neighbour_ids = np.hstack([neighbour_ids, np.full((len(ids), k - neighbour_ids.shape[1]), NO_NEIGHBOUR)])
+    sorted_ids = ids[order]
+    dense = bool(len(ids)) and np.array_equal(sorted_ids, np.arange(1, len(ids) + 1))
+
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, FORMAT_VERSION, k, len(ids), FLAG_DENSE_IDS if dense else 0,
+                               str(version).encode('ascii')[:64]))
+        file.write(sorted_ids.astype('<u4').tobytes())
+        file.write(neighbour_ids.astype('<u4').tobytes())
+    os.replace(tmp_path, out_path)
+    timings['index_bytes'] = os.path.getsize(out_path)
+    return timings
+
+
+# --- Load ---
+class SimilarIndex:
+    """Memory-mapped neighbour lists for one catalog version."""
+
+    def __init__(self, buffer):
+        magic, format_version, self.k, self.count, flags, version = HEADER.unpack_from(buffer, 0)
+        self.version = version.rstrip(b'\0').decode('ascii')
+        self._dense = bool(flags & FLAG_DENSE_IDS)
+        view = memoryview(buffer)
+        ids_end = HEADER.size + 4 * self.count
+        self._ids = view[HEADER.size:ids_end].cast('I')
+        self._neighbours = view[ids_end:ids_end + 4 * self.count * self.k].cast('I')
+
+    def _position(self, product_id):
+        if not isinstance(product_id, int):
+            return None
+        if self._dense:
+            return product_id - 1 if 1 <= product_id <= self.count else None
+        position = bisect_left(self._ids, product_id)
+        if position < self.count and self._ids[position] == product_id:
+            return position
+        return None
+
+    def neighbours(self, product_id):
+        """Ids of the products most similar to `product_id`, best first."""
+        position = self._position(product_id)
+        if position is None:
+            return []
+        start = position * self.k
+        return [neighbour for neighbour in self._neighbours[start:start + self.k] if neighbour != NO_NEIGHBOUR]
+
+
+def open_index(path, version):
+    """Maps the index at `path`, or returns None if it is missing, unreadable or for another version."""
+    try:
+        with open(path, 'rb') as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    if len(mapped) < HEADER.size or sys.byteorder != 'little':
+        return None
+    magic, format_version, k, count, _, _ = HEADER.unpack_from(mapped, 0)
+    if magic != MAGIC or format_version != FORMAT_VERSION or len(mapped) < HEADER.size + 4 * count * (k + 1):
+        return None
+    index = SimilarIndex(mapped)
+    return index if index.version == str(version) else None
+
+
+# --- Serving ---
+class SimilarService:
+    """Keeps the index that matches the catalog snapshot being served."""
+
+    def __init__(self, path, k=DEFAULT_K, build_max=0):
+        self.path = path
+        self.k = k
+        self.build_max = build_max
+        self.index = None
+
+    def refresh(self, catalog):
+        index = open_index(self.path, catalog.version)
+        if index is None and np is not None and len(catalog) <= self.build_max:
+            started = time.perf_counter()
+            build(catalog, catalog.version, self.path, self.k)
+            index = open_index(self.path, catalog.version)
+            print(f"Similarity index built for {len(catalog)} products in {time.perf_counter() - started:.2f}s")
+        elif index is None:
+            print(f"No similarity index for catalog version {str(catalog.version)[:12]}; "
+                  "related items are hidden (build: python similar.py build)")
+        self.index = index
+
+    def similar(self, catalog, product_id, limit):
+        index = self.index
+        if index is None or index.version != catalog.version:
+            return []
+        products = []
+        for neighbour in index.neighbours(product_id):
+            product = catalog.get(neighbour)
+            if product is not None:
+                products.append(product)
+                if len(products) == limit:
+                    break
+        return products
+
+
+def init_app(app, catalog_source):
+    app.config.setdefault('SIMILAR_INDEX_PATH', os.path.join(app.root_path, INDEX_FILE_PATH))
+    app.config.setdefault('SIMILAR_K', DEFAULT_K)
+    # With NumPy installed, catalogs up to this size are indexed on load (0: only `python similar.py build`)
+    app.config.setdefault('SIMILAR_BUILD_ON_LOAD_MAX', 5000)
+
+    service = SimilarService(app.config['SIMILAR_INDEX_PATH'], k=app.config['SIMILAR_K'],
+                             build_max=app.config['SIMILAR_BUILD_ON_LOAD_MAX'])
+    catalog_source.on_snapshot(service.refresh)
+    app.extensions['similar'] = service
+    app.add_template_global(similar_products)
+    app.add_template_global(related_products)
+
+
+def similar_products(product, limit=3):
+    """Products most like `product` in the current snapshot."""
+    return current_app.extensions['similar'].similar(g.catalog, product.id, limit)
+
+
+def related_products(product_ids, limit=4):
+    """
+    Cross-sell for a set of products (a cart): their neighbours, most
+    shared first, then by rank, leaving out the products themselves.
+    """
+    service = current_app.extensions['similar']
+    index = service.index
+    if index is None or index.version != g.catalog.version:
+        return []
+    exclude = set(product_ids)
+    votes = {}
+    for product_id in exclude:
+        for rank, neighbour in enumerate(index.neighbours(product_id)):
+            if neighbour not in exclude:
+                shared, best_rank = votes.get(neighbour, (0, rank))
+                votes[neighbour] = (shared + 1, min(best_rank, rank))
+    ranked = sorted(votes, key=lambda neighbour: (-votes[neighbour][0], votes[neighbour][1], neighbour))
+    products = []
+    for neighbour in ranked:
+        product = g.catalog.get(neighbour)
+        if product is not None:
+            products.append(product)
+            if len(products) == limit:
+                break
+    return products
+
+
+def main(argv=None):
+    import data
+    from catalog import Catalog, file_digest
+
+    parser = argparse.ArgumentParser(description='Precompute "similar terrariums" for the catalog.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    build_cmd = sub.add_parser('build')
+    build_cmd.add_argument('--csv', default=data.resolve_data_path(data.CSV_FILE_PATH))
+    build_cmd.add_argument('--out', default=data.resolve_data_path(INDEX_FILE_PATH))
+    build_cmd.add_argument('--k', type=int, default=DEFAULT_K)
+    args = parser.parse_args(argv)
+
+    _require_numpy()
+    with open(args.csv, 'rb') as file:
+        raw = file.read()
+    # Same version the app computes for this CSV, so the app accepts the index.
+    catalog = data.build_catalog(raw, version=file_digest(args.csv)) if raw else Catalog(())
+    timings = build(catalog, catalog.version, args.out, args.k)
+    print(f"Similarity index written to {args.out} ({len(catalog)} products, k={args.k}, "
+          f"{timings['vectorize_seconds'] + timings['neighbours_seconds']:.2f}s, {timings['index_bytes']} bytes)")
+
+
+if __name__ == '__main__':
+    main()
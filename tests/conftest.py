@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The app modules, and the scraper's, are imported as top-level modules.
+for path in (ROOT_DIR, os.path.join(ROOT_DIR, 'product_detail')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+@pytest.fixture
+def app(tmp_path):
+    """The full app on temporary databases, without warm-up, catalog watcher or rate limits."""
+    from app import create_app
+
+    app = create_app({
+        'ORDER_DB_PATH': str(tmp_path / 'orders.sqlite3'),
+        'CART_DB_PATH': str(tmp_path / 'carts.sqlite3'),
+        'INVENTORY_DB_PATH': str(tmp_path / 'inventory.sqlite3'),
+        'SIMILAR_INDEX_PATH': str(tmp_path / 'terra.similar'),
+        'WARMUP_PATHS': [],
+        'GC_FREEZE': False,
+        'RATE_LIMIT_ENABLED': False,
+    })
+    app.extensions['catalog_source'].stop()
+    yield app
+    app.extensions['order_log'].close()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,24 @@
+"""
+App factory: building several apps in one process (tests, benchmarks) adds
+no fork hooks; the one registered at import restarts each app's threads.
+"""
+import app as app_module
+
+
+def test_create_app_registers_no_fork_hooks(tmp_path, monkeypatch):
+    registered = []
+    monkeypatch.setattr(app_module.os, 'register_at_fork', lambda **hooks: registered.append(hooks))
+    built = app_module.create_app({
+        'ORDER_DB_PATH': str(tmp_path / 'orders.sqlite3'),
+        'SIMILAR_INDEX_PATH': str(tmp_path / 'terra.similar'),
+        'WARMUP_PATHS': [],
+        'GC_FREEZE': False,
+    })
+    try:
+        assert registered == []
+        restarts = [ref() for ref in app_module._AFTER_FORK]
+        assert built.extensions['catalog_source'].restart_after_fork in restarts
+        assert built.extensions['order_log'].restart_after_fork in restarts
+    finally:
+        built.extensions['catalog_source'].stop()
+        built.extensions['order_log'].close()
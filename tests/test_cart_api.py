@@ -0,0 +1,103 @@
+"""
+Cart mutations through the routes: what shoppers are told when stock runs
+short, and idempotent batch adds.
+"""
+import pytest
+
+PRODUCT = 1
+
+
+@pytest.fixture
+def ledger(app):
+    return app.extensions['inventory']
+
+
+def overcommit(ledger):
+    """Another cart holds 2 units, then stock is cut to 1: availability is -1."""
+    ledger.set_stock(PRODUCT, 2)
+    ledger.reserve(PRODUCT, 'other-cart', 2)
+    ledger.set_stock(PRODUCT, 1)
+    assert ledger.available(PRODUCT) == -1
+
+
+def test_ajax_add_reports_sold_out_when_availability_is_negative(client, ledger):
+    overcommit(ledger)
+    response = client.post(f"/add-premade-to-cart-ajax/{PRODUCT}")
+    assert response.status_code == 400
+    assert response.get_json()['message'] == 'Sold out'
+
+
+def test_batch_add_reports_sold_out_when_availability_is_negative(client, ledger):
+    overcommit(ledger)
+    response = client.post('/api/cart/lines', json={'lines': [{'id': PRODUCT, 'quantity': 1}]})
+    assert response.status_code == 400
+    assert response.get_json()['message'].endswith('is sold out')
+
+
+def test_batch_add_reports_units_left(client, ledger):
+    ledger.set_stock(PRODUCT, 2)
+    response = client.post('/api/cart/lines', json={'lines': [{'id': PRODUCT, 'quantity': 3}]})
+    assert response.status_code == 400
+    assert response.get_json()['message'].startswith('Only 2 left of ')
+    assert ledger.available(PRODUCT) == 2
+
+
+def test_replayed_idempotency_key_returns_first_response(client, ledger):
+    ledger.set_stock(PRODUCT, 5)
+    batch = {'lines': [{'id': PRODUCT, 'quantity': 2}]}
+    first = client.post('/api/cart/lines', json=batch, headers={'Idempotency-Key': 'add-1'})
+    assert first.status_code == 200
+    assert 'Idempotent-Replayed' not in first.headers
+
+    replay = client.post('/api/cart/lines', json=batch, headers={'Idempotency-Key': 'add-1'})
+    assert replay.status_code == 200
+    assert replay.headers['Idempotent-Replayed'] == 'true'
+    assert replay.get_json() == first.get_json() == {'success': True, 'cart_count': 2, 'added': 2}
+    # Reserved once, not twice
+    assert ledger.available(PRODUCT) == 3
+
+
+def test_failed_request_releases_its_idempotency_key(client, ledger):
+    ledger.set_stock(PRODUCT, 1)
+    batch = {'lines': [{'id': PRODUCT, 'quantity': 2}], 'idempotency_key': 'add-1'}
+    response = client.post('/api/cart/lines', json=batch)
+    assert response.status_code == 400
+    assert ledger.available(PRODUCT) == 1
+
+    # Restocked: the retry with the same key goes through instead of replaying the failure.
+    ledger.set_stock(PRODUCT, 3)
+    retry = client.post('/api/cart/lines', json=batch)
+    assert retry.status_code == 200
+    assert 'Idempotent-Replayed' not in retry.headers
+    assert retry.get_json()['added'] == 2
+    assert ledger.available(PRODUCT) == 1
+
+
+def add_custom_build(client, **fields):
+    form = {'growing_medium': 'medium-coco-peat', 'drainage_layer': 'drainage-perlite', **fields}
+    assert client.post('/build-summary', data=form).status_code == 200
+    assert client.get('/add-custom-to-cart').status_code == 302
+
+
+def custom_lines(app, client):
+    with client.session_transaction() as session:
+        cart_id = session['cart_id']
+    cart = app.extensions['cart_store'].load(cart_id)
+    return [line for line in cart.items() if line['type'] == 'custom']
+
+
+def test_different_custom_builds_stay_separate_lines(app, client):
+    # Same growing medium (so the same name) and the same total, different components
+    add_custom_build(client, hardscape_stones='stones-pebbles', **{'plants[]': 'plant-succulents'})
+    add_custom_build(client, hardscape_stones='stones-rocks', **{'care[]': 'care-pest-control'})
+    lines = custom_lines(app, client)
+    assert len(lines) == 2
+    assert lines[0]['name'] == lines[1]['name'] and lines[0]['price'] == lines[1]['price']
+    assert [line['quantity'] for line in lines] == [1, 1]
+
+
+def test_identical_custom_builds_merge(app, client):
+    add_custom_build(client, hardscape_stones='stones-pebbles', **{'plants[]': ['plant-moss', 'plant-succulents']})
+    add_custom_build(client, hardscape_stones='stones-pebbles', **{'plants[]': ['plant-succulents', 'plant-moss']})
+    lines = custom_lines(app, client)
+    assert [line['quantity'] for line in lines] == [2]
@@ -0,0 +1,87 @@
+"""
+SqliteCartStore under concurrent writers: every worker loads, changes and
+saves the whole cart, and no change may be lost.
+"""
+import sqlite3
+import threading
+
+from cart_store import Cart, SqliteCartStore, premade_line_key
+
+CART_ID = 'shared-cart'
+
+
+def add(cart, product_id, quantity=1):
+    cart.add(premade_line_key(product_id), 'premade', f"Product {product_id}", 100.0,
+             quantity=quantity, item_id=product_id)
+
+
+def test_concurrent_adds_all_land(tmp_path):
+    path = str(tmp_path / 'carts.sqlite3')
+    SqliteCartStore(path).save(Cart(CART_ID))
+    workers, adds = 8, 25
+    start = threading.Barrier(workers)
+
+    def worker(index):
+        # One store per thread, like one per worker process
+        store = SqliteCartStore(path)
+        start.wait()
+        for _ in range(adds):
+            cart = store.load(CART_ID)
+            add(cart, index)
+            store.save(cart)
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    cart = SqliteCartStore(path).load(CART_ID)
+    assert cart.count == workers * adds
+    assert {line['id']: line['quantity'] for line in cart.items()} == {index: adds for index in range(workers)}
+    assert cart.total == 100.0 * workers * adds
+
+
+def test_stale_copy_is_rebased_on_save(tmp_path):
+    store = SqliteCartStore(str(tmp_path / 'carts.sqlite3'))
+    cart = Cart(CART_ID)
+    add(cart, 1)
+    add(cart, 2)
+    store.save(cart)
+
+    first, second = store.load(CART_ID), store.load(CART_ID)
+    add(first, 3)
+    store.save(first)
+    # `second` still thinks product 2 is the second line: removal is replayed by key
+    assert second.remove_line(1)
+    add(second, 1, quantity=2)
+    store.save(second)
+
+    assert {line['id']: line['quantity'] for line in second.items()} == {1: 3, 3: 1}
+    stored = store.load(CART_ID)
+    assert stored.items() == second.items()
+    assert stored.version == second.version == 3
+
+
+def test_two_new_carts_with_one_id_merge(tmp_path):
+    store = SqliteCartStore(str(tmp_path / 'carts.sqlite3'))
+    first, second = Cart(CART_ID), Cart(CART_ID)
+    add(first, 1)
+    add(second, 2)
+    store.save(first)
+    store.save(second)
+    assert store.load(CART_ID).count == 2
+
+
+def test_existing_table_gains_a_version_column(tmp_path):
+    path = str(tmp_path / 'carts.sqlite3')
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE carts (id TEXT PRIMARY KEY, lines TEXT NOT NULL, item_count INTEGER NOT NULL,"
+                     " total REAL NOT NULL, updated_at REAL NOT NULL)")
+        conn.execute("INSERT INTO carts VALUES (?, '[]', 0, 0.0, strftime('%s', 'now'))", (CART_ID,))
+    store = SqliteCartStore(path)
+    cart = store.load(CART_ID)
+    assert cart.version == 0
+    add(cart, 1)
+    store.save(cart)
+    assert store.load(CART_ID).count == 1
@@ -0,0 +1,58 @@
+"""
+The catalog source: the startup load and hot reloads of terra.csv go through
+the same ingestion pipeline, so both report rejected rows the same way, and
+a compiled snapshot is only served while it is fresh and has products.
+"""
+import csv
+import os
+
+import catalog_snapshot
+from data import FALLBACK_TERRARIUMS, load_catalog_source
+
+HEADER = 'Name,Sale Price,Original Price (₹),Short Description,image_url\n'
+GOOD_ROW = 'Jade Plant Terrarium,449,749,A Jade Plant terrarium.,jade.jpg\n'
+BAD_ROW = 'Broken Terrarium,n/a,749,Price is not a number.,broken.jpg\n'
+
+
+def write_feed(path, *rows):
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        file.write(HEADER + ''.join(rows))
+    # Make sure the reloader's (mtime, size) check sees the rewrite.
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def read_rejects(path):
+    with open(path, encoding='utf-8', newline='') as file:
+        return list(csv.DictReader(file))
+
+
+def test_reload_writes_rejects_like_startup(tmp_path):
+    feed = tmp_path / 'terra.csv'
+    rejects = tmp_path / 'terra.rejects.csv'
+    write_feed(feed, GOOD_ROW, BAD_ROW)
+
+    source = load_catalog_source({}, file_path=str(feed), snapshot_path=str(tmp_path / 'terra.tncat'))
+    assert [product.name for product in source.current] == ['Jade Plant Terrarium']
+    assert [row['row'] for row in read_rejects(rejects)] == ['2']
+
+    write_feed(feed, GOOD_ROW, GOOD_ROW.replace('Jade', 'Money'), BAD_ROW)
+    assert source.check()
+    assert len(source.current) == 2
+    assert [(row['row'], row['line']) for row in read_rejects(rejects)] == [('3', '4')]
+
+    # A clean reload clears the previous report.
+    write_feed(feed, GOOD_ROW)
+    assert source.check()
+    assert not rejects.exists()
+
+
+def test_empty_snapshot_falls_through_to_csv(tmp_path):
+    feed = tmp_path / 'terra.csv'
+    snapshot = tmp_path / 'terra.tncat'
+    write_feed(feed, BAD_ROW)
+    assert catalog_snapshot.build([], str(feed), str(snapshot)) == 0
+
+    source = load_catalog_source({}, file_path=str(feed), snapshot_path=str(snapshot))
+    # Nothing usable in the CSV either, so the hardcoded fallback is served, not an empty shop.
+    assert [product.id for product in source.current] == [product['id'] for product in FALLBACK_TERRARIUMS]
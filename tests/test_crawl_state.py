@@ -0,0 +1,118 @@
+"""
+The crawl state, replayed offline over saved search pages
+(tests/fixtures/pinterest): re-runs add nothing, re-served and re-pinned
+images are exported once, and interrupted or failed work is picked up by
+the next run.
+"""
+import os
+
+import pytest
+
+import crawl_state
+from crawl_state import CrawlState, read_output, replay
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'pinterest')
+PAGES = [os.path.join(FIXTURES, 'search_page_1.html'), os.path.join(FIXTURES, 'search_page_2.html')]
+IMAGES = os.path.join(FIXTURES, 'images')
+# Distinct pins across both pages, and how many are a re-pin of an earlier pin's exact image
+PINS = 20
+DUPLICATE_IMAGES = 2
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / 'state.sqlite3'), str(tmp_path / 'urls.csv'), str(tmp_path / 'images')
+
+
+def run(paths, fetch=None, pages=PAGES, batch_size=5):
+    state_path, out_path, images_dir = paths
+    state = CrawlState(state_path)
+    try:
+        return replay(pages, state, out_path, batch_size=batch_size, fetch=fetch,
+                      images_dir=images_dir if fetch else None)
+    finally:
+        state.close()
+
+
+def test_second_run_appends_nothing(paths):
+    first = run(paths)
+    rows = read_output(paths[1])
+    assert first.new_pins == PINS
+    assert len(rows) == PINS
+    # The 474x copies on each page are the same pins as their 236x ones
+    assert len({crawl_state.pin_key(src) for src in rows}) == PINS
+
+    second = run(paths)
+    assert second.new_pins == 0
+    assert second.known_pins == PINS
+    assert second.exported == 0
+    assert read_output(paths[1]) == rows
+
+
+def test_duplicate_images_are_skipped(paths):
+    fetch = crawl_state._fetch_from(IMAGES)
+    first = run(paths, fetch)
+    assert first.duplicates == DUPLICATE_IMAGES
+    assert len(read_output(paths[1])) == PINS - DUPLICATE_IMAGES
+    assert len(os.listdir(paths[2])) == PINS - DUPLICATE_IMAGES
+
+    second = run(paths, fetch)
+    assert second.new_pins == 0
+    assert second.exported == 0
+    assert len(read_output(paths[1])) == PINS - DUPLICATE_IMAGES
+
+
+def test_only_new_pages_add_rows(paths):
+    first = run(paths, pages=PAGES[:1])
+    assert first.new_pins == 12
+    second = run(paths, pages=PAGES)
+    # Page 2 overlaps page 1 by four pins
+    assert second.new_pins == PINS - 12
+    assert second.known_pins > 0
+    assert len(read_output(paths[1])) == PINS
+
+
+def test_interrupted_run_neither_loses_nor_repeats_rows(paths):
+    run(paths, pages=PAGES[:1])
+    state_path, out_path, _ = paths
+    # Stopped between appending to the CSV and marking the rows exported...
+    state = CrawlState(state_path)
+    with state._conn:
+        state._conn.execute("UPDATE pins SET exported = 0")
+    # ...and before the last rows were written at all.
+    rows = read_output(out_path)
+    kept = rows[:8]
+    os.remove(out_path)
+    crawl_state.append_output(out_path, kept)
+    state.close()
+
+    resumed = run(paths, pages=PAGES[:1])
+    assert resumed.new_pins == 0
+    assert resumed.exported == len(rows) - len(kept)
+    assert sorted(read_output(out_path)) == sorted(rows)
+
+
+def test_failed_download_is_retried_next_run_not_every_scroll(paths):
+    real_fetch = crawl_state._fetch_from(IMAGES)
+    failing_key = None
+    calls = []
+
+    def flaky_fetch(src):
+        nonlocal failing_key
+        key = crawl_state.pin_key(src)
+        calls.append(key)
+        if failing_key is None:
+            failing_key = key
+        if key == failing_key:
+            raise OSError('connection reset')
+        return real_fetch(src)
+
+    first = run(paths, flaky_fetch, batch_size=2)
+    assert calls.count(failing_key) == 1
+    assert first.failed_downloads == {failing_key}
+    assert len(read_output(paths[1])) == PINS - DUPLICATE_IMAGES - 1
+
+    second = run(paths, real_fetch)
+    assert second.new_pins == 0
+    assert second.exported == 1
+    assert len(read_output(paths[1])) == PINS - DUPLICATE_IMAGES
@@ -0,0 +1,109 @@
+"""
+The image pipeline, built from local fixture images (tests/fixtures/images)
+into a temporary static directory: no network, no files in static/.
+"""
+import hashlib
+import os
+
+import pytest
+
+import images
+
+PIL = pytest.importorskip('PIL.Image')
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'images')
+LANDSCAPE = os.path.join(FIXTURES, 'terrarium_landscape.jpg')  # 700 x 500
+SMALL_PNG = os.path.join(FIXTURES, 'badge_small.png')  # 300 x 200, transparent
+BROKEN = os.path.join(FIXTURES, 'not_an_image.jpg')
+
+
+@pytest.fixture
+def build(tmp_path):
+    static_dir = tmp_path / 'static'
+    manifest_path = tmp_path / 'image_manifest.json'
+
+    def run(sources, **kwargs):
+        manifest = images.build_manifest(sources, manifest_path=str(manifest_path), static_dir=str(static_dir),
+                                         **kwargs)
+        return manifest, str(static_dir), str(manifest_path)
+    return run
+
+
+def test_variants_cover_source_width_without_upscaling(build):
+    manifest, static_dir, _ = build([LANDSCAPE, SMALL_PNG])
+    landscape = manifest['images']['img/terrarium_landscape.jpg']
+    assert (landscape['width'], landscape['height']) == (700, 500)
+    assert [width for width, _ in landscape['jpeg']] == [320, 480, 640, 700]
+    assert [width for width, _ in landscape['webp']] == [320, 480, 640, 700]
+
+    small = manifest['images']['img/badge_small.png']
+    assert [width for width, _ in small['jpeg']] == [300]
+
+    for width, path in landscape['jpeg'] + landscape['webp']:
+        with PIL.open(os.path.join(static_dir, path)) as variant:
+            assert variant.width == width
+            assert variant.height == round(500 * width / 700)
+            assert variant.format == ('JPEG' if path.endswith('.jpg') else 'WEBP')
+
+
+def test_variant_names_are_content_hashes(build):
+    manifest, static_dir, _ = build([LANDSCAPE])
+    for _, path in manifest['images']['img/terrarium_landscape.jpg']['jpeg']:
+        assert path.startswith(images.VARIANT_DIR + '/')
+        with open(os.path.join(static_dir, path), 'rb') as file:
+            fingerprint = hashlib.sha1(file.read()).hexdigest()[:10]
+        assert path.endswith(f".{fingerprint}.jpg")
+
+
+def test_rebuild_is_stable(build):
+    first, static_dir, _ = build([LANDSCAPE, SMALL_PNG])
+    written = sorted(os.listdir(os.path.join(static_dir, images.VARIANT_DIR)))
+    second, _, _ = build([LANDSCAPE, SMALL_PNG])
+    assert second == first
+    assert sorted(os.listdir(os.path.join(static_dir, images.VARIANT_DIR))) == written
+
+
+def test_manifest_round_trip(build):
+    _, _, manifest_path = build([LANDSCAPE])
+    asset = images.load_manifest(manifest_path)['img/terrarium_landscape.jpg']
+    assert isinstance(asset, images.ImageAsset)
+    assert (asset.width, asset.height) == (700, 500)
+    assert asset.jpeg[0][0] == 320 and asset.webp[-1][0] == 700
+
+
+def test_bad_and_remote_sources_are_skipped(build, capsys):
+    manifest, _, _ = build([BROKEN, 'https://i.pinimg.com/236x/ab/cd/ef/abcdef.jpg', SMALL_PNG], offline=True)
+    assert list(manifest['images']) == ['img/badge_small.png']
+    assert 'Failed to process image' in capsys.readouterr().out
+
+
+def test_missing_or_foreign_manifest_is_empty(tmp_path):
+    assert images.load_manifest(str(tmp_path / 'missing.json')) == {}
+    foreign = tmp_path / 'foreign.json'
+    foreign.write_text('{"format": 99, "images": {}}')
+    assert images.load_manifest(str(foreign)) == {}
+
+
+def test_srcset_filter(build):
+    from flask import Flask
+
+    _, _, manifest_path = build([LANDSCAPE])
+    asset = images.load_manifest(manifest_path)['img/terrarium_landscape.jpg']
+    app = Flask(__name__)
+    images.init_app(app, {'img/terrarium_landscape.jpg': asset})
+    with app.test_request_context():
+        rendered = app.jinja_env.from_string(
+            "{% set media = image_asset('img/terrarium_landscape.jpg') %}"
+            '<img src="{{ url_for(\'static\', filename=media.jpeg[-1][1]) }}" srcset="{{ media.jpeg | srcset }}"'
+            ' width="{{ media.width }}" height="{{ media.height }}">').render()
+    entries = [entry.split(' ') for entry in rendered.split('srcset="')[1].split('"')[0].split(', ')]
+    assert [width for _, width in entries] == ['320w', '480w', '640w', '700w']
+    assert all(url.startswith('/static/img/variants/') for url, _ in entries)
+    assert 'width="700" height="500"' in rendered
+
+
+def test_source_key():
+    assert images.source_key('third.jpg') == 'img/third.jpg'
+    assert images.source_key('/third.jpg') == 'img/third.jpg'
+    url = 'https://i.pinimg.com/236x/ab/cd/ef/abcdef.jpg'
+    assert images.source_key(url) == url
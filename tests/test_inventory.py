@@ -0,0 +1,107 @@
+"""
+Stock ledgers under contention: however many threads or worker processes
+race for the last units, no more are sold than were in stock.
+"""
+import multiprocessing
+import os
+import threading
+import time
+
+import pytest
+
+from inventory import MemoryStockLedger, OutOfStock, SqliteStockLedger
+
+HOT_PRODUCT = 7
+STOCK = 40
+
+
+def make_ledger(backend, tmp_path, stock, ttl=900):
+    if backend == 'memory':
+        return MemoryStockLedger(stock, ttl=ttl, shards=8)
+    return SqliteStockLedger(str(tmp_path / 'inventory.sqlite3'), stock, ttl=ttl)
+
+
+def buy_until_sold_out(ledger, shopper, attempts, quantity=1):
+    """Reserve-then-checkout loop for one shopper. Returns units sold."""
+    sold = 0
+    for attempt in range(attempts):
+        cart_id = f"{shopper}-{attempt}"
+        try:
+            ledger.reserve(HOT_PRODUCT, cart_id, quantity)
+            if attempt % 3 == 2:
+                # Some carts give their units back instead of checking out.
+                ledger.release(HOT_PRODUCT, cart_id)
+                continue
+            ledger.commit(cart_id, [(HOT_PRODUCT, quantity)])
+        except OutOfStock:
+            continue
+        sold += quantity
+    return sold
+
+
+@pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+def test_threads_never_oversell(backend, tmp_path):
+    ledger = make_ledger(backend, tmp_path, {HOT_PRODUCT: STOCK})
+    threads = 16
+    sold = [0] * threads
+    start = threading.Barrier(threads)
+
+    def shopper(index):
+        start.wait()
+        sold[index] = buy_until_sold_out(ledger, index, attempts=15)
+
+    workers = [threading.Thread(target=shopper, args=(index,)) for index in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    # 16 x 15 attempts, two thirds of them checkouts: far more demand than stock.
+    assert sum(sold) == STOCK
+    assert ledger.available(HOT_PRODUCT) == 0
+
+
+def _process_shopper(path, shopper, results):
+    ledger = SqliteStockLedger(path, ttl=900)
+    results.put(buy_until_sold_out(ledger, shopper, attempts=30))
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_worker_processes_never_oversell_sqlite(tmp_path):
+    path = str(tmp_path / 'inventory.sqlite3')
+    ledger = SqliteStockLedger(path, {HOT_PRODUCT: STOCK})
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    processes = [context.Process(target=_process_shopper, args=(path, index, results)) for index in range(6)]
+    for process in processes:
+        process.start()
+    sold = [results.get(timeout=60) for _ in processes]
+    for process in processes:
+        process.join(timeout=60)
+        assert process.exitcode == 0
+
+    assert sum(sold) == STOCK
+    assert ledger.available(HOT_PRODUCT) == 0
+
+
+@pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+def test_commit_is_all_or_nothing(backend, tmp_path):
+    ledger = make_ledger(backend, tmp_path, {1: 5, 2: 1})
+    with pytest.raises(OutOfStock) as excinfo:
+        ledger.commit('cart', [(1, 3), (2, 2)])
+    assert excinfo.value.product_id == 2
+    assert excinfo.value.available == 1
+    assert ledger.available(1) == 5
+    assert ledger.available(2) == 1
+
+
+@pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+def test_abandoned_reservations_lapse(backend, tmp_path):
+    ledger = make_ledger(backend, tmp_path, {HOT_PRODUCT: 2}, ttl=0.05)
+    ledger.reserve(HOT_PRODUCT, 'abandoned', 2)
+    with pytest.raises(OutOfStock):
+        ledger.reserve(HOT_PRODUCT, 'other', 1)
+    time.sleep(0.1)
+    ledger.reserve(HOT_PRODUCT, 'other', 1)
+    ledger.commit('other', [(HOT_PRODUCT, 1)])
+    assert ledger.available(HOT_PRODUCT) == 1
@@ -0,0 +1,121 @@
+"""
+The order log: one order per checkout token, a bad order can't fail the
+rest of its batch, and find() sees orders that are still being written.
+"""
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from orders import Order, OrderLog, OrderLogError, OrderTimeout, _Pending
+
+LINES = [{'key': 'premade:1', 'id': 1, 'type': 'premade', 'name': 'Jade Plant Terrarium', 'price': 449.0,
+          'quantity': 1}]
+
+
+@pytest.fixture
+def log(tmp_path):
+    log = OrderLog(str(tmp_path / 'orders.sqlite3'))
+    yield log
+    log.close()
+
+
+def pending_order(order_id, token=None, lines=LINES, on_failure=None):
+    return _Pending(Order(order_id, 'cart', 0.0, 1, 449.0, lines, token), on_failure)
+
+
+def stored_ids(log):
+    conn = sqlite3.connect(log.path)
+    try:
+        return sorted(row[0] for row in conn.execute("SELECT id FROM orders"))
+    finally:
+        conn.close()
+
+
+def test_duplicate_token_returns_the_first_order(log):
+    first, created = log.place('cart', LINES, 1, 449.0, token='token-1')
+    assert created
+
+    again, created = log.place('cart', LINES, 1, 449.0, token='token-1')
+    assert not created
+    assert again.id == first.id
+    assert again.lines[0]['name'] == 'Jade Plant Terrarium'
+    assert stored_ids(log) == [first.id]
+
+
+def test_duplicate_token_within_one_batch(log):
+    batch = [pending_order('TN-A', 'token-1'), pending_order('TN-B', 'token-1')]
+    conn = log._connect()
+    try:
+        log._commit(conn, batch)
+    finally:
+        conn.close()
+
+    assert all(pending.done.is_set() and pending.error is None for pending in batch)
+    assert batch[0].existing is None
+    assert batch[1].existing.id == 'TN-A'
+    assert stored_ids(log) == ['TN-A']
+
+
+def test_failed_batch_is_retried_order_by_order(log):
+    undone = []
+    # A line without a name breaks the NOT NULL constraint, and with it the batch's transaction.
+    bad_lines = [dict(LINES[0], name=None)]
+    batch = [
+        pending_order('TN-A', 'token-a', on_failure=lambda: undone.append('TN-A')),
+        pending_order('TN-B', 'token-b', lines=bad_lines, on_failure=lambda: undone.append('TN-B')),
+        pending_order('TN-C', 'token-c', on_failure=lambda: undone.append('TN-C')),
+    ]
+    conn = log._connect()
+    try:
+        log._commit(conn, batch)
+    finally:
+        conn.close()
+
+    assert all(pending.done.is_set() for pending in batch)
+    assert [pending.error is None for pending in batch] == [True, False, True]
+    assert isinstance(batch[1].error, sqlite3.IntegrityError)
+    assert undone == ['TN-B']
+    assert stored_ids(log) == ['TN-A', 'TN-C']
+
+
+def test_failed_order_raises_and_is_not_found(log):
+    undone = []
+    with pytest.raises(OrderLogError):
+        log.place('cart', [dict(LINES[0], name=None)], 1, 449.0, token='token-1',
+                  on_failure=lambda: undone.append(True))
+    assert undone == [True]
+    assert log.find('token-1') is None
+
+
+def test_find_waits_for_an_order_in_flight(log):
+    release = threading.Event()
+    commit = log._commit
+
+    def held_commit(conn, batch):
+        release.wait(10)
+        commit(conn, batch)
+
+    log._commit = held_commit
+    placed = []
+    placer = threading.Thread(target=lambda: placed.append(log.place('cart', LINES, 1, 449.0, token='token-1')))
+    placer.start()
+    try:
+        while 'token-1' not in log._inflight:
+            time.sleep(0.001)
+        # Queued but not written: a database lookup alone would say there is no order.
+        assert log._load(log._reader(), 'token-1') is None
+        with pytest.raises(OrderTimeout):
+            log.find('token-1', timeout=0.05)
+
+        threading.Timer(0.05, release.set).start()
+        found = log.find('token-1', timeout=5.0)
+    finally:
+        release.set()
+        placer.join()
+
+    order, created = placed[0]
+    assert created
+    assert found.id == order.id
+    assert 'token-1' not in log._inflight
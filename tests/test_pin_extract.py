@@ -0,0 +1,81 @@
+"""
+Pin extraction against a saved search page (tests/fixtures/pinterest):
+feeding the grid batch by batch finds exactly what parsing the whole page
+does, without the avatars, logos and ads around the pins.
+"""
+import os
+
+import pytest
+
+import pin_extract
+from pin_extract import IncrementalExtractor, extract_image_urls, pin_key, split_grid_items
+
+PAGE_PATH = os.path.join(os.path.dirname(__file__), 'fixtures', 'pinterest', 'search_page_1.html')
+PARSERS = sorted({'html.parser', pin_extract.DEFAULT_PARSER})
+
+
+@pytest.fixture(scope='module')
+def page_html():
+    with open(PAGE_PATH, encoding='utf-8') as file:
+        return file.read()
+
+
+def test_pin_key_ignores_size():
+    small = 'https://i.pinimg.com/236x/ab/cd/ef/abcdef0123456789abcdef0123456789.jpg'
+    large = 'https://i.pinimg.com/474x/ab/cd/ef/abcdef0123456789abcdef0123456789.jpg'
+    other = 'https://i.pinimg.com/236x/ab/cd/ef/abcdef0123456789abcdef012345678a.jpg'
+    assert pin_key(small) == pin_key(large) == 'ab/cd/ef/abcdef0123456789abcdef0123456789'
+    assert pin_key(other) != pin_key(small)
+
+
+@pytest.mark.parametrize('parser', PARSERS)
+def test_split_grid_items(page_html, parser):
+    fragments = split_grid_items(page_html, parser)
+    # 12 pins, one of them again at 474x, and a promoted item
+    assert len(fragments) == 14
+    assert all(fragment.startswith('<div data-grid-item="true"') for fragment in fragments)
+
+
+@pytest.mark.parametrize('parser', PARSERS)
+def test_only_pin_images_are_extracted(page_html, parser):
+    urls = extract_image_urls(page_html, parser)
+    assert len(urls) == 13
+    assert all(url.startswith('https://i.pinimg.com/236x/') or url.startswith('https://i.pinimg.com/474x/')
+               for url in urls)
+
+
+@pytest.mark.parametrize('parser', PARSERS)
+@pytest.mark.parametrize('batch_size', [1, 5, 100])
+def test_incremental_matches_full_page(page_html, parser, batch_size):
+    first_seen = {}
+    for url in extract_image_urls(page_html, parser):
+        first_seen.setdefault(pin_key(url), url)
+    expected = list(first_seen.values())
+
+    fragments = split_grid_items(page_html, parser)
+    extractor = IncrementalExtractor(parser)
+    found = []
+    for start in range(0, len(fragments), batch_size):
+        found.extend(extractor.feed(fragments[start:start + batch_size]))
+
+    assert found == expected
+    assert len(extractor) == 12
+    assert extractor.stats.scrolls == -(-len(fragments) // batch_size)
+    assert extractor.stats.pins == 12
+
+
+def test_refeeding_a_batch_finds_nothing_new(page_html):
+    fragments = split_grid_items(page_html)
+    extractor = IncrementalExtractor()
+    assert len(extractor.feed(fragments[:6])) == 6
+    assert extractor.feed(fragments[:6]) == []
+    assert extractor.stats.parse_ms_per_scroll >= 0.0
+
+
+def test_bench_runs_offline(page_html):
+    results = pin_extract.bench(page_html, batch_size=4, repeat=1)
+    assert set(results) == set(PARSERS)
+    for result in results.values():
+        assert result['grid_items'] == 14
+        assert result['scrolls'] == 4
+        assert result['pins'] == 12
@@ -0,0 +1,25 @@
+"""
+/api/products query-string validation: bad values get a 400 with a message
+meant for API clients, not Python's.
+"""
+import pytest
+
+
+@pytest.mark.parametrize('query, message', [
+    ('limit=abc', 'limit must be an integer'),
+    ('min_price=cheap', 'min_price must be a number'),
+    ('max_price=nan', 'max_price must be a finite number'),
+    ('min_price=-inf', 'min_price must be a finite number'),
+    ('min_discount=Infinity', 'min_discount must be a finite number'),
+])
+def test_bad_arguments_are_rejected(client, query, message):
+    response = client.get(f"/api/products?{query}")
+    assert response.status_code == 400
+    assert response.get_json() == {'success': False, 'message': message}
+
+
+def test_price_filter(client):
+    response = client.get('/api/products?min_price=1000&max_price=2000&limit=100')
+    assert response.status_code == 200
+    prices = [item['price'] for item in response.get_json()['items']]
+    assert prices and all(1000 <= price <= 2000 for price in prices)
@@ -0,0 +1,24 @@
+"""
+WSGI entry point for production servers:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Importing this module builds and warms the app once; with preload_app the
+master does it before forking, so every worker starts ready.
+
+gunicorn.conf.py starts several worker processes, so carts and the stock
+ledger default to the SQLite backends here: with the in-memory ones each
+worker would keep its own carts (a shopper's cart would come and go with
+the worker that answers) and sell the same units as the others.
+TN_CART_BACKEND=memory is only safe with a single worker (WEB_CONCURRENCY=1).
+"""
+import os
+
+from app import create_app
+
+app = create_app({
+    # The stock ledger follows CART_BACKEND unless INVENTORY_BACKEND is set
+    'CART_BACKEND': os.environ.get('TN_CART_BACKEND', 'sqlite'),
+    'CART_DB_PATH': os.environ.get('TN_CART_DB', 'carts.sqlite3'),
+    'INVENTORY_DB_PATH': os.environ.get('TN_INVENTORY_DB', 'inventory.sqlite3'),
+})